@@ -2,41 +2,70 @@
 import os
 
 import sys
+import time
 import signal
+import subprocess
 import pymysql
 import urllib3
-import requests
 import threading
-from datetime import datetime
 from dotenv import load_dotenv
-from flask import Flask, request
+from flask import Flask, Response, request, jsonify
 from utils.ssh_tunnel import get_ssh_tunnel  
 from utils.logging import logging, configure_logging
-from data_processing import process_weather_data, should_process_data, save_to_24h_json, save_to_1w_json, save_to_1m_json, save_to_1y_json, save_to_custom_json, save_to_xml, save_1y_compressed
-from utils.ftp import upload_to_ftp
-from database import save_to_db, import_sqlite_to_mysql, table_exists
+from observation import Observation
+from data_processing import STATE, FEEDS, feed_version, build_feed, save_to_24h_json, save_to_1w_json, save_to_1m_json, save_to_1y_json, save_to_custom_json, save_to_xml, save_1y_compressed
+from utils.ftp import FTP_SESSION, upload_to_ftp, upload_batch_to_ftp
+from utils.dispatcher import ObservationDispatcher
+from utils.scheduler import Scheduler
+from utils.forwarder import Forwarder, parse_endpoints
+from utils.feed_cache import FeedCache, parse_time, parse_fields
+from database import SQLITE_STORAGE, MySQLBatchWriter, save_to_db, ensure_mysql_schema, import_sqlite_to_mysql, sqlite_import_pending, table_exists
 from globals import *
 
 app = Flask(__name__)
 
 load_dotenv(os.path.join(os.path.dirname(os.path.realpath(__file__)), '.env'))
 
-# Set to True to import all historical data, ignoring the latest timestamp in MySQL. Use with caution!
-IMPORT_ALL = False
-
 # Configure logging
 configure_logging()
 
-# Ensures import_from_sqlite_if_table_missing() is completed before continuing —
-# even if a new /data/report/ API call is made while an import is still running
+# Serialises the SQLite import and the MySQL batch writer on the shared connection
 import_lock = threading.Lock()
 
 # Global MySQL connection for the app
 mysql_connection = None
 
+# Fans incoming observations out to the sinks registered below
+dispatcher = ObservationDispatcher(maxsize=DISPATCH_QUEUE_SIZE)
+
+# Forwards the original form to Home Assistant and FORWARD_URLS, one dispatcher sink per endpoint
+forwarder = Forwarder(
+    parse_endpoints(HASS_URL, FORWARD_URLS, retry_size=FORWARD_RETRY_SIZE),
+    timeout=FORWARD_TIMEOUT,
+    retry_interval=FORWARD_RETRY_INTERVAL
+)
+
+# Serialised feeds for /data/feed/, rebuilt when their window or file changes
+feed_cache = FeedCache(max_entries=FEED_CACHE_SIZE)
+
+# Runs the publish jobs on their own cadence, whether or not the station is sending
+scheduler = Scheduler(DATA_PATH + '/scheduler_state.json', jitter=SCHEDULER_JITTER)
+
+# Most recent observation, and per publish job the observation it last wrote
+latest_observation = None
+published = {}
+
 def signal_handler(sig, frame):
     """Handle termination signals and cleanup resources properly."""
     logging.info("Termination signal received. Cleaning up...")
+    dispatcher.drain()
+    scheduler.stop()
+    checkpoint_state()
+    forwarder.close()
+    mysql_writer.close()
+    DATA_STORE.close()
+    SQLITE_STORAGE.close()
+    FTP_SESSION.close()
     close_mysql_connection()
     sys.exit(0)
 
@@ -103,379 +132,259 @@ def close_mysql_connection():
         mysql_connection = None
         logging.info("MySQL connection closed.")
 
-def import_from_sqlite_if_table_missing():
-    """Check MySQL table and import from SQLite if table doesn't exist (over SSH tunnel)."""
-    try:
-        conn = get_mysql_connection()
-        if not table_exists(conn):
-            logging.info("MySQL table does not exist. Importing data from SQLite...")
-            import_sqlite_to_mysql(conn)
-
-    except Exception as e:
-        logging.error(f"Failed to check or import data: {e}")
-
-def reset_ids_in_order(conn):
-    """Resets the id column of the weather_archive table based on timestamp order."""
-    
-    table_name = "weather_archive"
-    temp_table_name = "temp_weather_archive"
-    cursor = conn.cursor()
+def import_from_sqlite_if_table_missing(conn):
+    """Import from SQLite if the MySQL table doesn't exist or a previous import was interrupted."""
+    if not table_exists(conn):
+        logging.info("MySQL table does not exist. Importing data from SQLite...")
+        import_sqlite_to_mysql(conn)
+    elif sqlite_import_pending():
+        logging.info("Previous SQLite import was interrupted. Resuming...")
+        import_sqlite_to_mysql(conn)
 
-    try:
-        conn.begin()
-
-        # Step 1: Create a temporary table with the same structure
-        create_temp_table_query = f"CREATE TABLE {temp_table_name} LIKE {table_name};"
-        cursor.execute(create_temp_table_query)
-
-        # Step 2: Insert data sorted by timestamp into the temporary table
-        insert_into_temp_table_query = f"""
-            INSERT INTO {temp_table_name} (timestamp, temp, temp_in, humidity, humidity_in,
-                pressure_abs, pressure_rel, rain_rate, rain_event,
-                rain_hourly, rain_daily, rain_weekly, rain_monthly, rain_yearly,
-                wind_degree, wind_gust, wind_gust_maxdaily, wind_speed,
-                solarradiation, uv)
-            SELECT timestamp, temp, temp_in, humidity, humidity_in,
-                pressure_abs, pressure_rel, rain_rate, rain_event,
-                rain_hourly, rain_daily, rain_weekly, rain_monthly, rain_yearly,
-                wind_degree, wind_gust, wind_gust_maxdaily, wind_speed,
-                solarradiation, uv
-            FROM {table_name}
-            ORDER BY timestamp ASC;
-        """
-        cursor.execute(insert_into_temp_table_query)
-
-        # Step 3: Truncate the original table
-        truncate_table_query = f"TRUNCATE TABLE {table_name};"
-        cursor.execute(truncate_table_query)
-
-        # Step 4: Copy data back from the temporary table
-        insert_from_temp_table_query = f"""
-            INSERT INTO {table_name} (timestamp, temp, temp_in, humidity, humidity_in,
-                pressure_abs, pressure_rel, rain_rate, rain_event,
-                rain_hourly, rain_daily, rain_weekly, rain_monthly, rain_yearly,
-                wind_degree, wind_gust, wind_gust_maxdaily, wind_speed,
-                solarradiation, uv)
-            SELECT timestamp, temp, temp_in, humidity, humidity_in,
-                pressure_abs, pressure_rel, rain_rate, rain_event,
-                rain_hourly, rain_daily, rain_weekly, rain_monthly, rain_yearly,
-                wind_degree, wind_gust, wind_gust_maxdaily, wind_speed,
-                solarradiation, uv
-            FROM {temp_table_name};
-        """
-        cursor.execute(insert_from_temp_table_query)
-
-        # Step 5: Drop the temporary table
-        drop_temp_table_query = f"DROP TABLE {temp_table_name};"
-        cursor.execute(drop_temp_table_query)
-
-        conn.commit()
-        logging.info("✅ ID reset completed successfully.")
-    except Exception as e:
-        logging.error(f"Failed to reset IDs: {e}")
-        conn.rollback()
-    finally:
-        cursor.close()
-
-def import_saved_data_to_mysql(data_root='data', datatype='raw', batch_size=50000, commit_every_batches=5, import_all=IMPORT_ALL):
-    """One-time import of historical data from local files into MySQL."""
-
-    logging.info("Starting one-time import of historical data to MySQL...")
-    
-    table_name = "weather_archive"
-
-    create_table_query = f"""
-        CREATE TABLE IF NOT EXISTS {table_name} (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            timestamp DATETIME NOT NULL UNIQUE,
-            temp FLOAT,
-            temp_in FLOAT,
-            humidity INT,
-            humidity_in INT, 
-            pressure_abs FLOAT,
-            pressure_rel FLOAT,
-            rain_rate FLOAT,
-            rain_event FLOAT,
-            rain_hourly FLOAT,
-            rain_daily FLOAT,
-            rain_weekly FLOAT,
-            rain_monthly FLOAT,
-            rain_yearly FLOAT,
-            wind_degree FLOAT,
-            wind_gust FLOAT,
-            wind_gust_maxdaily FLOAT,
-            wind_speed FLOAT,
-            solarradiation FLOAT,
-            uv INT
-        );
+def setup_mysql():
     """
-
-    insert_query = f"""
-        INSERT IGNORE INTO {table_name} (
-            timestamp, temp, temp_in, humidity, humidity_in,
-            pressure_abs, pressure_rel, rain_rate, rain_event,
-            rain_hourly, rain_daily, rain_weekly, rain_monthly, rain_yearly,
-            wind_degree, wind_gust, wind_gust_maxdaily, wind_speed,
-            solarradiation, uv
-        )
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
+    Runs on its own thread at startup, so requests are served while it works: connect
+    (over the SSH tunnel), migrate the table to the unique timestamp schema if it predates
+    it, import from SQLite if needed, then start the batch writer.
+    Observations wait in the writer's outbox until then; an unreachable MySQL is retried
+    every MYSQL_RETRY_INTERVAL seconds.
     """
-
-    ssh = get_ssh_tunnel()
-
-    conn = pymysql.connect(
-        host='127.0.0.1',
-        user=MYSQL_CONFIG['user'],
-        password=MYSQL_CONFIG['password'],
-        db=MYSQL_CONFIG['database'],
-        port=ssh.local_bind_port,
-        autocommit=False  # We will commit manually in batches
-    )
-
-    cursor = conn.cursor()
-    logging.info("Trying to create MySQL table if not exists...")
-    cursor.execute(create_table_query)
-    latest_imported_ts = None
-    if not import_all:
-        cursor.execute(f"SELECT MAX(timestamp) FROM {table_name}")
-        latest_imported_ts = cursor.fetchone()[0]
-        if latest_imported_ts:
-            logging.info(f"ℹ️ Resuming import from latest MySQL timestamp: {latest_imported_ts}")
-    else:
-        logging.info("ℹ️ Full import requested: ignoring latest imported timestamp.")
-
-    base_path = os.path.join(data_root, datatype)
-    total_files = 0
-    row_count = 0
-    skipped = 0
-    errors = 0
-    skipped_files = 0
-    batch = []
-    BATCH_SIZE = batch_size
-    pending_batches = 0
-
-    for year in sorted(os.listdir(base_path)):
-        year_path = os.path.join(base_path, year)
-        if not os.path.isdir(year_path):
-            continue
-
-        for month in sorted(os.listdir(year_path)):
-            month_path = os.path.join(year_path, month)
-            if not os.path.isdir(month_path):
-                continue
-
-            for fname in sorted(os.listdir(month_path)):
-                if not fname.endswith('.txt'):
-                    continue
-
-                if latest_imported_ts:
-                    try:
-                        file_day = datetime.strptime(fname[:-4], "%Y-%m-%d").date()
-                        if file_day < latest_imported_ts.date():
-                            skipped_files += 1
-                            continue
-                    except Exception:
-                        pass
-
-                total_files += 1
-                file_path = os.path.join(month_path, fname)
-                logging.info(f"📂 Importing file: {file_path}")
-
-                with open(file_path, 'r') as file:
-                    for line in file:
-                        line = line.strip()
-                        if not line or line.startswith('#'):
-                            continue
-
-                        parts = line.split(',')
-                        if len(parts) not in [12, 14]:
-                            skipped += 1
-                            continue
-
-                        # Parse timestamp once
-                        try:
-                            timestamp = datetime.strptime(parts[0], "%Y-%m-%d %H:%M:%S")
-                        except Exception as e:
-                            logging.info(f"⚠️ Invalid timestamp on line: {line} → {e}")
-                            errors += 1
-                            continue
-
-                        if latest_imported_ts and timestamp <= latest_imported_ts:
-                            continue
-
-                        while len(parts) < 14:
-                            parts.append(None)
-
-                        try:
-                            temp = float(parts[5]) if parts[5] else None
-                            temp_in = float(parts[3]) if parts[3] else None
-                            humidity = int(float(parts[4])) if parts[4] else None
-                            humidity_in = int(float(parts[2])) if parts[2] else None
-                            pressure_abs = float(parts[6]) if parts[6] else None
-                            pressure_rel = None
-                            rain_rate = float(parts[10]) if parts[10] else 0.0
-                            rain_event = 0.0
-                            rain_hourly = 0.0
-                            rain_daily = 0.0
-                            rain_weekly = 0.0
-                            rain_monthly = 0.0
-                            rain_yearly = 0.0
-                            wind_degree = float(parts[9]) if parts[9] else None
-                            wind_gust = float(parts[8]) if parts[8] else None
-                            wind_gust_maxdaily = 0.0
-                            wind_speed = float(parts[7]) if parts[7] else None
-                            solarradiation = float(parts[12]) if parts[12] else None
-                            uv = int(float(parts[13])) if parts[13] else None
-
-                            data = (
-                                timestamp, temp, temp_in, humidity, humidity_in,
-                                pressure_abs, pressure_rel, rain_rate, rain_event,
-                                rain_hourly, rain_daily, rain_weekly, rain_monthly, rain_yearly,
-                                wind_degree, wind_gust, wind_gust_maxdaily, wind_speed,
-                                solarradiation, uv
-                            )
-
-                            batch.append(data)
-
-                            if len(batch) >= BATCH_SIZE:
-                                cursor.executemany(insert_query, batch)
-                                pending_batches += 1
-                                if pending_batches >= commit_every_batches:
-                                    conn.commit()
-                                    pending_batches = 0
-                                row_count += len(batch)
-                                batch.clear()
-
-                        except Exception as e:
-                            logging.info(f"❌ Error parsing line: {line} → {e}")
-                            errors += 1
-
-    # Insert any remaining records
-    if batch:
-        cursor.executemany(insert_query, batch)
-        pending_batches += 1
-        row_count += len(batch)
-        batch.clear()
-
-    if pending_batches:
-        conn.commit()
-
-    # Reset IDs after import
-    reset_ids_in_order(conn)
-
-    cursor.close()
-    conn.close()
-
-    logging.info(f"✅ Import done. Files: {total_files}, Rows: {row_count}, Skipped: {skipped}, Skipped files: {skipped_files}, Errors: {errors}")
-
-@app.before_first_request
-def setup():
-    """Setup for the Flask app before the first request."""
-    get_mysql_connection()  
-
-    logging.info("Initial import from SQLite to MySQL...")
-
-    # Import from SQLite to MySQL if the table is missing
-    import_from_sqlite_if_table_missing()
+    while True:
+        try:
+            with import_lock:
+                conn = get_mysql_connection()
+                # Before anything writes to it: without the unique timestamp, replays and resumed imports duplicate rows
+                ensure_mysql_schema(conn)
+                logging.info("Initial import from SQLite to MySQL...")
+                import_from_sqlite_if_table_missing(conn)
+            break
+        except Exception as e:
+            logging.error(f"Failed to check or import data, retrying in {MYSQL_RETRY_INTERVAL} s: {e}")
+            time.sleep(MYSQL_RETRY_INTERVAL)
+    mysql_writer.start()
 
 @app.teardown_appcontext
 def cleanup(exception):
     """Keep this function for any per-request cleanup that doesn't include closing the MySQL connection."""
     logging.info("ℹ️ MySQL connection stays open!")
 
+def forward_to(name):
+    """Sink handler that forwards the original POST data to one endpoint."""
+    def forward(observation):
+        forwarder.send(name, observation.source)
+    return forward
+
+def save_sqlite(observation):
+    """Save the observation to the SQLite database."""
+    save_to_db(observation.to_db(), 'sqlite')
+
+def save_mysql(observation):
+    """Queue the observation for the next group-committed MySQL batch."""
+    mysql_writer.add(observation.to_db())
+
+def save_raw(observation):
+    """Save the observation to the local raw file store."""
+    DATA_STORE.save_data(observation.to_raw(), datatype='raw')
+
+def set_latest(observation):
+    """Remember the observation for the scheduled publish jobs."""
+    global latest_observation
+    latest_observation = observation
+
+def new_observation(job):
+    """The latest observation if the job hasn't published it yet, otherwise None."""
+    observation = latest_observation
+    if observation is None or published.get(job) is observation:
+        return None
+    return observation
+
+def mark_published(job, observation):
+    """Record that a job run succeeded. A failed run leaves its observation to be published by the next one."""
+    if observation is not None:
+        published[job] = observation
+
+def publish_live():
+    """Rewrite and upload live.xml."""
+    observation = new_observation("60sec")
+    if observation is None:
+        return
+    save_to_xml(observation.to_xml())
+    upload_to_ftp(DATA_PATH + "/live.xml", FTP_PATH + '/live.xml')
+    mark_published("60sec", observation)
+
+# The window jobs run whether or not there's a new observation: expired records are dropped and
+# the files uploaded even while the station is quiet. Re-adding an observation after a failed
+# run replaces it in the windows, and unchanged files are skipped by the upload.
+
+def publish_24h():
+    """Append to the 24h window and custom.json (or only expire old data) and upload both."""
+    observation = new_observation("5min")
+    save_to_24h_json(observation)
+    if observation is not None:
+        save_to_custom_json(observation.to_custom(), observation.timestamp)
+    else:
+        save_to_custom_json(None, None)
+
+    upload_batch_to_ftp([
+        (DATA_PATH + "/24h.json", FTP_PATH + '/24h.json'),
+        (DATA_PATH + "/custom.json", FTP_PATH + '/custom.json'),
+    ])
+    mark_published("5min", observation)
+
+def publish_1w():
+    """Append to the 1w window (or only expire old records) and upload it."""
+    observation = new_observation("25min")
+    save_to_1w_json(observation)
+    upload_to_ftp(DATA_PATH + "/1w.json", FTP_PATH + '/1w.json')
+    mark_published("25min", observation)
+
+def publish_1m_1y():
+    """Append to the 1m and 1y windows (or only expire old records) and upload both."""
+    observation = new_observation("50min")
+    save_to_1m_json(observation)
+    save_to_1y_json(observation)
+    upload_batch_to_ftp([
+        (DATA_PATH + "/1y.json", FTP_PATH + '/1y.json'),
+        (DATA_PATH + "/1m.json", FTP_PATH + '/1m.json'),
+    ])
+    mark_published("50min", observation)
+
+def checkpoint_state():
+    """Write the in-memory windows, aggregates and latest observation to the state snapshot."""
+    try:
+        STATE.checkpoint(latest_observation)
+    except Exception as e:
+        logging.error("State checkpoint failed: {}".format(e), exc_info=True)
+
+def publish_archive():
+    """Write 1y-compressed.json and a database snapshot and upload both."""
+    save_1y_compressed()
+    # Upload a consistent copy, the live database keeps recent writes in its WAL file
+    SQLITE_STORAGE.snapshot(DATA_PATH + '/weather_data.snapshot.db')
+    upload_batch_to_ftp([
+        (DATA_PATH + "/1y-compressed.json", FTP_PATH + '/1y-compressed.json'),
+        (DATA_PATH + '/weather_data.snapshot.db', FTP_PATH + '/weather_data.db'),
+    ])
+
+# Create the SQLite schema once, before the first observation arrives
+SQLITE_STORAGE.open()
+
+# Load the windows, custom.json and aggregates once, from the last checkpoint where it's still current.
+# The restored observation was already published before the restart, so the jobs only pick up new ones.
+latest_observation = STATE.restore()
+if latest_observation is not None:
+    published.update(dict.fromkeys(("60sec", "5min", "25min", "50min"), latest_observation))
+
+# Writes live observations to MySQL in batches, the import_lock keeps it behind a running import
+mysql_writer = MySQLBatchWriter(
+    get_mysql_connection,
+    DATA_PATH + '/mysql_outbox.db',
+    batch_size=MYSQL_BATCH_SIZE,
+    max_delay=MYSQL_BATCH_DELAY,
+    retry_interval=MYSQL_RETRY_INTERVAL,
+    lock=import_lock
+)
+threading.Thread(target=setup_mysql, name="mysql-setup", daemon=True).start()
+
+# Each sink drains its own queue on its own worker thread; sinks run in parallel and
+# don't wait for each other, so there's no ordering between sinks for an observation
+for name in forwarder.endpoints:
+    dispatcher.register(name, forward_to(name))
+dispatcher.register('sqlite', save_sqlite)
+dispatcher.register('mysql', save_mysql)
+dispatcher.register('raw', save_raw)
+dispatcher.register('publish', set_latest)
+dispatcher.start()
+forwarder.start()
+
+scheduler.add("60sec", publish_live, 60)
+scheduler.add("5min", publish_24h, 5 * 60)
+scheduler.add("25min", publish_1w, 25 * 60)
+scheduler.add("50min", publish_1m_1y, 50 * 60)
+scheduler.add("6hour", publish_archive, 6 * 3600)
+scheduler.add("state", checkpoint_state, STATE_CHECKPOINT_INTERVAL)
+scheduler.start()
+
 @app.route('/data/report/', methods=['POST'])
 def receive_ecowitt():
-    """Receive and process weather data."""
+    """Receive, validate and normalise weather data, then hand it to the dispatcher."""
 
-    # Lock entire operation: ensures only one request at a time processes incoming data,
-    # including the import from SQLite to MySQL
-    with import_lock:
+    # logging.info the complete POST data for logging
+    logging.info("POST received from: {}".format(request.remote_addr))
 
-        # logging.info the complete POST data for logging
-        logging.info("POST received from: {}".format(request.remote_addr))
+    # Prepare the data structure
+    weather_data = request.form.to_dict()
+    if "dateutc" not in weather_data:
+        logging.warning("POST without dateutc ignored.")
+        return 'Missing dateutc', 400
 
-        # Prepare the data structure
-        weather_data = request.form.to_dict()
-        raw_data_to_store, raw_data_to_custom, xml_data_to_store, db_data_to_store, formatted_data = process_weather_data(weather_data)
+    try:
+        observation = Observation.from_ecowitt(weather_data)
+    except (KeyError, ValueError, TypeError) as e:
+        logging.error("Invalid weather data received: {}".format(e))
+        return 'Invalid weather data', 400
 
-        # Example extracting the timestamp directly from the incoming data payload
-        timestamp_str = weather_data.get("dateutc", None)
+    # Every sink gets the same Observation and projects the layout it needs
+    dispatcher.dispatch(observation)
 
-        # Forward the POST request to the other server
-        url = HASS_URL
-        try:
-            response = requests.post(url, data=weather_data, verify=False)
-            if response.status_code == 200:
-                logging.info("POST forwarded successfully to Home Assistant")
-            else:
-                logging.info("Failed to forward the POST request to Home Assistant")
-        except Exception as e:
-            logging.error("Error while forwarding POST request: {}".format(str(e)))
-
-        # Save to SQLite database
-        save_to_db(db_data_to_store, 'sqlite')
-
-        # Save to MySQL database using the persistent connection with automatic reconnect retry
-        @with_mysql_connection
-        def save_mysql(conn, data):
-            save_to_db(data, 'mysql', conn)
-
-        save_mysql(db_data_to_store)
-
-        # Save to local storage
-        DATA_STORE.save_data(raw_data_to_store, datatype='raw')
-
-        if should_process_data("60sec", 1):
-            logging.info("60-sec condition met. Preparing to save data...")
-            save_to_xml(xml_data_to_store)
-            upload_to_ftp(DATA_PATH + "/live.xml", FTP_PATH + '/live.xml')
-        
-        if should_process_data("5min", 5):
-            logging.info("5-minute condition met. Preparing to process and upload data...")
-            save_to_24h_json(formatted_data)  
-            save_to_custom_json({
-                "temperature": raw_data_to_custom["temperature"],
-                "pressure": raw_data_to_custom["pressure"],
-                "rain": raw_data_to_custom["rain"],
-                "wind_gust": raw_data_to_custom["wind_gust"],
-                "wind_degree": raw_data_to_custom["wind_degree"],
-                "solarradiation": raw_data_to_custom["solarradiation"],
-            }, timestamp_str)  
-
-            upload_to_ftp(DATA_PATH + "/24h.json", FTP_PATH + '/24h.json')
-            upload_to_ftp(DATA_PATH + "/custom.json", FTP_PATH + '/custom.json')
-
-        if should_process_data("25min", 25):
-            logging.info("25-minute condition met. Preparing to process and upload data...")
-            save_to_1w_json(formatted_data)  
-            upload_to_ftp(DATA_PATH + "/1w.json", FTP_PATH + '/1w.json')
-
-        if should_process_data("50min", 50):
-            logging.info("50-minute condition met. Preparing to process and upload data...")
-            save_to_1m_json(formatted_data)
-            save_to_1y_json(formatted_data)    
-            upload_to_ftp(DATA_PATH + "/1y.json", FTP_PATH + '/1y.json')
-            upload_to_ftp(DATA_PATH + "/1m.json", FTP_PATH + '/1m.json')
-
-        if should_process_data("6hour", 360):
-            logging.info("6-hour condition met. Preparing to process and upload data...")
-            save_1y_compressed()
-            upload_to_ftp(DATA_PATH + "/1y-compressed.json", FTP_PATH + '/1y-compressed.json')
-            upload_to_ftp(DATA_PATH + '/weather_data.db', FTP_PATH + '/weather_data.db')
-
-        logging.info("POST processing done!")
+    logging.info("POST queued for processing!")
 
     return '', 200
 
+@app.route('/data/feed/<name>', methods=['GET'])
+def feed(name):
+    """Serve a rolling window, custom.json or live.xml from memory, optionally limited by ?from=&to=&fields=."""
+    if name not in FEEDS:
+        return 'Unknown feed', 404
+    try:
+        start = parse_time(request.args.get('from'), TIMEZONE)
+        end = parse_time(request.args.get('to'), TIMEZONE)
+    except ValueError:
+        return 'Invalid from/to', 400
+    fields = parse_fields(request.args.get('fields'))
+
+    try:
+        cached = feed_cache.get((name, start, end, fields), feed_version(name), lambda: build_feed(name, start, end, fields))
+    except FileNotFoundError:
+        return 'Feed not available yet', 404
+
+    # The gzip variant gets its own ETag, either one still matches the same content
+    headers = {"Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    gzipped = 'gzip' in request.accept_encodings
+    etag = cached.etag + '-gzip' if gzipped else cached.etag
+    if cached.etag in request.if_none_match or cached.etag + '-gzip' in request.if_none_match:
+        response = Response(status=304, headers=headers)
+    elif gzipped:
+        headers["Content-Encoding"] = "gzip"
+        response = Response(cached.gzipped(), mimetype=cached.mimetype, headers=headers)
+    else:
+        response = Response(cached.body, mimetype=cached.mimetype, headers=headers)
+    response.set_etag(etag)
+    return response
+
+@app.route('/data/status/', methods=['GET'])
+def status():
+    """Expose queue depth, drops and latency per sink, publish job timings, forwarding and FTP upload statistics."""
+    return jsonify({"sinks": dispatcher.stats(), "jobs": scheduler.stats(), "forward": forwarder.stats(), "feeds": feed_cache.stats(), "state": STATE.stats(), "ftp": FTP_SESSION.get_stats(), "mysql": mysql_writer.get_stats()})
+
 if __name__ == "__main__":
     logging.info("Script is running...")
 
-    # To run a one-time import from historical files to MySQL, uncomment:
-    import_saved_data_to_mysql()
+    # One-time import from historical files to MySQL, comment out to skip. It runs as its own
+    # process: spawned parser workers would re-run this module, forked ones inherit its threads
+    subprocess.run([sys.executable, os.path.join(BASE_DIR, "importer.py")])
     
     try:
         app.run(debug=True, host="0.0.0.0", port=8090, use_reloader=False)
     except Exception as e:
         logging.error(f"An error occurred: {e}")
     finally:
+        dispatcher.drain()
+        scheduler.stop()
+        checkpoint_state()
+        forwarder.close()
+        mysql_writer.close()
+        DATA_STORE.close()
+        SQLITE_STORAGE.close()
+        FTP_SESSION.close()
         close_mysql_connection()
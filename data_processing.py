@@ -1,243 +1,113 @@
-import json
+import os
 import math
 import time
 import logging
 import xml.etree.ElementTree as ET
 from datetime import datetime, timedelta
-from utils.conversions import degrees_to_wind_direction, f_to_c, feels_like, get_dew_point_c, inHg_to_hPa, inches_to_mm, mph_to_kph, wind_chill
+from observation import Observation
+from utils.rolling_window import RollingWindow
+from utils.downsampler import Downsampler
+from utils.serializer import Serializer
+from utils.atomic import atomic_open, atomic_write
+from utils.custom_feed import CustomFeed
+from utils.state import StateManager
+from database import SQLITE_STORAGE
 from globals import *
 
+# In-memory rolling windows, each backed by its JSON file
+WINDOWS = {
+    "24h": RollingWindow(DATA_PATH + "/24h.json", timedelta(hours=24), SERIALIZER),
+    "1w": RollingWindow(DATA_PATH + "/1w.json", timedelta(days=7), SERIALIZER),
+    "1m": RollingWindow(DATA_PATH + "/1m.json", timedelta(days=30), SERIALIZER),  # Rough approximation of one month
+    "1y": RollingWindow(DATA_PATH + "/1y.json", timedelta(days=365), SERIALIZER),  # Rough approximation of one year
+}
+
+# custom.json metrics, in output order: (id, name, unit)
+CUSTOM_METRICS = (
+    ("temperature", "Temperatuur", "°C"),
+    ("pressure", "Luchtdruk", " hPa"),
+    ("rain", "Neerslag", " mm"),
+    ("wind_gust", "Windvlaag", " km/h"),
+    ("wind_degree", "Windrichting", "°"),
+    ("solarradiation", "Zonnestraling", " W/m²"),
+)
+
+# In-memory custom.json series, seeded from the file on first use
+CUSTOM = CustomFeed(DATA_PATH + "/custom.json", CUSTOM_METRICS, timedelta(hours=24))
+
+# Publish interval (minutes) of every window and of custom.json, for rebuilding them from SQLite
+REBUILD_INTERVALS = {"24h": 5, "1w": 25, "1m": 50, "1y": 50, "custom": 5}
+
+# The /data/feed/ responses are always compact, whatever FEED_JSON_INDENT the files use
+FEED_SERIALIZER = Serializer(FEED_JSON_ENCODER)
+
+# Running 1h/6h/1d aggregates of the 1y window, seeded from 1y.json on first use
+DOWNSAMPLER = Downsampler(WINDOWS["1y"].span)
+
+def window_record(data):
+    ''' Rolling window record for an Observation, a WindowRecord or a {timestamp_str: values} dict. '''
+    return data.to_record() if isinstance(data, Observation) else data
+
+def save_to_window(name, data):
+    '''
+    Append the provided data to a rolling window and write its file, dropping records older
+    than the window. With data None only the expired records are dropped, so the window keeps
+    moving while the station is quiet. Returns the number of records added.
+    '''
+    current_time = datetime.now(TIMEZONE).replace(tzinfo=None)
+
+    window = WINDOWS[name]
+    if data is None:
+        window.evict(current_time)
+        added = 0
+    else:
+        added = window.append(window_record(data), current_time)
+    if window.save():
+        logging.info("Data successfully saved to {}.json".format(name))
+    return added
+
 def save_to_24h_json(data):
     ''' Save the provided data to the 24h.json file, ensuring only the last 24 hours of data is retained. '''
-
-    current_time = datetime.now(TIMEZONE)
-
-    # Read the existing data
-    try:
-        with open(DATA_PATH + "/24h.json", 'r') as f:
-            file_data = json.load(f)
-            existing_data = file_data["data"]
-    except Exception:
-        existing_data = []
-
-    # Filter records to keep only those from the last 24 hours
-    twenty_four_hours_ago = current_time - timedelta(hours=24)
-    new_data = []
-    for record in existing_data:
-        for timestamp_str, _ in record.items():
-            timestamp = datetime.strptime(timestamp_str, "%m/%d/%Y %H:%M").replace(tzinfo=TIMEZONE)
-            if timestamp > twenty_four_hours_ago:
-                new_data.append(record)
-
-    # Add the new data
-    formatted_datetime = current_time.strftime('%m/%d/%Y %H:%M')
-    new_data.append(data)
-
-    # Save the updated data back to the file
-    with open(DATA_PATH + "/24h.json", 'w') as f:
-        json.dump({"data": new_data}, f, indent=4)
-        logging.info("Data successfully saved to 24h.json")
+    save_to_window("24h", data)
 
 def save_to_1w_json(data):
     ''' Save the provided data to the 1w.json file, appending with max 1 week of data. '''
-
-    current_time = datetime.now(TIMEZONE)
-
-    # Read the existing data
-    try:
-        with open(DATA_PATH + "/1w.json", 'r') as f:
-            file_data = json.load(f)
-            existing_data = file_data["data"]
-    except Exception:
-        existing_data = []
-
-    # Filter records older than 1 week
-    one_week_ago = current_time - timedelta(days=7)
-    new_data = []
-    for record in existing_data:
-        for timestamp_str, _ in record.items():
-            timestamp = datetime.strptime(timestamp_str, "%m/%d/%Y %H:%M").replace(tzinfo=TIMEZONE)
-            if timestamp > one_week_ago:
-                new_data.append(record)
-    
-    # Add the new data
-    formatted_datetime = current_time.strftime('%m/%d/%Y %H:%M')
-    new_data.append(data)
-    
-    # Save the updated data back to the file
-    with open(DATA_PATH + "/1w.json", 'w') as f:
-        json.dump({"data": new_data}, f, indent=4)
-        logging.info("Data successfully saved to 1w.json")
+    save_to_window("1w", data)
 
 def save_to_1m_json(data):
     ''' Save the provided data to the 1m.json file, appending with max 1 month of data. '''
-
-    current_time = datetime.now(TIMEZONE)
-       
-    # Attempt to read the existing data
-    try:
-        with open(DATA_PATH + "/1m.json", 'r') as f:
-            file_data = json.load(f)
-            existing_data = file_data.get("data", [])
-    except Exception:
-        existing_data = []
-
-    # Filtering function to remove records older than 1 month
-    one_month_ago = current_time - timedelta(days=30)  # Rough approximation of one month
-
-    new_data = []
-    for record in existing_data:
-        for timestamp_str, _ in record.items():
-            timestamp = datetime.strptime(timestamp_str, "%m/%d/%Y %H:%M").replace(tzinfo=TIMEZONE)
-            if timestamp > one_month_ago:
-                new_data.append(record)
-
-    # Add the new data
-    formatted_datetime = current_time.strftime('%m/%d/%Y %H:%M')
-    new_data.append(data)
-    
-    # Save the updated data back to the file
-    with open(DATA_PATH + "/1m.json", 'w') as f:
-        json.dump({"data": new_data}, f, indent=4)
-        logging.info("Data successfully saved to 1m.json")
+    save_to_window("1m", data)
 
 def save_to_1y_json(data):
-    ''' Save the provided data to the 1y.json file, appending with max 1 month of data. '''
-
-    current_time = datetime.now(TIMEZONE)
-       
-    # Attempt to read the existing data
-    try:
-        with open(DATA_PATH + "/1y.json", 'r') as f:
-            file_data = json.load(f)
-            existing_data = file_data.get("data", [])
-    except Exception:
-        existing_data = []
-
-    # Filtering function to remove records older than 1 year
-    one_year_ago = current_time - timedelta(days=365)  # Rough approximation of one year
-
-    new_data = []
-    for record in existing_data:
-        for timestamp_str, _ in record.items():
-            timestamp = datetime.strptime(timestamp_str, "%m/%d/%Y %H:%M").replace(tzinfo=TIMEZONE)
-            if timestamp > one_year_ago:
-                new_data.append(record)
-
-    # Add the new data
-    formatted_datetime = current_time.strftime('%m/%d/%Y %H:%M')
-    new_data.append(data)
-    
-    # Save the updated data back to the file
-    with open(DATA_PATH + "/1y.json", 'w') as f:
-        json.dump({"data": new_data}, f, indent=4)
-        logging.info("Data successfully saved to 1y.json")
+    ''' Save the provided data to the 1y.json file, appending with max 1 year of data. '''
+    DOWNSAMPLER.seed(WINDOWS["1y"])
+    # Held across both updates, so a state checkpoint never sees one without the other
+    with WINDOWS["1y"].lock:
+        if save_to_window("1y", data):
+            # Not when the record replaced the same observation, it was aggregated already
+            DOWNSAMPLER.add(window_record(data), datetime.now(TIMEZONE).replace(tzinfo=None))
 
 def save_to_custom_json(weather_data, timestamp_str):
+    ''' Add the provided values to custom.json, keeping the last 24 hours of data. With weather_data None only expired points are dropped. '''
     current_time = datetime.now(TIMEZONE)
 
-    # Initialize final data structure
-    final_data = {
-        "temperature": {
-            "id": "temperature",
-            "name": "Temperatuur",
-            "data": [],
-            "index": 0,
-            "unit": "°C"
-        },
-        "pressure": {
-            "id": "pressure",
-            "name": "Luchtdruk",
-            "data": [],
-            "index": 1,
-            "unit": " hPa"
-        },
-        "rain": {
-            "id": "rain",
-            "name": "Neerslag",
-            "data": [],
-            "index": 2,
-            "unit": " mm"
-        },
-        "wind_gust": {
-            "id": "wind_gust",
-            "name": "Windvlaag",
-            "data": [],
-            "index": 3,
-            "unit": " km/h"
-        },
-        "wind_degree": {
-            "id": "wind_degree",
-            "name": "Windrichting",
-            "data": [],
-            "index": 4,
-            "unit": "°"
-        },
-        "solarradiation": {
-            "id": "solarradiation",
-            "name": "Zonnestraling",
-            "data": [],
-            "index": 5,
-            "unit": " W/m²"
-        }
-    }
-
-    # Load existing data from JSON file
     try:
-        with open(DATA_PATH + "/custom.json", 'r') as f:
-            existing_data = json.load(f)
-    except FileNotFoundError:
-        existing_data = list(final_data.values())
-    except json.JSONDecodeError as e:
-        logging.error("JSON decoding error while loading existing data: {}".format(e))
-        existing_data = list(final_data.values())  # Reset to initial structure
-    except Exception as e:
-        logging.error("An error occurred while reading JSON: {}".format(e))
-        existing_data = list(final_data.values())  # Reset to initial structure
-
-    # Calculate cutoff time for 24 hours ago
-    cutoff_time = current_time - timedelta(hours=24)
-
-    # Process existing data
-    for metric in existing_data:
-        if "id" in metric and "data" in metric:
-            for timestamp_ms, value in metric["data"]:
-                timestamp = datetime.fromtimestamp(timestamp_ms / 1000, TIMEZONE)
-                if timestamp >= cutoff_time:
-                    populate_final_data(final_data, timestamp_ms, {metric["id"]: value})
-
-    # Handle new data
-    try:
-        timestamp = datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S").replace(tzinfo=TIMEZONE)
-        if timestamp >= cutoff_time:
-            timestamp_ms = int(timestamp.timestamp() * 1000)
-            populate_final_data(final_data, timestamp_ms, weather_data)
+        if weather_data is None:
+            CUSTOM.evict(current_time)
+        else:
+            timestamp = datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S").replace(tzinfo=TIMEZONE)
+            CUSTOM.add(int(timestamp.timestamp() * 1000), weather_data, current_time)
     except ValueError:
         logging.error("Invalid timestamp format in new record: {}".format(timestamp_str))
-
-    result_data = sorted(list(final_data.values()), key=lambda x: x['index'])
+        CUSTOM.evict(current_time)
 
     # Write back to the JSON file
     try:
-        with open(DATA_PATH + "/custom.json", 'w') as f:
-            json.dump(result_data, f, indent=4, ensure_ascii=False)
-        logging.info("Data successfully saved to custom.json")
+        if CUSTOM.save(SERIALIZER):
+            logging.info("Data successfully saved to custom.json")
     except Exception as e:
         logging.error("An error occurred while writing to JSON: {}".format(e))
 
-
-def populate_final_data(final_data, timestamp_ms, measurements):
-    """Helper function to populate final_data with timestamped measurements."""
-    for key, value in measurements.items():
-        if key in final_data:
-            try:
-                value = float(value)  # Convert string to float for measurements
-                final_data[key]["data"].append([timestamp_ms, value])
-            except ValueError:
-                logging.error("Invalid value for {}: {}; unable to convert to float.".format(key, value))
-            except Exception as e:
-                logging.error("Unexpected error when processing {}: {}; error: {}".format(key, value, str(e)))
-
 def save_to_xml(data):
     '''Save the provided data to an XML file.'''
     root = ET.Element("meteo")
@@ -252,277 +122,118 @@ def save_to_xml(data):
         element.text = str(value)
 
     tree = ET.ElementTree(root)
-    tree.write(DATA_PATH + "/live.xml", encoding='utf-8', xml_declaration=True)
+    # Rewritten every minute, a write lost in a power cut isn't worth an fsync on the SD card
+    with atomic_open(DATA_PATH + "/live.xml", 'wb', fsync=False) as f:
+        tree.write(f, encoding='utf-8', xml_declaration=True)
     logging.info("Data successfully saved to live.xml")
 
-def should_process_data(interval_key, minutes):
-    global LAST_SAVE_TIMES
-    current_time = datetime.now(TIMEZONE)
-    if current_time - LAST_SAVE_TIMES[interval_key] >= timedelta(minutes=minutes):
-        LAST_SAVE_TIMES[interval_key] = current_time 
-        return True
-    return False
-
 def process_weather_data(weather_data):
     """Process and normalize weather data."""
-    formatted_datetime = datetime.now(TIMEZONE).strftime('%m/%d/%Y %H:%M')
-    formatted_data = {formatted_datetime: {}}
-    
-    fields = [
-        ('baromabsin', 'AbsPressure'),
-        ('dewpoint', 'DewPoint'),
-        ('rainratein', 'Rain'),
-        ('feelsLike', 'FeelsLike'),
-        ('humidityin', 'HumidityIn'),
-        ('humidity', 'HumidityOut'),
-        ('solarradiation', 'SolarRadiation'),
-        ('tempinf', 'TempIn'),
-        ('tempf', 'TempOut'),
-        ('winddir', 'WindDirection'),
-        ('windchillf', 'WindChill'),
-        ('windgustmph', 'WindGust'),
-        ('windspeedmph', 'WindAvg'),
-    ]
-
-    for field, json_key in fields:
-        formatted_data[formatted_datetime][json_key] = None
-
-    db_data_to_store = {
-        'timestamp': weather_data["dateutc"],
-        'temp': None,
-        'temp_in': None,
-        'humidity': None,
-        'humidity_in': None,
-        'pressure_abs': None,
-        'pressure_rel': None,
-        'rain_rate': None,
-        'rain_event': None,
-        'rain_hourly': None,
-        'rain_daily': None,
-        'rain_weekly': None,
-        'rain_monthly': None,
-        'rain_yearly': None,
-        'wind_degree': None,
-        'wind_gust': None,
-        'wind_gust_maxdaily': None,
-        'wind_speed': None,
-        'solarradiation': None,
-        'uv': None
-    }
-
-    raw_data_to_custom = {
-        'temperature': None,
-        'pressure': None,
-        'rain': None,
-        'wind_gust': None,
-        'wind_degree': None,
-        'solarradiation': None,
-    }
-
-    xml_data_to_store = {
-        "hum_in": None,
-        "temp_in": None,
-        "hum_out": None,
-        "temp_out": None,
-        "abs_pressure": None,
-        "wind_ave": None,
-        "wind_gust":None,
-        "wind_dir": None,
-        "rain": None,
-    }
-
-    raw_data_to_store = {
-        "idx": datetime.strptime(weather_data["dateutc"], "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%dT%H:%M:%S.%f"),
-        "delay": int(weather_data["interval"]) // 60,
-        "hum_in": None,
-        "temp_in": None,
-        "hum_out": None,
-        "temp_out": None,
-        "abs_pressure": None,
-        "wind_ave": None,
-        "wind_gust":None,
-        "wind_dir": None,
-        "rain": None,
-        "status": 0,
-        "illuminance": None,
-        "uv": None
-    }
-    
-    for field, json_key in fields:
-        if field in weather_data:
-            value = float(weather_data[field])
-                
-            if field in ['baromabsin']:
-                value = round(inHg_to_hPa(value), 1)
-
-            if field in ['tempinf', 'tempf']:
-                value = round(f_to_c(value), 1)
-
-            if "windspeedmph" in field or "windgustmph" in field:
-                value = int(round(mph_to_kph(value)))
-
-            if field in ['dailyrainin']:
-                value = round(value * 25.4, 1)  # Convert inches to mm
-
-            if field in ['humidity'] or "humidityin" in field:
-                value = int(round(value))
-
-            if field in ['winddir']:
-                value = degrees_to_wind_direction(value)
-
-            if field in ['solarradiation']:
-                value = round(value, 1)
-
-            formatted_data[formatted_datetime][json_key] = value
-
-
-    temp = round(f_to_c(float(weather_data.get('tempf', 0))), 1)
-    wind_speed = int(mph_to_kph(weather_data.get('windspeedmph', 0)))
-    humidity = int(float(weather_data.get('humidity', 0)))
-
-    # 'DewPoint' can be calculated from temperature and humidity
-    formatted_data[formatted_datetime]['DewPoint'] = (
-        int(round(get_dew_point_c(temp, humidity)))
-        if temp is not None and humidity is not None
-        else None
-    )
-    
-    # 'WindChill' can be calculated from temperature and wind speed
-    formatted_data[formatted_datetime]['WindChill'] = (
-        int(round(wind_chill(temp, wind_speed)))
-        if temp is not None and wind_speed is not None and temp <= 10 and wind_speed > 4.8
-        else None
-    )
-    
-    # 'FeelsLike' can be calculated from temperature, humidity, and wind speed
-    formatted_data[formatted_datetime]['FeelsLike'] = (
-        int(round(feels_like(temp, humidity, wind_speed)))
-        if temp is not None and humidity is not None and wind_speed is not None
-        else None
-    )
-
-    # Data object for stroing in the database
-    db_data_to_store['temp'] = round(f_to_c(float(weather_data.get('tempf', 0))), 1)
-    db_data_to_store['temp_in'] = round(f_to_c(float(weather_data.get('tempinf', 0))), 1)
-    db_data_to_store['humidity'] = int(float(weather_data.get('humidity', 0)))
-    db_data_to_store['humidity_in'] = int(float(weather_data.get('humidityin', 0)))
-    db_data_to_store['pressure_abs'] = round(inHg_to_hPa(float(weather_data.get('baromabsin', 0))), 1)
-    db_data_to_store['pressure_rel'] = round(inHg_to_hPa(float(weather_data.get('baromrelin', 0))), 1)
-    db_data_to_store['rain_rate'] = round(float(inches_to_mm(float(weather_data.get('rainratein', 0.0)))), 1)
-    db_data_to_store['rain_event'] = round(float(inches_to_mm(float(weather_data.get('eventrainin', 0.0)))), 1)
-    db_data_to_store['rain_hourly'] = round(float(inches_to_mm(float(weather_data.get('hourlyrainin', 0.0)))), 1)
-    db_data_to_store['rain_daily'] = round(float(inches_to_mm(float(weather_data.get('dailyrainin', 0.0)))), 1)
-    db_data_to_store['rain_weekly'] = round(float(inches_to_mm(float(weather_data.get('weeklyrainin', 0.0)))), 1)
-    db_data_to_store['rain_monthly']  = round(float(inches_to_mm(float(weather_data.get('monthlyrainin', 0.0)))), 1)
-    db_data_to_store['rain_yearly'] = round(float(inches_to_mm(float(weather_data.get('yearlyrainin', 0.0)))), 1)
-    db_data_to_store['wind_degree'] = round(float(weather_data["winddir"]), 1)
-    db_data_to_store['wind_gust'] = int(mph_to_kph(weather_data.get('windgustmph', 0)))
-    db_data_to_store['wind_gust_maxdaily'] = int(mph_to_kph(weather_data.get('maxdailygust', 0)))
-    db_data_to_store['wind_speed'] = int(mph_to_kph(weather_data.get('windspeedmph', 0)))
-    db_data_to_store['solarradiation'] = round(float(weather_data.get('solarradiation', 0)), 1)
-    db_data_to_store['uv'] = int(round(float(weather_data.get('uv', 0.0))))
-
-    # XML data object
-    xml_data_to_store['hum_in'] = int(float(weather_data.get('humidityin', 0)))
-    xml_data_to_store['temp_in'] = round(f_to_c(float(weather_data.get('tempinf', 0))), 1)
-    xml_data_to_store['hum_out'] = int(float(weather_data.get('humidity', 0)))
-    xml_data_to_store['temp_out'] = round(f_to_c(float(weather_data.get('tempf', 0))), 1)
-    xml_data_to_store['abs_pressure'] = round(inHg_to_hPa(float(weather_data.get('baromabsin', 0))), 1)
-    xml_data_to_store['wind_ave'] = int(mph_to_kph(weather_data.get('windspeedmph', 0)))
-    xml_data_to_store['wind_gust'] = int(mph_to_kph(weather_data.get('windgustmph', 0)))
-    xml_data_to_store['wind_dir'] = degrees_to_wind_direction(weather_data["winddir"])
-    xml_data_to_store['rain'] = round(float(inches_to_mm(float(weather_data.get('dailyrainin', 0.0)))), 1)
-
-    # Raw data object
-    raw_data_to_store['hum_in'] = int(float(weather_data.get('humidityin', 0)))
-    raw_data_to_store['temp_in'] = round(f_to_c(float(weather_data.get('tempinf', 0))), 1)
-    raw_data_to_store['hum_out'] = int(float(weather_data.get('humidity', 0)))
-    raw_data_to_store['temp_out'] = round(f_to_c(float(weather_data.get('tempf', 0))), 1)
-    raw_data_to_store['abs_pressure'] = round(inHg_to_hPa(float(weather_data.get('baromabsin', 0))), 1)
-    raw_data_to_store['wind_ave'] = int(mph_to_kph(weather_data.get('windspeedmph', 0)))
-    raw_data_to_store['wind_gust'] = int(mph_to_kph(weather_data.get('windgustmph', 0)))
-    raw_data_to_store['wind_dir'] = int(weather_data["winddir"])
-    raw_data_to_store['rain'] = round(float(inches_to_mm(float(weather_data.get('dailyrainin ', 0.0)))), 1)
-    raw_data_to_store['illuminance'] = round(float(weather_data.get('solarradiation', 0)), 1)
-    raw_data_to_store['uv'] = int(round(float(weather_data.get('uv', 0.0))))
-
-    raw_data_to_custom["temperature"] = round(f_to_c(float(weather_data.get('tempf', 0))), 1);
-    raw_data_to_custom["pressure"] = round(inHg_to_hPa(float(weather_data.get('baromabsin', 0))), 1)
-    raw_data_to_custom["rain"] = round(float(inches_to_mm(float(weather_data.get('dailyrainin', 0.0)))), 1)
-    raw_data_to_custom["wind_gust"] = int(mph_to_kph(weather_data.get('windgustmph', 0)))
-    raw_data_to_custom["wind_degree"] = round(float(weather_data["winddir"]), 1)
-    raw_data_to_custom["solarradiation"] = round(float(weather_data.get('solarradiation', 0)), 1)
-
-    return raw_data_to_store, raw_data_to_custom, xml_data_to_store, db_data_to_store, formatted_data
-
-def save_1y_compressed():
+    observation = Observation.from_ecowitt(weather_data)
+    return observation.to_raw(), observation.to_custom(), observation.to_xml(), observation.to_db(), observation.to_formatted()
+
+def save_1y_compressed(resolution="6h", filename="1y-compressed.json"):
     '''
-    Read 1y.json, bucket data into 6-hour intervals, and save averages to 1y-compressed.json.
+    Save the running averages of the 1y window, bucketed per resolution (6 hours by default), to 1y-compressed.json.
     The structure and averaging logic matches save_to_1y_json, but with fewer records.
     '''
-    import os
-    import json
-    from collections import defaultdict
-    from statistics import mean
-    from globals import DATA_PATH, TIMEZONE
-    from datetime import datetime, timedelta
+    output_path = os.path.join(DATA_PATH, filename)
 
-    input_path = os.path.join(DATA_PATH, "1y.json")
-    output_path = os.path.join(DATA_PATH, "1y-compressed.json")
+    DOWNSAMPLER.seed(WINDOWS["1y"])
+    DOWNSAMPLER.evict(datetime.now(TIMEZONE).replace(tzinfo=None))
+    compressed_data = DOWNSAMPLER.emit(resolution)
 
     try:
-        with open(input_path, 'r') as f:
-            file_data = json.load(f)
-            existing_data = file_data.get("data", [])
+        atomic_write(output_path, SERIALIZER.dumps({"data": compressed_data}))
+        logging.info(f"Compressed 1y.json to {filename} with {len(compressed_data)} records.")
     except Exception as e:
-        logging.error(f"Failed to read 1y.json: {e}")
-        return
-
-    # Bucket records by 6-hour intervals
-    buckets = defaultdict(list)
-    for record in existing_data:
-        for timestamp_str, values in record.items():
-            try:
-                dt = datetime.strptime(timestamp_str, "%m/%d/%Y %H:%M").replace(tzinfo=TIMEZONE)
-                # Find the start of the 6-hour bucket
-                bucket_hour = (dt.hour // 6) * 6
-                bucket_start = dt.replace(hour=bucket_hour, minute=0, second=0, microsecond=0)
-                bucket_key = bucket_start.strftime("%Y-%m-%d %H:%M")
-                buckets[bucket_key].append(values)
-            except Exception as e:
-                logging.warning(f"Skipping record with bad timestamp: {timestamp_str} ({e})")
-
-    # For each bucket, calculate averages for numeric fields
-    compressed_data = []
-    for bucket_key in sorted(buckets.keys()):
-        records = buckets[bucket_key]
-        if not records:
-            continue
-        # Collect all keys
-        all_keys = set()
-        for r in records:
-            all_keys.update(r.keys())
-        avg_record = {}
-        for k in all_keys:
-            values = [r[k] for r in records if k in r and isinstance(r[k], (int, float))]
-            if values:
-                if k.lower() == "windgust":
-                    avg_record[k] = max(values)
-                else:
-                    avg_record[k] = round(mean(values), 2)
-            else:
-                # For non-numeric or missing, just take the first non-None value
-                for r in records:
-                    if k in r and r[k] is not None:
-                        avg_record[k] = r[k]
-                        break
-                else:
-                    avg_record[k] = None
-        compressed_data.append({bucket_key: avg_record})
+        logging.error(f"Failed to write {filename}: {e}")
+
+# Feeds served by the /data/feed/ endpoint: the rolling windows by file name, custom.json and live.xml
+WINDOW_FEEDS = {"24h.json": "24h", "1w.json": "1w", "1m.json": "1m", "1y.json": "1y"}
+FEEDS = tuple(WINDOW_FEEDS) + ("custom.json", "live.xml")
+
+def feed_version(name):
+    ''' Change marker of a feed's source: the in-memory change counter, or the file's mtime for live.xml. '''
+    if name in WINDOW_FEEDS:
+        window = WINDOWS[WINDOW_FEEDS[name]]
+        window.evict(datetime.now(TIMEZONE).replace(tzinfo=None))
+        return window.version
+    if name == "custom.json":
+        CUSTOM.evict(datetime.now(TIMEZONE))
+        return CUSTOM.version
+    return os.stat(os.path.join(DATA_PATH, name)).st_mtime_ns
+
+def build_feed(name, start=None, end=None, fields=None):
+    '''
+    Serialise a feed, limited to records between start and end (epoch seconds, inclusive)
+    and to the given fields. Returns (body bytes, mimetype).
+    '''
+    if name in WINDOW_FEEDS:
+        return window_feed(WINDOWS[WINDOW_FEEDS[name]], start, end, fields), 'application/json'
+    if name == "custom.json":
+        return custom_feed(start, end, fields), 'application/json'
+    return live_feed(fields), 'application/xml'
+
+def _local_naive(epoch):
+    return datetime.fromtimestamp(epoch, TIMEZONE).replace(tzinfo=None) if epoch is not None else None
+
+def window_feed(window, start=None, end=None, fields=None):
+    start, end = _local_naive(start), _local_naive(end)
+    records = [record for record in window.snapshot()
+               if (start is None or record.time >= start) and (end is None or record.time <= end)]
+    if fields is None:
+        return FEED_SERIALIZER.window(records)
+    data = [{record.key: {field: value for field, value in record.items() if field in fields}} for record in records]
+    return FEED_SERIALIZER.dumps({"data": data})
+
+def custom_feed(start=None, end=None, fields=None):
+    if start is None and end is None and fields is None:
+        return CUSTOM.encode(FEED_SERIALIZER)
+    start_ms = start * 1000 if start is not None else None
+    end_ms = end * 1000 if end is not None else None
+    return FEED_SERIALIZER.dumps(CUSTOM.data(start_ms, end_ms, fields))
+
+def live_feed(fields=None):
+    with open(DATA_PATH + "/live.xml", 'rb') as f:
+        body = f.read()
+    if fields is None:
+        return body
+    root = ET.fromstring(body)
+    for element in list(root):
+        if element.tag != "timestamp" and element.tag not in fields:
+            root.remove(element)
+    return ET.tostring(root, encoding='utf-8', xml_declaration=True)
+
+def rebuild_from_sqlite(name):
+    '''
+    Recreate a rolling window (or custom.json, name "custom") from the SQLite database when
+    both its file and the state snapshot are gone, one observation per publish interval.
+    '''
+    now = datetime.now(TIMEZONE)
+    span = CUSTOM.span if name == "custom" else WINDOWS[name].span
+    interval = REBUILD_INTERVALS[name] * 60
 
-    try:
-        with open(output_path, 'w') as f:
-            json.dump({"data": compressed_data}, f, indent=4)
-        logging.info(f"Compressed 1y.json to 1y-compressed.json with {len(compressed_data)} records.")
-    except Exception as e:
-        logging.error(f"Failed to write 1y-compressed.json: {e}")
\ No newline at end of file
+    last_epoch = None
+    count = 0
+    for row in SQLITE_STORAGE.rows_between((now - span).timestamp(), now.timestamp()):
+        if last_epoch is not None and row["epoch"] - last_epoch < interval:
+            continue
+        last_epoch = row["epoch"]
+        key = datetime.fromtimestamp(row["epoch"], TIMEZONE).strftime('%m/%d/%Y %H:%M')
+        observation = Observation.from_db(row, key)
+        if name == "custom":
+            timestamp = datetime.strptime(observation.timestamp, "%Y-%m-%d %H:%M:%S").replace(tzinfo=TIMEZONE)
+            CUSTOM.add(int(timestamp.timestamp() * 1000), observation.to_custom(), now)
+        else:
+            WINDOWS[name].append(observation.to_record(), now.replace(tzinfo=None))
+        count += 1
+
+    if name == "custom":
+        CUSTOM.save(SERIALIZER)
+    else:
+        WINDOWS[name].save(force=True)
+    logging.info("Rebuilt {} from SQLite with {} records.".format(name, count))
+
+# Warm state for restarts: restored once at boot, checkpointed by the scheduler
+STATE = StateManager(DATA_PATH + "/state.pickle", WINDOWS, CUSTOM, DOWNSAMPLER, max_age=STATE_MAX_AGE, rebuild=rebuild_from_sqlite)
\ No newline at end of file
@@ -1,99 +1,344 @@
 from utils.ssh_tunnel import get_ssh_tunnel  
 from datetime import datetime
+import threading
+import queue
 import pymysql
 import sqlite3
 import logging
+import os
+import json
+import time
 
-from globals import DATA_PATH, MYSQL_CONFIG, SSH_CONFIG
+from utils.atomic import atomic_open
+from globals import DATA_PATH, MYSQL_CONFIG, SSH_CONFIG, SQLITE_COMMIT_EVERY
 
-from datetime import datetime
+# Bump when the SQLite schema below changes; stored in PRAGMA user_version
+SQLITE_SCHEMA_VERSION = 1
 
-def import_sqlite_to_mysql(mysql_connection):
-    """Import all data from SQLite to MySQL database using existing MySQL connection."""
+DATA_COLUMNS = (
+    'temp', 'temp_in', 'humidity', 'humidity_in', 'pressure_abs', 'pressure_rel',
+    'rain_rate', 'rain_event', 'rain_hourly', 'rain_daily', 'rain_weekly', 'rain_monthly',
+    'rain_yearly', 'wind_degree', 'wind_gust', 'wind_gust_maxdaily', 'wind_speed',
+    'solarradiation', 'uv',
+)
 
-    sqlite_db_path = DATA_PATH + '/weather_data.db'
+# Timestamps are UTC (dateutc); epoch holds the same moment as integer seconds for indexed range queries
+SQLITE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        epoch INTEGER NOT NULL,
+        timestamp TEXT NOT NULL,
+        temp REAL,
+        temp_in REAL,
+        humidity INTEGER,
+        humidity_in INTEGER, 
+        pressure_abs REAL,
+        pressure_rel REAL,
+        rain_rate REAL,
+        rain_event REAL,
+        rain_hourly REAL,
+        rain_daily REAL,
+        rain_weekly REAL,
+        rain_monthly REAL,
+        rain_yearly REAL,
+        wind_degree REAL,
+        wind_gust REAL,
+        wind_gust_maxdaily REAL,
+        wind_speed REAL,
+        solarradiation REAL,
+        uv INTEGER
+    )
+'''
 
-    sqlite_conn = sqlite3.connect(sqlite_db_path)
-    sqlite_cursor = sqlite_conn.cursor()
-    mysql_cursor = mysql_connection.cursor()
+SQLITE_INDEXES = (
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_weather_observations_epoch ON {table} (epoch)",
+    # Covers the usual graph queries (time range + main series) without touching the table
+    "CREATE INDEX IF NOT EXISTS idx_weather_observations_summary ON {table} (epoch, temp, humidity, pressure_abs, wind_speed, wind_gust, rain_daily)",
+)
 
-    try:
-        mysql_cursor.execute('''
-            CREATE TABLE IF NOT EXISTS weather_observations (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                timestamp DATETIME NOT NULL,
-                temp FLOAT,
-                temp_in FLOAT,
-                humidity INT,
-                humidity_in INT, 
-                pressure_abs FLOAT,
-                pressure_rel FLOAT,
-                rain_rate FLOAT,
-                rain_event FLOAT,
-                rain_hourly FLOAT,
-                rain_daily FLOAT,
-                rain_weekly FLOAT,
-                rain_monthly FLOAT,
-                rain_yearly FLOAT,
-                wind_degree FLOAT,
-                wind_gust FLOAT,
-                wind_gust_maxdaily FLOAT,
-                wind_speed FLOAT,
-                solarradiation FLOAT,
-                uv INT
-            )
-        ''')
+MYSQL_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        timestamp DATETIME NOT NULL,
+        temp FLOAT,
+        temp_in FLOAT,
+        humidity INT,
+        humidity_in INT, 
+        pressure_abs FLOAT,
+        pressure_rel FLOAT,
+        rain_rate FLOAT,
+        rain_event FLOAT,
+        rain_hourly FLOAT,
+        rain_daily FLOAT,
+        rain_weekly FLOAT,
+        rain_monthly FLOAT,
+        rain_yearly FLOAT,
+        wind_degree FLOAT,
+        wind_gust FLOAT,
+        wind_gust_maxdaily FLOAT,
+        wind_speed FLOAT,
+        solarradiation FLOAT,
+        uv INT,
+        UNIQUE KEY uq_timestamp (timestamp),
+        KEY idx_timestamp_summary (timestamp, temp, humidity, pressure_abs, wind_speed, wind_gust, rain_daily)
+    )
+'''
+
+# Rows the SQLite migration couldn't carry over, kept for inspection instead of being dropped
+SQLITE_SKIPPED_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS weather_observations_skipped (
+        id INTEGER PRIMARY KEY,
+        reason TEXT NOT NULL,
+        timestamp TEXT,
+        {columns}
+    )
+'''
+
+def migrate_sqlite_schema(connection, chunk_size=10000):
+    """
+    Rewrite an old weather_observations table (no epoch column) in place to the
+    time-indexed schema. Rows are copied in id ranges of chunk_size with a commit
+    per chunk, so memory stays flat and an interrupted run simply continues.
+    Rows with an unparsable or duplicate timestamp are moved to
+    weather_observations_skipped, and their number is logged.
+    Expects a connection with isolation_level=None.
+
+    SQLiteStorage.open() runs this on startup, which then waits until it's done; on a
+    large database run `python -m utils.migrate_schema --sqlite` before upgrading instead.
+    """
+    columns = [row[1] for row in connection.execute("PRAGMA table_info(weather_observations)")]
+    if not columns or 'epoch' in columns:
+        return False
+
+    total = connection.execute("SELECT COUNT(*) FROM weather_observations").fetchone()[0]
+    logging.warning("Migrating %d SQLite weather_observations rows to the time-indexed schema, this has to finish before anything else runs...", total)
+    connection.execute(SQLITE_SCHEMA.format(table='weather_observations_new'))
+    for index_sql in SQLITE_INDEXES:
+        connection.execute(index_sql.format(table='weather_observations_new'))
+    data_columns = ', '.join(DATA_COLUMNS)
+    connection.execute(SQLITE_SKIPPED_SCHEMA.format(columns=', '.join(column + ' NUMERIC' for column in DATA_COLUMNS)))
 
-        sqlite_cursor.execute('''
-            SELECT timestamp, temp, temp_in, humidity, humidity_in, pressure_abs, pressure_rel,
-                   rain_rate, rain_event, rain_hourly, rain_daily, rain_weekly, rain_monthly,
-                   rain_yearly, wind_degree, wind_gust, wind_gust_maxdaily, wind_speed,
-                   solarradiation, uv
+    last_id = connection.execute("SELECT COALESCE(MAX(id), 0) FROM weather_observations_new").fetchone()[0]
+    copied = 0
+    while True:
+        end_id = connection.execute(
+            "SELECT MAX(id) FROM (SELECT id FROM weather_observations WHERE id > ? ORDER BY id LIMIT ?)",
+            (last_id, chunk_size)
+        ).fetchone()[0]
+        if end_id is None:
+            break
+        connection.execute("BEGIN")
+        cursor = connection.execute(f'''
+            INSERT OR IGNORE INTO weather_observations_new (id, epoch, timestamp, {data_columns})
+            SELECT id, CAST(strftime('%s', timestamp) AS INTEGER), timestamp, {data_columns}
             FROM weather_observations
-        ''')
-        rows = sqlite_cursor.fetchall()
-        total = len(rows)
-        logging.info("Found %d rows in SQLite to import.", total)
-
-        if total > 0:
-            insert_sql = '''
-                INSERT INTO weather_observations (
-                    timestamp, temp, temp_in, humidity, humidity_in,
-                    pressure_abs, pressure_rel, rain_rate, rain_event,
-                    rain_hourly, rain_daily, rain_weekly, rain_monthly, rain_yearly,
-                    wind_degree, wind_gust, wind_gust_maxdaily, wind_speed,
-                    solarradiation, uv
-                )
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            '''
-
-            def convert_batch(batch):
-                for row in batch:
-                    row = list(row)
-                    if isinstance(row[0], datetime):
-                        row[0] = row[0].strftime('%Y-%m-%d %H:%M:%S')
-                    yield tuple(row)
-
-            mysql_connection.autocommit(False)
-            batch_size = 250
-
-            for i in range(0, total, batch_size):
-                batch = rows[i:i+batch_size]
-                converted = list(convert_batch(batch))
-                mysql_cursor.executemany(insert_sql, converted)
-                logging.info("Imported %d of %d rows...", min(i + batch_size, total), total)
+            WHERE id > ? AND id <= ? AND strftime('%s', timestamp) IS NOT NULL
+        ''', (last_id, end_id))
+        # Whatever the copy left out: the timestamp can't be parsed, or another row has the same one
+        connection.execute(f'''
+            INSERT OR IGNORE INTO weather_observations_skipped (id, reason, timestamp, {data_columns})
+            SELECT id, CASE WHEN strftime('%s', timestamp) IS NULL THEN 'unparsable timestamp' ELSE 'duplicate timestamp' END,
+                   timestamp, {data_columns}
+            FROM weather_observations
+            WHERE id > ? AND id <= ? AND id NOT IN (SELECT id FROM weather_observations_new WHERE id > ? AND id <= ?)
+        ''', (last_id, end_id, last_id, end_id))
+        connection.execute("COMMIT")
+        copied += max(cursor.rowcount, 0)
+        last_id = end_id
+        logging.info("Migrated SQLite rows up to id %d (%d of %d copied)...", end_id, copied, total)
+
+    connection.execute("BEGIN")
+    connection.execute("DROP TABLE weather_observations")
+    connection.execute("ALTER TABLE weather_observations_new RENAME TO weather_observations")
+    connection.execute(f"PRAGMA user_version = {SQLITE_SCHEMA_VERSION}")
+    connection.execute("COMMIT")
+    skipped = connection.execute("SELECT COUNT(*) FROM weather_observations_skipped").fetchone()[0]
+    if skipped:
+        logging.warning("SQLite migration skipped %d rows with an unparsable or duplicate timestamp, "
+                        "they're kept in weather_observations_skipped.", skipped)
+    logging.info("SQLite migration complete: %d rows.", copied)
+    return True
 
+def migrate_mysql_schema(mysql_connection, chunk_size=10000):
+    """
+    Give the MySQL weather_observations table a UNIQUE timestamp and a covering range index.
+    Rows are copied in id ranges into a new table (duplicates dropped), which is then
+    swapped in with an atomic RENAME; rows written during the copy are caught up afterwards.
+    """
+    cursor = mysql_connection.cursor(pymysql.cursors.Cursor)
+    try:
+        cursor.execute("SHOW INDEX FROM weather_observations WHERE Key_name = 'uq_timestamp'")
+        if cursor.fetchone():
+            return False
+
+        logging.info("Migrating MySQL weather_observations to the time-indexed schema...")
+        columns = 'timestamp, ' + ', '.join(DATA_COLUMNS)
+        cursor.execute(MYSQL_SCHEMA.format(table='weather_observations_new'))
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM weather_observations_new")
+        last_id = cursor.fetchone()[0]
+        copied = 0
+        while True:
+            cursor.execute(
+                "SELECT MAX(id) FROM (SELECT id FROM weather_observations WHERE id > %s ORDER BY id LIMIT %s) AS chunk",
+                (last_id, chunk_size)
+            )
+            end_id = cursor.fetchone()[0]
+            if end_id is None:
+                break
+            copied += cursor.execute(f'''
+                INSERT IGNORE INTO weather_observations_new (id, {columns})
+                SELECT id, {columns} FROM weather_observations WHERE id > %s AND id <= %s
+            ''', (last_id, end_id))
             mysql_connection.commit()
-            logging.info("Import complete: %d total rows imported.", total)
-        else:
-            logging.info("No rows found in SQLite. Nothing to import.")
+            last_id = end_id
+            logging.info("Migrated MySQL rows up to id %d (%d copied)...", end_id, copied)
+
+        cursor.execute("RENAME TABLE weather_observations TO weather_observations_old, weather_observations_new TO weather_observations")
+        # Catch up on rows that were written while the copy was running
+        cursor.execute(f'''
+            INSERT IGNORE INTO weather_observations ({columns})
+            SELECT {columns} FROM weather_observations_old WHERE id > %s ORDER BY timestamp
+        ''', (last_id,))
+        mysql_connection.commit()
+        cursor.execute("DROP TABLE weather_observations_old")
+        logging.info("MySQL migration complete: %d rows.", copied)
+        return True
+    finally:
+        cursor.close()
+
+def ensure_mysql_schema(mysql_connection):
+    """
+    Migrate an existing MySQL weather_observations table that lacks the unique timestamp
+    (see migrate_mysql_schema). The outbox replay and the resumable SQLite import rely on
+    it to skip rows that are already stored. A missing table is left to the import, which
+    creates it with the current schema. Returns True if the table was migrated.
+    """
+    cursor = mysql_connection.cursor(pymysql.cursors.Cursor)
+    try:
+        cursor.execute("SHOW TABLES LIKE 'weather_observations'")
+        if cursor.fetchone() is None:
+            return False
+    finally:
+        cursor.close()
+    return migrate_mysql_schema(mysql_connection)
+
+SQLITE_IMPORT_CHECKPOINT = DATA_PATH + '/sqlite_import.checkpoint.json'
+
+def read_import_checkpoint(path=SQLITE_IMPORT_CHECKPOINT):
+    """Return the SQLite import checkpoint ({'last_epoch': int, 'complete': bool}) or None."""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def write_import_checkpoint(last_epoch, complete, path=SQLITE_IMPORT_CHECKPOINT):
+    with atomic_open(path, 'w') as f:
+        json.dump({"last_epoch": last_epoch, "complete": complete}, f)
+
+def sqlite_import_pending():
+    """True if a previous SQLite to MySQL import was interrupted."""
+    checkpoint = read_import_checkpoint()
+    return checkpoint is not None and not checkpoint.get("complete")
+
+def import_sqlite_to_mysql(mysql_connection, batch_size=5000, commit_every_batches=4):
+    """
+    Stream all data from SQLite to MySQL database using existing MySQL connection.
+
+    Rows are read in timestamp order with fetchmany on a reader thread while the previous
+    batch is written, and committed every commit_every_batches batches together with a
+    checkpoint (the last imported epoch). INSERT IGNORE on the unique timestamp makes an
+    interrupted import safe to restart: it resumes from the checkpoint without duplicates.
+    """
+
+    checkpoint = read_import_checkpoint() or {}
+    last_epoch = checkpoint.get("last_epoch", 0) if not checkpoint.get("complete") else 0
+    if last_epoch:
+        logging.info("Resuming SQLite import after epoch %d.", last_epoch)
+
+    insert_sql = '''
+        INSERT IGNORE INTO weather_observations (
+            timestamp, temp, temp_in, humidity, humidity_in,
+            pressure_abs, pressure_rel, rain_rate, rain_event,
+            rain_hourly, rain_daily, rain_weekly, rain_monthly, rain_yearly,
+            wind_degree, wind_gust, wind_gust_maxdaily, wind_speed,
+            solarradiation, uv
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    '''
+
+    batches = queue.Queue(maxsize=2)
+
+    def read_batches():
+        # Runs on its own thread (and connection) so reading overlaps with the MySQL writes
+        sqlite_conn = SQLITE_STORAGE.reader()
+        try:
+            sqlite_cursor = sqlite_conn.execute(f'''
+                SELECT epoch, timestamp, {', '.join(DATA_COLUMNS)}
+                FROM weather_observations
+                WHERE epoch > ?
+                ORDER BY epoch
+            ''', (last_epoch,))
+            while True:
+                rows = sqlite_cursor.fetchmany(batch_size)
+                batches.put(rows)
+                if not rows:
+                    break
+        except Exception as e:
+            batches.put(e)
+        finally:
+            sqlite_conn.close()
+
+    reader = threading.Thread(target=read_batches, name="sqlite-import-reader", daemon=True)
+    reader.start()
+
+    mysql_cursor = mysql_connection.cursor()
+    total = 0
+    pending_batches = 0
+    try:
+        write_import_checkpoint(last_epoch, False)
+        mysql_cursor.execute(MYSQL_SCHEMA.format(table='weather_observations'))
+        mysql_connection.begin()
+
+        while True:
+            rows = batches.get()
+            if isinstance(rows, Exception):
+                raise rows
+            if not rows:
+                break
+
+            mysql_cursor.executemany(insert_sql, [row[1:] for row in rows])
+            total += len(rows)
+            batch_epoch = rows[-1][0]
+            pending_batches += 1
+            if pending_batches >= commit_every_batches:
+                mysql_connection.commit()
+                last_epoch = batch_epoch
+                write_import_checkpoint(last_epoch, False)
+                pending_batches = 0
+                logging.info("Imported %d rows so far (up to %s)...", total, rows[-1][1])
+                mysql_connection.begin()
+
+        mysql_connection.commit()
+        if pending_batches:
+            last_epoch = batch_epoch
+        write_import_checkpoint(last_epoch, True)
+        logging.info("Import complete: %d total rows imported.", total)
 
     except Exception as e:
         logging.error("Import failed: %s", str(e))
+        try:
+            mysql_connection.rollback()
+        except Exception:
+            pass
 
     finally:
-        sqlite_cursor.close()
-        sqlite_conn.close()
+        # Unblock the reader if we stopped early
+        while reader.is_alive():
+            try:
+                batches.get(timeout=1)
+            except queue.Empty:
+                pass
         mysql_cursor.close()
 
 def table_exists(mysql_connection):
@@ -114,89 +359,326 @@ def table_exists(mysql_connection):
     finally:
         cursor.close()
 
-def save_to_db(data, db_type='sqlite', conn=None):
+class SQLiteStorage:
     """
-    Save data to a SQLite or MySQL database based on the specified db_type.
-    Uses a persistent connection for MySQL.
+    Long-lived connection to the local SQLite database.
+
+    The schema is created (or migrated) once when the connection is opened, the database runs in WAL
+    mode so readers (like the snapshot for the 6-hour upload) never block the writer,
+    and inserts reuse one cached prepared statement. With commit_every > 1 commits are
+    batched; flush() or close() commits whatever is still open.
     """
-    try:
-        if db_type == 'sqlite':
-            # Handle SQLite database operations
-            with sqlite3.connect(DATA_PATH + '/weather_data.db') as connection:
-                cursor = connection.cursor()
-                logging.info("Trying to save data to SQLite database...")
-                
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS weather_observations (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        timestamp TEXT NOT NULL,
-                        temp REAL,
-                        temp_in REAL,
-                        humidity INTEGER,
-                        humidity_in INTEGER, 
-                        pressure_abs REAL,
-                        pressure_rel REAL,
-                        rain_rate REAL,
-                        rain_event REAL,
-                        rain_hourly REAL,
-                        rain_daily REAL,
-                        rain_weekly REAL,
-                        rain_monthly REAL,
-                        rain_yearly REAL,
-                        wind_degree REAL,
-                        wind_gust REAL,
-                        wind_gust_maxdaily REAL,
-                        wind_speed REAL,
-                        solarradiation REAL,
-                        uv INTEGER
-                    )
-                ''')
-
-                cursor.execute('''
-                    INSERT INTO weather_observations (timestamp, temp, temp_in, humidity, humidity_in, pressure_abs, pressure_rel, rain_rate, rain_event, rain_hourly, rain_daily, rain_weekly, rain_monthly, rain_yearly, wind_degree, wind_gust, wind_gust_maxdaily, wind_speed, solarradiation, uv)
-                    VALUES (:timestamp, :temp, :temp_in, :humidity, :humidity_in, :pressure_abs, :pressure_rel, :rain_rate, :rain_event, :rain_hourly, :rain_daily, :rain_weekly, :rain_monthly, :rain_yearly, :wind_degree, :wind_gust, :wind_gust_maxdaily, :wind_speed, :solarradiation, :uv)
-                ''', data)
-
-                logging.info("Data successfully saved to SQLite database.")
-        
-        elif db_type == 'mysql' and conn is not None:
-            
-            # Handle MySQL database operations using the persistent connection
-            cursor = conn.cursor()
-            logging.info("Trying to save data to MySQL database...")
 
+    insert_sql = '''
+        INSERT OR IGNORE INTO weather_observations (epoch, timestamp, temp, temp_in, humidity, humidity_in, pressure_abs, pressure_rel, rain_rate, rain_event, rain_hourly, rain_daily, rain_weekly, rain_monthly, rain_yearly, wind_degree, wind_gust, wind_gust_maxdaily, wind_speed, solarradiation, uv)
+        VALUES (CAST(strftime('%s', :timestamp) AS INTEGER), :timestamp, :temp, :temp_in, :humidity, :humidity_in, :pressure_abs, :pressure_rel, :rain_rate, :rain_event, :rain_hourly, :rain_daily, :rain_weekly, :rain_monthly, :rain_yearly, :wind_degree, :wind_gust, :wind_gust_maxdaily, :wind_speed, :solarradiation, :uv)
+    '''
+
+    def __init__(self, path, commit_every=1, cache_size_kb=8192):
+        self.path = path
+        self.commit_every = commit_every
+        self.cache_size_kb = cache_size_kb
+        self.connection = None
+        self.uncommitted = 0
+        self.lock = threading.RLock()
+
+    def open(self):
+        """Open the connection and set up the schema, once."""
+        with self.lock:
+            if self.connection is not None:
+                return self.connection
+            # isolation_level=None: transactions are started and committed explicitly
+            connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA cache_size=-{}".format(int(self.cache_size_kb)))
+            connection.execute("PRAGMA busy_timeout=5000")
+            migrate_sqlite_schema(connection)
+            connection.execute(SQLITE_SCHEMA.format(table='weather_observations'))
+            for index_sql in SQLITE_INDEXES:
+                connection.execute(index_sql.format(table='weather_observations'))
+            connection.execute(f"PRAGMA user_version = {SQLITE_SCHEMA_VERSION}")
+            self.connection = connection
+            logging.info("SQLite database opened in WAL mode: %s", self.path)
+            return connection
+
+    def insert(self, data):
+        self.insert_many([data])
+
+    def insert_many(self, rows):
+        with self.lock:
+            connection = self.open()
+            if not connection.in_transaction:
+                connection.execute("BEGIN")
             try:
-                cursor.execute('''
-                    INSERT INTO weather_observations (
-                        timestamp, temp, temp_in, humidity, humidity_in,
-                        pressure_abs, pressure_rel, rain_rate, rain_event,
-                        rain_hourly, rain_daily, rain_weekly, rain_monthly, rain_yearly,
-                        wind_degree, wind_gust, wind_gust_maxdaily, wind_speed,
-                        solarradiation, uv
-                    )
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ''', (
-                    data['timestamp'], data['temp'], data['temp_in'], data['humidity'], data['humidity_in'],
-                    data['pressure_abs'], data['pressure_rel'], data['rain_rate'], data['rain_event'],
-                    data['rain_hourly'], data['rain_daily'], data['rain_weekly'], data['rain_monthly'],
-                    data['rain_yearly'], data['wind_degree'], data['wind_gust'], data['wind_gust_maxdaily'],
-                    data['wind_speed'], data['solarradiation'], data['uv']
-                ))
-                
-                conn.commit()
-                logging.info("Data successfully saved to MySQL database.")
-        
-            except pymysql.MySQLError as e:
-                logging.error(f"Database error (mysql): {e}")
-                if conn and not conn.open:
-                    # Try reconnecting once if connection is lost
-                    logging.info("Re-establishing MySQL connection...")
-                    conn.ping(reconnect=True)
-                    # Retry the query after reconnect
-                    save_to_db(data, db_type, conn)
-                    
+                connection.executemany(self.insert_sql, rows)
+            except Exception:
+                connection.execute("ROLLBACK")
+                self.uncommitted = 0
+                raise
+            self.uncommitted += len(rows)
+            if self.uncommitted >= self.commit_every:
+                self._commit()
+
+    def _commit(self):
+        if self.connection is not None and self.connection.in_transaction:
+            self.connection.execute("COMMIT")
+        self.uncommitted = 0
+
+    def flush(self):
+        with self.lock:
+            self._commit()
+
+    def reader(self):
+        """Open a separate read-only connection; in WAL mode it doesn't block the writer."""
+        self.open()
+        return sqlite3.connect("file:{}?mode=ro".format(self.path), uri=True)
+
+    def rows_between(self, start_epoch, end_epoch):
+        """Yield the observations with start_epoch <= epoch <= end_epoch as dicts, oldest first."""
+        self.flush()
+        connection = self.reader()
+        try:
+            connection.row_factory = sqlite3.Row
+            cursor = connection.execute(
+                "SELECT epoch, timestamp, {} FROM weather_observations WHERE epoch BETWEEN ? AND ? ORDER BY epoch".format(', '.join(DATA_COLUMNS)),
+                (int(start_epoch), int(end_epoch))
+            )
+            for row in cursor:
+                yield dict(row)
+        finally:
+            connection.close()
+
+    def snapshot(self, target_path):
+        """
+        Write a consistent, self-contained copy of the database (e.g. for uploading). The
+        copy is built under a temporary name and renamed into place, so an upload never
+        picks up a half-written snapshot.
+        """
+        self.flush()
+        temp_path = target_path + '.tmp'
+        source = self.reader()
+        target = sqlite3.connect(temp_path)
+        try:
+            source.backup(target)
+            # The copy is read elsewhere without its -wal file, keep it in rollback journal mode
+            target.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            target.close()
+            source.close()
+        os.replace(temp_path, target_path)
+        return target_path
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self._commit()
+                self.connection.close()
+                self.connection = None
+
+SQLITE_STORAGE = SQLiteStorage(DATA_PATH + '/weather_data.db', commit_every=SQLITE_COMMIT_EVERY)
+
+def save_to_db(data, db_type='sqlite'):
+    """
+    Save data to the SQLite database, using its persistent connection. MySQL writes go
+    through MySQLBatchWriter, which keeps them in its outbox until MySQL has them.
+    """
+    if db_type != 'sqlite':
+        raise ValueError("Unsupported db_type {!r}, queue MySQL rows with MySQLBatchWriter.add()".format(db_type))
+    try:
+        # Handle SQLite database operations using the long-lived storage connection
+        SQLITE_STORAGE.insert(data)
+        logging.info("Data successfully saved to SQLite database.")
     except Exception as e:
         logging.error(f"Unexpected error during database operation: {e}")
-    finally:
-        if db_type == 'mysql' and cursor:
-            cursor.close()
\ No newline at end of file
+
+OBSERVATION_COLUMNS = (
+    'timestamp', 'temp', 'temp_in', 'humidity', 'humidity_in',
+    'pressure_abs', 'pressure_rel', 'rain_rate', 'rain_event',
+    'rain_hourly', 'rain_daily', 'rain_weekly', 'rain_monthly', 'rain_yearly',
+    'wind_degree', 'wind_gust', 'wind_gust_maxdaily', 'wind_speed',
+    'solarradiation', 'uv',
+)
+
+class MySQLBatchWriter:
+    """
+    Group-commits live observations to MySQL.
+
+    Every observation is first committed to a local SQLite outbox, so it survives a crash
+    or power loss before it reaches MySQL. The outbox is written to MySQL in timestamp
+    order as one multi-row INSERT with one commit per chunk when batch_size observations
+    are waiting or the oldest is max_delay seconds old, and rows are only deleted from it
+    after that commit. When MySQL (or the SSH tunnel) is unreachable the rows simply stay
+    in the outbox until a retry succeeds. A crash between the MySQL commit and the delete
+    replays rows that are already stored, which INSERT IGNORE on the unique timestamp skips.
+    """
+
+    insert_sql = '''
+        INSERT IGNORE INTO weather_observations (
+            timestamp, temp, temp_in, humidity, humidity_in,
+            pressure_abs, pressure_rel, rain_rate, rain_event,
+            rain_hourly, rain_daily, rain_weekly, rain_monthly, rain_yearly,
+            wind_degree, wind_gust, wind_gust_maxdaily, wind_speed,
+            solarradiation, uv
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    '''
+
+    def __init__(self, connect, outbox_path, batch_size=10, max_delay=300, retry_interval=60, replay_chunk=500, lock=None):
+        self.connect = connect
+        self.outbox_path = outbox_path
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.retry_interval = retry_interval
+        self.replay_chunk = replay_chunk
+        self.lock = lock or threading.Lock()
+        self.pending = 0  # Observations added since the last successful write
+        self.pending_since = None
+        self.pending_lock = threading.Lock()
+        self.outbox_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.thread = None
+        self.stats = {"batches": 0, "rows": 0, "failures": 0, "outbox": 0}
+
+        self.outbox = sqlite3.connect(outbox_path, check_same_thread=False)
+        # WAL keeps it to one fsync per observation; synchronous=FULL makes that commit survive a power loss
+        self.outbox.execute("PRAGMA journal_mode=WAL")
+        self.outbox.execute("PRAGMA synchronous=FULL")
+        self.outbox.execute('''
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT NOT NULL,
+                data TEXT NOT NULL
+            )
+        ''')
+        self.outbox.commit()
+        self.stats["outbox"] = self._outbox_size()
+        if self.stats["outbox"]:
+            # Left over from the last run, due right away
+            self.pending, self.pending_since = self.stats["outbox"], time.monotonic() - max_delay
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="mysql-writer", daemon=True)
+        self.thread.start()
+
+    def add(self, data):
+        """Commit one observation (a db_data_to_store dict) to the outbox, for the next batch."""
+        row = tuple(data[column] for column in OBSERVATION_COLUMNS)
+        with self.outbox_lock:
+            self.outbox.execute("INSERT INTO outbox (timestamp, data) VALUES (?, ?)", (str(row[0]), json.dumps(row, default=str)))
+            self.outbox.commit()
+            self.stats["outbox"] += 1
+        with self.pending_lock:
+            if not self.pending:
+                self.pending_since = time.monotonic()
+            self.pending += 1
+            if self.pending >= self.batch_size:
+                self.wakeup.set()
+
+    def _due(self, now):
+        """Seconds until the waiting observations should be written (0 = now), or None when nothing waits."""
+        with self.pending_lock:
+            if not self.pending:
+                return None
+            if self.pending >= self.batch_size:
+                return 0
+            return max(0, self.max_delay - (now - self.pending_since))
+
+    def _run(self):
+        next_retry = 0
+        while not self.stopping:
+            now = time.monotonic()
+            if now < next_retry:
+                # Backing off after a failure, a full batch can't be written before then either
+                timeout = next_retry - now
+            else:
+                due = self._due(now)
+                timeout = self.max_delay if due is None else due
+            self.wakeup.wait(timeout)
+            self.wakeup.clear()
+            if self.stopping:
+                break
+            now = time.monotonic()
+            if now < next_retry or self._due(now) != 0:
+                continue
+            if not self.flush():
+                next_retry = time.monotonic() + self.retry_interval
+
+    def flush(self):
+        """Write the outbox to MySQL. Returns False if MySQL was unreachable."""
+        with self.pending_lock:
+            pending, pending_since = self.pending, self.pending_since
+            self.pending, self.pending_since = 0, None
+        if not self.stats["outbox"]:
+            return True
+
+        with self.lock:
+            try:
+                conn = self.connect()
+                written = self._write_outbox(conn)
+                logging.info("Saved batch of %d observations to MySQL.", written)
+                return True
+            except Exception as e:
+                self.stats["failures"] += 1
+                logging.error(f"MySQL batch write failed, {self.stats['outbox']} observations stay in the outbox: {e}")
+                with self.pending_lock:
+                    # Still waiting, and still as old as before
+                    self.pending += pending or self.stats["outbox"]
+                    if pending_since is not None and (self.pending_since is None or pending_since < self.pending_since):
+                        self.pending_since = pending_since
+                    elif self.pending_since is None:
+                        self.pending_since = time.monotonic()
+                return False
+
+    def _write(self, conn, rows):
+        cursor = conn.cursor()
+        try:
+            conn.begin()
+            cursor.executemany(self.insert_sql, rows)
+            conn.commit()
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            cursor.close()
+        self.stats["batches"] += 1
+        self.stats["rows"] += len(rows)
+
+    def _write_outbox(self, conn):
+        """Write the outbox in chunks, oldest first, deleting every chunk once MySQL committed it."""
+        written = 0
+        while True:
+            with self.outbox_lock:
+                outbox_rows = self.outbox.execute(
+                    "SELECT id, data FROM outbox ORDER BY timestamp, id LIMIT ?", (self.replay_chunk,)
+                ).fetchall()
+            if not outbox_rows:
+                break
+            self._write(conn, [tuple(json.loads(data)) for _, data in outbox_rows])
+            with self.outbox_lock:
+                self.outbox.executemany("DELETE FROM outbox WHERE id = ?", [(row_id,) for row_id, _ in outbox_rows])
+                self.outbox.commit()
+                self.stats["outbox"] = self._outbox_size()
+            written += len(outbox_rows)
+        return written
+
+    def _outbox_size(self):
+        return self.outbox.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def close(self):
+        """Stop the writer thread and flush; whatever can't be written stays in the outbox for the next run."""
+        self.stopping = True
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join(30)
+            self.flush()
+        # Not started yet (MySQL setup still running): the outbox is written on the next run
+        self.outbox.close()
+
+    def get_stats(self):
+        with self.pending_lock:
+            return dict(self.stats, pending=self.pending)
\ No newline at end of file
@@ -1,9 +1,9 @@
 import os
 import sys
 import pytz
-from datetime import datetime
 from dotenv import load_dotenv
 from store import CustomWeatherStore
+from utils.serializer import Serializer
 
 currentdir = os.path.dirname(os.path.realpath(__file__))
 sys.path.append(os.path.join(currentdir, "pywws/src"))
@@ -11,13 +11,6 @@ sys.path.append(os.path.join(currentdir, "pywws/src"))
 TIMEZONE = pytz.timezone('Europe/Amsterdam')
 BASE_DIR = currentdir
 DATA_PATH = BASE_DIR + "/data"
-LAST_SAVE_TIMES = {
-    "5min": datetime.min.replace(tzinfo=TIMEZONE),
-    "25min": datetime.min.replace(tzinfo=TIMEZONE),
-    "50min": datetime.min.replace(tzinfo=TIMEZONE),
-    "60sec": datetime.min.replace(tzinfo=TIMEZONE),
-    "6hour": datetime.min.replace(tzinfo=TIMEZONE),
-}
 
 # Load environment variables from .env file
 load_dotenv(BASE_DIR + '/.env')
@@ -27,11 +20,47 @@ FTP_HOST = os.getenv('FTP_HOST')
 FTP_USER = os.getenv('FTP_USER')
 FTP_PASS = os.getenv('FTP_PASS')
 FTP_PATH = os.getenv('FTP_PATH')
+# Compressed companions to upload next to the published files, e.g. "gzip" or "gzip,br"
+FTP_COMPRESS = [encoding.strip() for encoding in os.getenv('FTP_COMPRESS', 'gzip').split(',') if encoding.strip()]
 HASS_URL = os.getenv('HASS_URL')
+# More endpoints that receive the original station form, comma separated; prefix an entry with "GET " to send it as query parameters
+FORWARD_URLS = os.getenv('FORWARD_URLS', '')
+# Seconds to wait for a downstream endpoint to connect and to respond
+FORWARD_TIMEOUT = float(os.getenv('FORWARD_TIMEOUT', 5))
+# Failed forwards kept per endpoint (oldest dropped first), retried every N seconds
+FORWARD_RETRY_SIZE = int(os.getenv('FORWARD_RETRY_SIZE', 100))
+FORWARD_RETRY_INTERVAL = int(os.getenv('FORWARD_RETRY_INTERVAL', 60))
+
+# Maximum number of pending observations per sink before the oldest ones are dropped
+DISPATCH_QUEUE_SIZE = int(os.getenv('DISPATCH_QUEUE_SIZE', 500))
+
+# Published JSON files: encoder (auto = orjson, ujson or the standard library, whichever is installed)
+# and indent (0 = compact; 4 gives the old, roughly twice as large layout)
+FEED_JSON_ENCODER = os.getenv('FEED_JSON_ENCODER', 'auto')
+FEED_JSON_INDENT = int(os.getenv('FEED_JSON_INDENT', 0))
+SERIALIZER = Serializer(FEED_JSON_ENCODER, FEED_JSON_INDENT)
+
+# In-memory state (windows, custom.json, aggregates) is checkpointed every N seconds and restored at
+# boot, unless the checkpoint is older than STATE_MAX_AGE seconds
+STATE_CHECKPOINT_INTERVAL = int(os.getenv('STATE_CHECKPOINT_INTERVAL', 300))
+STATE_MAX_AGE = int(os.getenv('STATE_MAX_AGE', 86400))
+
+# Distinct feed queries (feed, range, fields) kept serialised in memory for /data/feed/
+FEED_CACHE_SIZE = int(os.getenv('FEED_CACHE_SIZE', 64))
 
-DATA_STORE = CustomWeatherStore(DATA_PATH)
+# Publish jobs start up to this many seconds late (capped at a quarter of their interval), so they don't line up
+SCHEDULER_JITTER = int(os.getenv('SCHEDULER_JITTER', 15))
+
+# Raw store: flush appended lines to the OS every N observations, fsync every N seconds (0 = only at day rollover and shutdown)
+STORE_FLUSH_EVERY = int(os.getenv('STORE_FLUSH_EVERY', 1))
+STORE_FSYNC_INTERVAL = int(os.getenv('STORE_FSYNC_INTERVAL', 300))
+
+DATA_STORE = CustomWeatherStore(DATA_PATH, flush_every=STORE_FLUSH_EVERY, fsync_interval=STORE_FSYNC_INTERVAL)
 SSH_TUNNEL = None
 
+# Commit SQLite inserts every N observations (1 = every observation)
+SQLITE_COMMIT_EVERY = int(os.getenv('SQLITE_COMMIT_EVERY', 1))
+
 # Database configuratie voor MySQL
 MYSQL_CONFIG = {
     'host': os.getenv('MYSQL_HOST'),
@@ -41,6 +70,12 @@ MYSQL_CONFIG = {
     'port': 3306
 }
 
+# Live observations are written to MySQL in batches of this size, or after this many seconds
+MYSQL_BATCH_SIZE = int(os.getenv('MYSQL_BATCH_SIZE', 10))
+MYSQL_BATCH_DELAY = int(os.getenv('MYSQL_BATCH_DELAY', 300))
+# Seconds to wait before retrying after MySQL (or the SSH tunnel) was unreachable
+MYSQL_RETRY_INTERVAL = int(os.getenv('MYSQL_RETRY_INTERVAL', 60))
+
 # MySQL database only accessible via SSH tunnel
 SSH_CONFIG = {
     'ssh_host': os.getenv('SSH_HOST'),
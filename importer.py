@@ -0,0 +1,408 @@
+import os
+import time
+import queue
+import logging
+import argparse
+import calendar
+import threading
+import multiprocessing
+import pymysql
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from utils.ssh_tunnel import get_ssh_tunnel
+from utils.raw_reader import read_day_file, has_nan, value_or_none
+from globals import MYSQL_CONFIG
+
+# Set to True to import all historical data, ignoring the latest timestamp in MySQL. Use with caution!
+IMPORT_ALL = False
+
+def connect_mysql(ssh, autocommit=False):
+    """Open a MySQL connection through the SSH tunnel."""
+    return pymysql.connect(
+        host='127.0.0.1',
+        user=MYSQL_CONFIG['user'],
+        password=MYSQL_CONFIG['password'],
+        db=MYSQL_CONFIG['database'],
+        port=ssh.local_bind_port,
+        autocommit=autocommit
+    )
+
+ARCHIVE_TABLE = "weather_archive"
+
+ARCHIVE_DATA_COLUMNS = (
+    'temp', 'temp_in', 'humidity', 'humidity_in',
+    'pressure_abs', 'pressure_rel', 'rain_rate', 'rain_event',
+    'rain_hourly', 'rain_daily', 'rain_weekly', 'rain_monthly', 'rain_yearly',
+    'wind_degree', 'wind_gust', 'wind_gust_maxdaily', 'wind_speed',
+    'solarradiation', 'uv',
+)
+
+# Keyed (and so clustered) on timestamp: rows are stored in time order whatever order they arrive in
+ARCHIVE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        timestamp DATETIME NOT NULL PRIMARY KEY,
+        temp FLOAT,
+        temp_in FLOAT,
+        humidity INT,
+        humidity_in INT, 
+        pressure_abs FLOAT,
+        pressure_rel FLOAT,
+        rain_rate FLOAT,
+        rain_event FLOAT,
+        rain_hourly FLOAT,
+        rain_daily FLOAT,
+        rain_weekly FLOAT,
+        rain_monthly FLOAT,
+        rain_yearly FLOAT,
+        wind_degree FLOAT,
+        wind_gust FLOAT,
+        wind_gust_maxdaily FLOAT,
+        wind_speed FLOAT,
+        solarradiation FLOAT,
+        uv INT
+    );
+"""
+
+def migrate_archive_schema(conn, chunk_size=50000):
+    """
+    Move an old weather_archive (AUTO_INCREMENT id + unique timestamp) to the
+    timestamp-keyed schema. Rows are copied in timestamp order, chunk by chunk with a
+    commit each, into a new table that is then swapped in with an atomic RENAME.
+    An interrupted run continues where it stopped.
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SHOW COLUMNS FROM {ARCHIVE_TABLE} LIKE 'id'")
+        if not cursor.fetchone():
+            return False
+
+        logging.info("Migrating weather_archive to a timestamp primary key...")
+        columns = 'timestamp, ' + ', '.join(ARCHIVE_DATA_COLUMNS)
+        new_table = ARCHIVE_TABLE + "_new"
+        cursor.execute(ARCHIVE_SCHEMA.format(table=new_table))
+        cursor.execute(f"SELECT MAX(timestamp) FROM {new_table}")
+        last_ts = cursor.fetchone()[0] or datetime.min
+        copied = 0
+        while True:
+            inserted = cursor.execute(f"""
+                INSERT IGNORE INTO {new_table} ({columns})
+                SELECT {columns} FROM {ARCHIVE_TABLE}
+                WHERE timestamp > %s ORDER BY timestamp LIMIT %s
+            """, (last_ts, chunk_size))
+            conn.commit()
+            cursor.execute(f"SELECT MAX(timestamp) FROM {new_table}")
+            next_ts = cursor.fetchone()[0]
+            if not inserted or next_ts is None or next_ts == last_ts:
+                break
+            copied += inserted
+            last_ts = next_ts
+            logging.info(f"Migrated weather_archive up to {last_ts} ({copied} rows)...")
+
+        cursor.execute(f"RENAME TABLE {ARCHIVE_TABLE} TO {ARCHIVE_TABLE}_old, {new_table} TO {ARCHIVE_TABLE}")
+        cursor.execute(f"DROP TABLE {ARCHIVE_TABLE}_old")
+        conn.commit()
+        logging.info(f"✅ weather_archive migration complete: {copied} rows.")
+        return True
+    finally:
+        cursor.close()
+
+def list_day_files(base_path, latest_imported_ts=None):
+    """Return the raw day files in date order, skipping days before latest_imported_ts."""
+    files = []
+    skipped_files = 0
+    for year in sorted(os.listdir(base_path)):
+        year_path = os.path.join(base_path, year)
+        if not os.path.isdir(year_path):
+            continue
+
+        for month in sorted(os.listdir(year_path)):
+            month_path = os.path.join(year_path, month)
+            if not os.path.isdir(month_path):
+                continue
+
+            for fname in sorted(os.listdir(month_path)):
+                if not fname.endswith('.txt'):
+                    continue
+
+                if latest_imported_ts:
+                    try:
+                        file_day = datetime.strptime(fname[:-4], "%Y-%m-%d").date()
+                        if file_day < latest_imported_ts.date():
+                            skipped_files += 1
+                            continue
+                    except Exception:
+                        pass
+
+                files.append(os.path.join(month_path, fname))
+    return files, skipped_files
+
+def day_file_paths(base_path, days):
+    """Return the existing raw day files for the given dates."""
+    files = []
+    for day in sorted(days):
+        file_path = os.path.join(base_path, day.strftime('%Y'), day.strftime('%Y-%m'), day.strftime('%Y-%m-%d.txt'))
+        if os.path.exists(file_path):
+            files.append(file_path)
+        else:
+            logging.warning(f"No raw file for {day}: {file_path}")
+    return files
+
+# Raw day file columns that end up in weather_archive
+RAW_IMPORT_FIELDS = ('temp_out', 'temp_in', 'hum_out', 'hum_in', 'abs_pressure', 'rain', 'wind_dir', 'wind_gust', 'wind_ave', 'illuminance', 'uv')
+
+def parse_day_file(file_path, latest_imported_ts=None):
+    """
+    Parse one raw day file into weather_archive rows. Runs in a worker process, so it
+    doesn't log per line; it returns (rows, skipped, errors, error_samples) instead.
+    """
+    since = calendar.timegm(latest_imported_ts.timetuple()) if latest_imported_ts else None
+    columns = read_day_file(file_path, since=since, keep_idx=True, fields=RAW_IMPORT_FIELDS)
+    error_samples = [f"❌ Error parsing line: {line}" for line in columns['error_samples']]
+
+    def floats(name):
+        column = columns[name]
+        if not has_nan(column):
+            return column.tolist()
+        return [value_or_none(value) for value in column]
+
+    def ints(name):
+        column = columns[name]
+        if not has_nan(column):
+            return list(map(int, column))
+        return [None if value != value else int(value) for value in column]
+
+    count = len(columns['idx'])
+    zeros = [0.0] * count
+    rain_rate = [0.0 if value is None else value for value in floats('rain')]
+
+    rows = list(zip(
+        columns['idx'],                                         # timestamp
+        floats('temp_out'),                                     # temp
+        floats('temp_in'),                                      # temp_in
+        ints('hum_out'),                                        # humidity
+        ints('hum_in'),                                         # humidity_in
+        floats('abs_pressure'),                                 # pressure_abs
+        [None] * count,                                         # pressure_rel
+        rain_rate,                                              # rain_rate
+        zeros, zeros, zeros, zeros, zeros, zeros,               # rain_event .. rain_yearly
+        floats('wind_dir'),                                     # wind_degree
+        floats('wind_gust'),                                    # wind_gust
+        zeros,                                                  # wind_gust_maxdaily
+        floats('wind_ave'),                                     # wind_speed
+        floats('illuminance'),                                  # solarradiation
+        ints('uv'),                                             # uv
+    ))
+
+    return rows, columns['skipped'], columns['errors'], error_samples
+
+class ArchiveWriterPool:
+    """
+    A few writer threads, each with its own MySQL connection, fed from one bounded queue.
+    Batches are queued in file order; INSERT IGNORE on the unique timestamp keeps the
+    result correct regardless of which connection commits first.
+
+    A writer whose connection fails stops taking batches and hands the ones it hadn't
+    committed back to the others. When no writer is left, put() raises and the rows that
+    couldn't be written are counted in dropped_rows.
+    """
+
+    def __init__(self, ssh, insert_query, connections=2, commit_every_batches=5):
+        self.insert_query = insert_query
+        self.commit_every_batches = commit_every_batches
+        self.queue = queue.Queue(maxsize=connections * 2)
+        self.returned = deque()  # Batches handed back by failed writers, taken before the queue
+        self.lock = threading.Lock()
+        self.errors = []
+        self.dropped_rows = 0
+        self.alive = connections
+        self.threads = [
+            threading.Thread(target=self._run, args=(connect_mysql(ssh),), name=f"archive-writer-{i}", daemon=True)
+            for i in range(connections)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def _take_returned(self):
+        with self.lock:
+            return self.returned.popleft() if self.returned else None
+
+    def _run(self, conn):
+        cursor = conn.cursor()
+        uncommitted = []
+        closing = False
+        try:
+            while True:
+                batch = self._take_returned()
+                if batch is None:
+                    if closing:
+                        break
+                    batch = self.queue.get()
+                    if batch is None:
+                        # Finish the batches failed writers handed back before stopping
+                        closing = True
+                        continue
+                uncommitted.append(batch)
+                cursor.executemany(self.insert_query, batch)
+                if len(uncommitted) >= self.commit_every_batches:
+                    conn.commit()
+                    uncommitted = []
+            if uncommitted:
+                conn.commit()
+        except Exception as e:
+            rows = sum(map(len, uncommitted))
+            logging.error(f"Archive writer failed, handing back {rows} uncommitted rows: {e}")
+            self.errors.append(e)
+            with self.lock:
+                self.alive -= 1
+                self.returned.extend(uncommitted)
+        finally:
+            cursor.close()
+            conn.close()
+
+    def put(self, batch):
+        """Queue a batch for the writers. Raises RuntimeError when every writer has failed."""
+        while True:
+            if not self.alive:
+                raise RuntimeError(f"All {len(self.threads)} archive writers failed")
+            try:
+                self.queue.put(batch, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+    def close(self):
+        """Stop the writers once they're done, and count the rows no writer was left to store."""
+        for _ in self.threads:
+            try:
+                self.put(None)
+            except RuntimeError:
+                break
+        for thread in self.threads:
+            thread.join()
+        leftover = list(self.returned)
+        while True:
+            try:
+                batch = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if batch is not None:
+                leftover.append(batch)
+        self.dropped_rows = sum(map(len, leftover))
+
+def import_saved_data_to_mysql(data_root='data', datatype='raw', batch_size=50000, commit_every_batches=5, import_all=IMPORT_ALL, workers=None, connections=2, days=None):
+    """
+    One-time import of historical data from local files into MySQL.
+
+    Day files are parsed in parallel by worker processes; their results come back in
+    file order and are written in batches by a small pool of MySQL connections. The
+    workers are spawned, not forked: by then the SSH tunnel and the writer threads are
+    running, and a forked child would inherit whatever locks they hold at that moment.
+    Pass days (a list of dates) to re-import just those days, overwriting their rows.
+    """
+
+    logging.info("Starting one-time import of historical data to MySQL...")
+    
+    table_name = ARCHIVE_TABLE
+    columns = 'timestamp, ' + ', '.join(ARCHIVE_DATA_COLUMNS)
+    placeholders = ', '.join(['%s'] * (len(ARCHIVE_DATA_COLUMNS) + 1))
+
+    if days:
+        # Back-fill: overwrite just these days' rows
+        updates = ', '.join(f"{column} = VALUES({column})" for column in ARCHIVE_DATA_COLUMNS)
+        insert_query = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders}) ON DUPLICATE KEY UPDATE {updates}"
+    else:
+        insert_query = f"INSERT IGNORE INTO {table_name} ({columns}) VALUES ({placeholders})"
+
+    ssh = get_ssh_tunnel()
+    conn = connect_mysql(ssh)
+
+    cursor = conn.cursor()
+    logging.info("Trying to create MySQL table if not exists...")
+    cursor.execute(ARCHIVE_SCHEMA.format(table=table_name))
+    migrate_archive_schema(conn)
+    latest_imported_ts = None
+    if days:
+        logging.info(f"ℹ️ Back-filling {len(days)} day(s): {', '.join(str(day) for day in days)}")
+    elif not import_all:
+        cursor.execute(f"SELECT MAX(timestamp) FROM {table_name}")
+        latest_imported_ts = cursor.fetchone()[0]
+        if latest_imported_ts:
+            logging.info(f"ℹ️ Resuming import from latest MySQL timestamp: {latest_imported_ts}")
+    else:
+        logging.info("ℹ️ Full import requested: ignoring latest imported timestamp.")
+
+    if days:
+        files, skipped_files = day_file_paths(os.path.join(data_root, datatype), days), 0
+    else:
+        files, skipped_files = list_day_files(os.path.join(data_root, datatype), latest_imported_ts)
+    total_files = len(files)
+    logging.info(f"📂 Importing {total_files} files with {workers or os.cpu_count()} parser processes and {connections} connections...")
+
+    row_count = 0
+    skipped = 0
+    errors = 0
+    done_files = 0
+    batch = []
+    started = time.monotonic()
+    last_report = started
+
+    writers = ArchiveWriterPool(ssh, insert_query, connections, commit_every_batches)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            results = executor.map(parse_day_file, files, [latest_imported_ts] * total_files, chunksize=8)
+            for rows, file_skipped, file_errors, error_samples in results:
+                done_files += 1
+                skipped += file_skipped
+                errors += file_errors
+                for sample in error_samples:
+                    logging.info(sample)
+
+                batch.extend(rows)
+                if len(batch) >= batch_size:
+                    writers.put(batch)
+                    row_count += len(batch)
+                    batch = []
+
+                now = time.monotonic()
+                if now - last_report >= 10 or done_files == total_files:
+                    last_report = now
+                    elapsed = now - started
+                    files_per_sec = done_files / elapsed if elapsed else 0
+                    eta = (total_files - done_files) / files_per_sec if files_per_sec else 0
+                    logging.info(f"⏳ {done_files}/{total_files} files, {row_count + len(batch)} rows, "
+                                 f"{files_per_sec:.1f} files/s, {(row_count + len(batch)) / elapsed if elapsed else 0:.0f} rows/s, ETA {eta:.0f}s")
+
+        # Insert any remaining records
+        if batch:
+            writers.put(batch)
+            row_count += len(batch)
+    finally:
+        writers.close()
+        if writers.dropped_rows:
+            logging.error(f"{len(writers.errors)} writer(s) failed: {writers.dropped_rows} queued rows were not written. "
+                          "A resumed import starts after the latest stored row, re-run with --all or --days to fill them in.")
+        elif writers.errors:
+            logging.warning(f"{len(writers.errors)} writer(s) failed, the remaining ones stored their rows.")
+
+    cursor.close()
+    conn.close()
+
+    elapsed = time.monotonic() - started
+    logging.info(f"✅ Import done in {elapsed:.0f}s. Files: {total_files}, Rows: {row_count}, Skipped: {skipped}, Skipped files: {skipped_files}, Errors: {errors}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Import raw day files into the MySQL weather_archive table.")
+    parser.add_argument('--days', nargs='+', metavar='YYYY-MM-DD', help='Re-import (overwrite) only these days')
+    parser.add_argument('--all', action='store_true', help='Import everything, ignoring the latest imported timestamp')
+    parser.add_argument('--workers', type=int, default=None, help='Parser processes (default: CPU count)')
+    parser.add_argument('--connections', type=int, default=2, help='MySQL writer connections')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    days = [datetime.strptime(day, "%Y-%m-%d").date() for day in args.days] if args.days else None
+    import_saved_data_to_mysql(import_all=args.all or IMPORT_ALL, workers=args.workers, connections=args.connections, days=days)
+
+if __name__ == "__main__":
+    main()
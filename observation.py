@@ -0,0 +1,265 @@
+from datetime import datetime
+from utils.conversions import degrees_to_wind_direction, f_to_c, feels_like, get_dew_point_c, inHg_to_hPa, inches_to_mm, mph_to_kph, wind_chill
+from utils.rolling_window import WindowRecord, intern_fields
+from globals import TIMEZONE
+
+def _celsius(value):
+    return round(f_to_c(value), 1)
+
+def _hpa(value):
+    return round(inHg_to_hPa(value), 1)
+
+def _mm(value):
+    return round(float(inches_to_mm(value)), 1)
+
+def _round1(value):
+    return round(value, 1)
+
+def _round_int(value):
+    return int(round(value))
+
+# Ecowitt fields that are parsed with float() and converted once:
+# (attribute, Ecowitt key, value used when the key is missing, conversion)
+CONVERSIONS = (
+    ('temp', 'tempf', 0, _celsius),
+    ('temp_in', 'tempinf', 0, _celsius),
+    ('humidity_pct', 'humidity', 0, None),
+    ('humidity_in_pct', 'humidityin', 0, None),
+    ('pressure_abs', 'baromabsin', 0, _hpa),
+    ('pressure_rel', 'baromrelin', 0, _hpa),
+    ('rain_rate_in', 'rainratein', 0.0, None),
+    ('rain_rate', 'rainratein', 0.0, _mm),
+    ('rain_event', 'eventrainin', 0.0, _mm),
+    ('rain_hourly', 'hourlyrainin', 0.0, _mm),
+    ('rain_daily', 'dailyrainin', 0.0, _mm),
+    ('rain_weekly', 'weeklyrainin', 0.0, _mm),
+    ('rain_monthly', 'monthlyrainin', 0.0, _mm),
+    ('rain_yearly', 'yearlyrainin', 0.0, _mm),
+    # The raw store has always looked up 'dailyrainin ' (trailing space), so its rain column stays 0.0
+    ('rain_raw', 'dailyrainin ', 0.0, _mm),
+    ('solarradiation', 'solarradiation', 0, _round1),
+    ('uv', 'uv', 0.0, _round_int),
+)
+
+# Wind speeds go through mph_to_kph, which turns unparsable values into 0: (attribute, Ecowitt key)
+WIND_SPEEDS = (
+    ('wind_speed_kph', 'windspeedmph'),
+    ('wind_gust_kph', 'windgustmph'),
+    ('wind_gust_maxdaily_kph', 'maxdailygust'),
+)
+
+# Formatted (24h/1w/...) record: (JSON key, Ecowitt key, attribute). The value is None when
+# the station didn't send the key; DewPoint, FeelsLike and WindChill are always derived.
+FORMATTED_FIELDS = (
+    ('AbsPressure', 'baromabsin', 'pressure_abs'),
+    ('DewPoint', None, 'dew_point'),
+    ('Rain', 'rainratein', 'rain_rate_in'),
+    ('FeelsLike', None, 'feels_like'),
+    ('HumidityIn', 'humidityin', 'humidity_in_rounded'),
+    ('HumidityOut', 'humidity', 'humidity_rounded'),
+    ('SolarRadiation', 'solarradiation', 'solarradiation'),
+    ('TempIn', 'tempinf', 'temp_in'),
+    ('TempOut', 'tempf', 'temp'),
+    ('WindDirection', 'winddir', 'wind_dir_text'),
+    ('WindChill', None, 'wind_chill'),
+    ('WindGust', 'windgustmph', 'wind_gust_rounded'),
+    ('WindAvg', 'windspeedmph', 'wind_speed_rounded'),
+)
+
+FORMATTED_KEYS = intern_fields(json_key for json_key, key, attribute in FORMATTED_FIELDS)
+
+# Not parsed strictly below (recomputed, or read through the lenient mph_to_kph), but a
+# malformed value has always rejected the request
+VALIDATED_FIELDS = ('dewpoint', 'feelsLike', 'windchillf', 'windspeedmph', 'windgustmph')
+
+def _parse_dateutc(value):
+    """Parse Ecowitt's 'YYYY-MM-DD HH:MM:SS', as strict as strptime but without its overhead."""
+    if len(value) == 19 and value[4] == value[7] == '-' and value[10] == ' ' and value[13] == value[16] == ':':
+        return datetime.fromisoformat(value)
+    return datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+
+class Observation:
+    """
+    One Ecowitt report, parsed and converted once. The to_* methods are cheap
+    projections onto the record layouts the sinks and files expect; source keeps
+    the form as it was posted, for forwarding.
+    """
+
+    __slots__ = (
+        'source', 'record', 'timestamp', 'idx', 'key', 'delay', 'present',
+        'temp', 'temp_in', 'humidity', 'humidity_in', 'humidity_rounded', 'humidity_in_rounded',
+        'humidity_pct', 'humidity_in_pct', 'pressure_abs', 'pressure_rel',
+        'rain_rate_in', 'rain_rate', 'rain_event', 'rain_hourly', 'rain_daily',
+        'rain_weekly', 'rain_monthly', 'rain_yearly', 'rain_raw',
+        'wind_degree', 'wind_dir', 'wind_dir_text',
+        'wind_speed_kph', 'wind_gust_kph', 'wind_gust_maxdaily_kph',
+        'wind_speed', 'wind_gust', 'wind_gust_maxdaily', 'wind_speed_rounded', 'wind_gust_rounded',
+        'solarradiation', 'uv', 'dew_point', 'wind_chill', 'feels_like',
+    )
+
+    @classmethod
+    def from_ecowitt(cls, weather_data, now=None):
+        """Normalise a POSTed Ecowitt form. Raises KeyError/ValueError/TypeError on bad input."""
+        self = cls()
+        self.source = weather_data
+        self.record = None
+        self.key = (now or datetime.now(TIMEZONE)).strftime('%m/%d/%Y %H:%M')
+        self.timestamp = weather_data["dateutc"]
+        self.idx = _parse_dateutc(self.timestamp).isoformat(timespec='microseconds')
+        self.delay = int(weather_data["interval"]) // 60
+
+        self.present = frozenset(key for json_key, key, attribute in FORMATTED_FIELDS if key in weather_data)
+
+        for key in VALIDATED_FIELDS:
+            if key in weather_data:
+                float(weather_data[key])
+
+        for attribute, key, default, convert in CONVERSIONS:
+            value = float(weather_data.get(key, default))
+            setattr(self, attribute, convert(value) if convert else value)
+
+        for attribute, key in WIND_SPEEDS:
+            setattr(self, attribute, mph_to_kph(weather_data.get(key, 0)))
+
+        self.humidity = int(self.humidity_pct)
+        self.humidity_in = int(self.humidity_in_pct)
+        self.humidity_rounded = int(round(self.humidity_pct))
+        self.humidity_in_rounded = int(round(self.humidity_in_pct))
+        self.wind_speed = int(self.wind_speed_kph)
+        self.wind_gust = int(self.wind_gust_kph)
+        self.wind_gust_maxdaily = int(self.wind_gust_maxdaily_kph)
+        self.wind_speed_rounded = int(round(self.wind_speed_kph))
+        self.wind_gust_rounded = int(round(self.wind_gust_kph))
+
+        temp, humidity, wind_speed = self.temp, self.humidity, self.wind_speed
+        self.dew_point = int(round(get_dew_point_c(temp, humidity)))
+        self.wind_chill = int(round(wind_chill(temp, wind_speed))) if temp <= 10 and wind_speed > 4.8 else None
+        self.feels_like = int(round(feels_like(temp, humidity, wind_speed)))
+
+        winddir = weather_data["winddir"]
+        self.wind_degree = round(float(winddir), 1)
+        self.wind_dir = int(winddir)
+        self.wind_dir_text = degrees_to_wind_direction(winddir)
+        return self
+
+    @classmethod
+    def from_db(cls, row, key):
+        """
+        Rebuild an observation from a weather_observations row ({column: value}), for
+        recreating the rolling windows and custom.json when their files are lost. Values
+        the table doesn't keep exactly (the rain rate in inches, unrounded wind speeds and
+        humidity) are derived from the stored ones, so the result is close to, not
+        identical with, the original report.
+        """
+        self = cls()
+        self.source = None
+        self.record = None
+        self.key = key
+        self.timestamp = row['timestamp']
+        self.idx = _parse_dateutc(self.timestamp).isoformat(timespec='microseconds')
+        self.delay = None
+        self.present = frozenset(source for json_key, source, attribute in FORMATTED_FIELDS if source is not None)
+
+        for column in ('temp', 'temp_in', 'pressure_abs', 'pressure_rel', 'rain_rate', 'rain_event', 'rain_hourly',
+                       'rain_daily', 'rain_weekly', 'rain_monthly', 'rain_yearly', 'solarradiation', 'uv'):
+            setattr(self, column, row[column] if row[column] is not None else 0)
+        self.rain_rate_in = round(self.rain_rate / 25.4, 3)
+        self.rain_raw = 0.0
+
+        self.humidity = self.humidity_pct = self.humidity_rounded = int(row['humidity'] or 0)
+        self.humidity_in = self.humidity_in_pct = self.humidity_in_rounded = int(row['humidity_in'] or 0)
+        self.wind_speed = self.wind_speed_kph = self.wind_speed_rounded = int(row['wind_speed'] or 0)
+        self.wind_gust = self.wind_gust_kph = self.wind_gust_rounded = int(row['wind_gust'] or 0)
+        self.wind_gust_maxdaily = self.wind_gust_maxdaily_kph = int(row['wind_gust_maxdaily'] or 0)
+
+        temp, humidity, wind_speed = self.temp, self.humidity, self.wind_speed
+        self.dew_point = int(round(get_dew_point_c(temp, humidity))) if humidity > 0 else None
+        self.wind_chill = int(round(wind_chill(temp, wind_speed))) if temp <= 10 and wind_speed > 4.8 else None
+        self.feels_like = int(round(feels_like(temp, humidity, wind_speed)))
+
+        self.wind_degree = row['wind_degree'] if row['wind_degree'] is not None else 0.0
+        self.wind_dir = int(self.wind_degree)
+        self.wind_dir_text = degrees_to_wind_direction(self.wind_degree)
+        return self
+
+    def to_raw(self):
+        """Record for the pywws-style raw store (CustomWeatherStore.save_data)."""
+        return {
+            "idx": self.idx,
+            "delay": self.delay,
+            "hum_in": self.humidity_in,
+            "temp_in": self.temp_in,
+            "hum_out": self.humidity,
+            "temp_out": self.temp,
+            "abs_pressure": self.pressure_abs,
+            "wind_ave": self.wind_speed,
+            "wind_gust": self.wind_gust,
+            "wind_dir": self.wind_dir,
+            "rain": self.rain_raw,
+            "status": 0,
+            "illuminance": self.solarradiation,
+            "uv": self.uv,
+        }
+
+    def to_custom(self):
+        """Values for custom.json."""
+        return {
+            'temperature': self.temp,
+            'pressure': self.pressure_abs,
+            'rain': self.rain_daily,
+            'wind_gust': self.wind_gust,
+            'wind_degree': self.wind_degree,
+            'solarradiation': self.solarradiation,
+        }
+
+    def to_xml(self):
+        """Values for live.xml."""
+        return {
+            "hum_in": self.humidity_in,
+            "temp_in": self.temp_in,
+            "hum_out": self.humidity,
+            "temp_out": self.temp,
+            "abs_pressure": self.pressure_abs,
+            "wind_ave": self.wind_speed,
+            "wind_gust": self.wind_gust,
+            "wind_dir": self.wind_dir_text,
+            "rain": self.rain_daily,
+        }
+
+    def to_db(self):
+        """Row for the SQLite/MySQL weather_observations table."""
+        return {
+            'timestamp': self.timestamp,
+            'temp': self.temp,
+            'temp_in': self.temp_in,
+            'humidity': self.humidity,
+            'humidity_in': self.humidity_in,
+            'pressure_abs': self.pressure_abs,
+            'pressure_rel': self.pressure_rel,
+            'rain_rate': self.rain_rate,
+            'rain_event': self.rain_event,
+            'rain_hourly': self.rain_hourly,
+            'rain_daily': self.rain_daily,
+            'rain_weekly': self.rain_weekly,
+            'rain_monthly': self.rain_monthly,
+            'rain_yearly': self.rain_yearly,
+            'wind_degree': self.wind_degree,
+            'wind_gust': self.wind_gust,
+            'wind_gust_maxdaily': self.wind_gust_maxdaily,
+            'wind_speed': self.wind_speed,
+            'solarradiation': self.solarradiation,
+            'uv': self.uv,
+        }
+
+    def to_record(self):
+        """Compact rolling window record, built once and shared by every window it is added to."""
+        if self.record is None:
+            present = self.present
+            values = [getattr(self, attribute) if key is None or key in present else None
+                      for json_key, key, attribute in FORMATTED_FIELDS]
+            self.record = WindowRecord(self.key, FORMATTED_KEYS, values)
+        return self.record
+
+    def to_formatted(self):
+        """{'MM/DD/YYYY HH:MM': values} record for the rolling JSON windows."""
+        return self.to_record().to_dict()
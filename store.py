@@ -1,10 +1,22 @@
 import csv
-from datetime import datetime
+from datetime import datetime, timedelta
 import os
+import glob
+import time
+import bisect
+import calendar
+import threading
+from array import array
+
+from utils.columnar import ColumnarMonth, convert_month
+from utils.raw_index import RawIndex, day_epoch
+from utils.raw_reader import RAW_FIELDS, parse_day_text
 
 class CustomWeatherStore:
-    def __init__(self, data_dir):
+    def __init__(self, data_dir, flush_every=1, fsync_interval=0):
         self.data_dir = data_dir
+        self.flush_every = max(1, flush_every)
+        self.fsync_interval = fsync_interval
         self.directory_names = {
             'raw': 'raw',
             'calib': 'calib',
@@ -19,6 +31,14 @@ class CustomWeatherStore:
                 'status', 'illuminance', 'uv',
             ],
         }
+        self.columnar_dir = os.path.join(data_dir, 'columnar')
+        self._columnar = {}  # (year, month) -> (mtime, ColumnarMonth)
+        self._handles = {}  # datatype -> (file_path, open file)
+        self._directories = set()
+        self._pending = 0
+        self._last_fsync = time.monotonic()
+        self._lock = threading.Lock()
+        self.raw_index = RawIndex(os.path.join(data_dir, 'raw_index.json'))
 
     def _prepare_data_line(self, data):
         # Reorder or select data as needed to match specific output formatting
@@ -39,40 +59,269 @@ class CustomWeatherStore:
         ]
         return ','.join(ordered_data)
 
-    def save_data(self, data, datatype='raw'):
-        if datatype not in self.directory_names:
-            raise ValueError("Unsupported datatype: " + datatype)
-
-        # Prepare the directory path based on the datatype
-        dt = datetime.strptime(data['idx'], "%Y-%m-%dT%H:%M:%S.%f")
-        year_month_dir = os.path.join(self.data_dir, self.directory_names[datatype], dt.strftime('%Y'), dt.strftime('%Y-%m'))
-        os.makedirs(year_month_dir, exist_ok=True)
+    def _file_path(self, dt, datatype):
+        year_month_dir = os.path.join(self.data_dir, self.directory_names[datatype], '%04d' % dt.year, '%04d-%02d' % (dt.year, dt.month))
 
         if datatype == 'raw':
-            filename = dt.strftime('%Y-%m-%d.txt')
+            filename = '%04d-%02d-%02d.txt' % (dt.year, dt.month, dt.day)
         elif datatype in ['daily', 'monthly']:
-            filename = datatype + "-" + dt.strftime('%Y-%m') + ".txt"
+            filename = datatype + "-" + '%04d-%02d' % (dt.year, dt.month) + ".txt"
         elif datatype == 'hourly':
-            filename = datatype + "-" + dt.strftime('%Y-%m-%d-%H') + ".txt"
+            filename = datatype + "-" + '%04d-%02d-%02d-%02d' % (dt.year, dt.month, dt.day, dt.hour) + ".txt"
         else:  # For calib or potentially other datatypes
-            filename = datatype + "-" + dt.strftime('%Y-%m-%d') + ".txt"
-
-        file_path = os.path.join(year_month_dir, filename)
-        
-        dt_format = "%Y-%m-%dT%H:%M:%S.%f"
-        with open(file_path, 'a') as file:
-            if isinstance(data, dict):
-                # Convert 'idx' datetime from ISO 8601 to desired format 
-                if 'idx' in data and isinstance(data['idx'], str):
-                    try:
-                        idx_dt = datetime.strptime(data['idx'].split('.')[0], dt_format.split('.')[0])
-                        data['idx'] = idx_dt.strftime('%Y-%m-%d %H:%M:%S')
-                    except ValueError:
-                        # In case the format does not match, indicate parsing failure or ignore
-                        print("Datetime parsing failed for idx:", data['idx'])
-                
-                values = [str(data.get(key, '')) for key in self.key_lists[datatype]]
-                line = ','.join(values)
-            else:
-                line = data
-            file.write(line + '\n')
\ No newline at end of file
+            filename = datatype + "-" + '%04d-%02d-%02d' % (dt.year, dt.month, dt.day) + ".txt"
+
+        return year_month_dir, os.path.join(year_month_dir, filename)
+
+    def _handle(self, datatype, year_month_dir, file_path):
+        """Return the open append handle for a datatype, rolling over to a new file when the path changed."""
+        current = self._handles.get(datatype)
+        if current is not None:
+            if current[0] == file_path:
+                return current[1]
+            # New day (or hour/month for the other datatypes): make the old file durable and close it
+            self._close_handle(datatype)
+
+        if year_month_dir not in self._directories:
+            os.makedirs(year_month_dir, exist_ok=True)
+            self._directories.add(year_month_dir)
+        try:
+            file = open(file_path, 'a')
+        except FileNotFoundError:
+            # Directory was removed behind our back
+            self._directories.discard(year_month_dir)
+            os.makedirs(year_month_dir, exist_ok=True)
+            self._directories.add(year_month_dir)
+            file = open(file_path, 'a')
+        self._handles[datatype] = (file_path, file)
+        return file
+
+    def _close_handle(self, datatype):
+        file_path, file = self._handles.pop(datatype)
+        try:
+            file.flush()
+            os.fsync(file.fileno())
+        finally:
+            file.close()
+
+    def save_data(self, data, datatype='raw'):
+        """
+        Append one record to its file. The file stays open until the record's day (hour,
+        month) changes or close() is called. Lines are flushed to the OS every
+        flush_every records and fsynced every fsync_interval seconds (0 = only on
+        rollover and close), so an observation normally costs a single write.
+        """
+        if datatype not in self.directory_names:
+            raise ValueError("Unsupported datatype: " + datatype)
+
+        # Parse idx once; fromisoformat handles the "%Y-%m-%dT%H:%M:%S.%f" timestamps without strptime
+        try:
+            dt = datetime.fromisoformat(data['idx'])
+        except (TypeError, ValueError):
+            dt = datetime.strptime(data['idx'], "%Y-%m-%dT%H:%M:%S.%f")
+
+        if isinstance(data, dict):
+            # Convert 'idx' datetime from ISO 8601 to desired format
+            data['idx'] = '%04d-%02d-%02d %02d:%02d:%02d' % (dt.year, dt.month, dt.day, dt.hour, dt.minute, dt.second)
+            values = [str(data.get(key, '')) for key in self.key_lists[datatype]]
+            line = ','.join(values)
+        else:
+            line = data
+
+        year_month_dir, file_path = self._file_path(dt, datatype)
+        with self._lock:
+            file = self._handle(datatype, year_month_dir, file_path)
+            file.write(line + '\n')
+            self._pending += 1
+            if self._pending >= self.flush_every:
+                file.flush()
+                self._pending = 0
+            if self.fsync_interval and time.monotonic() - self._last_fsync >= self.fsync_interval:
+                self._sync()
+
+    def _sync(self):
+        for file_path, file in self._handles.values():
+            file.flush()
+            os.fsync(file.fileno())
+        self._pending = 0
+        self._last_fsync = time.monotonic()
+
+    def flush(self):
+        """Flush and fsync every open file."""
+        with self._lock:
+            self._sync()
+
+    def close(self):
+        """Flush, fsync and close every open file; the next save_data reopens them."""
+        with self._lock:
+            for datatype in list(self._handles):
+                self._close_handle(datatype)
+            self._pending = 0
+
+    def day_path(self, day, datatype='raw'):
+        """Path of the day file for a date, computed without touching the directories."""
+        return os.path.join(self.data_dir, self.directory_names[datatype], '%04d' % day.year,
+                            '%04d-%02d' % (day.year, day.month), '%04d-%02d-%02d.txt' % (day.year, day.month, day.day))
+
+    def query(self, start, end, fields=None, columns=False):
+        """
+        Observations with start <= timestamp < end from the raw store. start and end are
+        UTC epoch seconds or naive UTC datetimes, like the raw files.
+
+        Returns a lazy generator of {'timestamp': epoch, field: value} dicts (None for
+        missing values), or with columns=True a dict of arrays as read_day_file returns.
+        Only the day files in the range are touched, and the day index lets each read
+        seek to the first hour that's needed.
+        """
+        fields = tuple(fields) if fields else RAW_FIELDS
+        chunks = self._query_chunks(self._epoch(start), self._epoch(end), fields)
+        if not columns:
+            return self._query_rows(chunks, fields)
+
+        result = {'timestamp': array('q')}
+        result.update((name, array('d')) for name in fields)
+        for chunk in chunks:
+            for name, column in result.items():
+                column.extend(chunk[name])
+        return result
+
+    @staticmethod
+    def _query_rows(chunks, fields):
+        for chunk in chunks:
+            timestamps = chunk['timestamp']
+            values = [chunk[name] for name in fields]
+            for i in range(len(timestamps)):
+                row = {'timestamp': timestamps[i]}
+                for name, column in zip(fields, values):
+                    value = column[i]
+                    row[name] = None if value != value else value
+                yield row
+
+    def _query_chunks(self, start, end, fields):
+        with self._lock:
+            for file_path, file in self._handles.values():
+                file.flush()
+
+        day = datetime.utcfromtimestamp(start).date()
+        last_day = datetime.utcfromtimestamp(end - 1).date() if end > start else day - timedelta(days=1)
+        try:
+            while day <= last_day:
+                key = day.isoformat()
+                path = self.day_path(day)
+                day = day + timedelta(days=1)
+
+                entry = self.raw_index.entry(key, path)
+                if not entry or not entry["rows"] or entry["last"] < start or entry["first"] >= end:
+                    continue
+
+                # Never read past the last complete line, the newest one may still be half written
+                lo, hi = 0, entry["indexed"]
+                if entry["sorted"]:
+                    midnight = day_epoch(key)
+                    if start > midnight:
+                        hour = entry["hours"][(start - midnight) // 3600]
+                        lo = hour if hour is not None else entry["indexed"]
+                    if end < midnight + 86400:
+                        next_hour = (end - 1 - midnight) // 3600 + 1
+                        if next_hour < 24 and entry["hours"][next_hour] is not None:
+                            hi = entry["hours"][next_hour]
+
+                with open(path, 'rb') as file:
+                    file.seek(lo)
+                    data = file.read(max(hi - lo, 0))
+                chunk = parse_day_text(data.decode('utf-8', 'replace'), fields=fields)
+
+                timestamps = chunk['timestamp']
+                if entry["sorted"]:
+                    keep = range(bisect.bisect_left(timestamps, start), bisect.bisect_left(timestamps, end))
+                else:
+                    keep = [i for i, timestamp in enumerate(timestamps) if start <= timestamp < end]
+                if len(keep) != len(timestamps):
+                    chunk = {name: array(chunk[name].typecode, [chunk[name][i] for i in keep]) for name in ('timestamp',) + fields}
+                yield chunk
+        finally:
+            self.raw_index.save()
+
+    def columnar_path(self, year, month):
+        return os.path.join(self.columnar_dir, '%04d' % year, '%04d-%02d.col' % (year, month))
+
+    def raw_months(self):
+        """Return {(year, month): [day file paths]} for everything in the raw store."""
+        months = {}
+        pattern = os.path.join(self.data_dir, self.directory_names['raw'], '*', '*-*', '*.txt')
+        for path in glob.glob(pattern):
+            try:
+                day = datetime.strptime(os.path.basename(path)[:-4], '%Y-%m-%d')
+            except ValueError:
+                continue
+            months.setdefault((day.year, day.month), []).append(path)
+        return months
+
+    def convert_to_columnar(self, year=None, month=None, force=False):
+        """
+        Convert raw day files to monthly columnar files (see utils/columnar.py). Months
+        whose columnar file is newer than all of their day files are skipped unless
+        force is set. Returns [(year, month, rows), ...] for the months written.
+        """
+        converted = []
+        for (file_year, file_month), day_files in sorted(self.raw_months().items()):
+            if (year is not None and file_year != year) or (month is not None and file_month != month):
+                continue
+            path = self.columnar_path(file_year, file_month)
+            if not force and os.path.exists(path):
+                if os.path.getmtime(path) > max(os.path.getmtime(day_file) for day_file in day_files):
+                    continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            rows = convert_month(day_files, path, file_year, file_month)
+            converted.append((file_year, file_month, rows))
+        return converted
+
+    def open_columnar(self, year, month):
+        """Return the memory-mapped ColumnarMonth for a month, or None if it wasn't converted."""
+        path = self.columnar_path(year, month)
+        try:
+            mtime = os.path.getmtime(path)
+        except FileNotFoundError:
+            return None
+        cached = self._columnar.get((year, month))
+        if cached and cached[0] == mtime:
+            return cached[1]
+        if cached:
+            self._close_month(cached[1])
+        archive = ColumnarMonth(path)
+        self._columnar[(year, month)] = (mtime, archive)
+        return archive
+
+    def read_columnar(self, start, end, fields=None):
+        """
+        Yield zero-copy {name: memoryview} slices, one per month, covering start <= t < end.
+        start and end are UTC epoch seconds or naive UTC datetimes, like the raw files.
+        Months that have no columnar file are skipped.
+        """
+        start, end = self._epoch(start), self._epoch(end)
+        first, last = datetime.utcfromtimestamp(start), datetime.utcfromtimestamp(end - 1)
+        year, month = first.year, first.month
+        while (year, month) <= (last.year, last.month):
+            archive = self.open_columnar(year, month)
+            if archive is not None:
+                yield archive.slice(start, end, fields)
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+    def close_columnar(self):
+        for mtime, archive in self._columnar.values():
+            self._close_month(archive)
+        self._columnar = {}
+
+    @staticmethod
+    def _close_month(archive):
+        try:
+            archive.close()
+        except BufferError:
+            # Someone still holds a slice; the mapping is released once that goes away
+            pass
+
+    @staticmethod
+    def _epoch(value):
+        if isinstance(value, datetime):
+            return calendar.timegm(value.utctimetuple())
+        return int(value)
\ No newline at end of file
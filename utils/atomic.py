@@ -0,0 +1,68 @@
+import os
+import logging
+import tempfile
+from datetime import datetime
+from contextlib import contextmanager
+
+def fsync_directory(path):
+    """Make a rename in directory `path` durable. A no-op where directories can't be opened (Windows)."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+@contextmanager
+def atomic_open(path, mode='wb', fsync=True, encoding='utf-8'):
+    """
+    Open a temporary file next to `path` for writing; when the block completes it is
+    flushed, fsynced and renamed over `path`. Readers and uploaders see either the old
+    or the new file, never a partial one, and a crash mid-write leaves the old file
+    intact. When the block raises, the temporary file is removed and `path` is untouched.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode, encoding=None if 'b' in mode else encoding) as file:
+            # mkstemp creates the file as 0600, keep the permissions the published file had
+            try:
+                os.chmod(temp_path, os.stat(path).st_mode & 0o777)
+            except FileNotFoundError:
+                os.chmod(temp_path, 0o644)
+            yield file
+            file.flush()
+            if fsync:
+                os.fsync(file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    if fsync:
+        fsync_directory(directory)
+
+def atomic_write(path, data, fsync=True):
+    """Atomically replace `path` with data (bytes or str)."""
+    with atomic_open(path, 'wb' if isinstance(data, (bytes, bytearray, memoryview)) else 'w', fsync=fsync) as file:
+        file.write(data)
+
+def move_aside(path, reason=None):
+    """
+    Rename an unreadable file to <path>.corrupt-<timestamp> so it can be inspected or
+    recovered, instead of being overwritten by the next write. Returns the new path.
+    """
+    target = "{}.corrupt-{}".format(path, datetime.now().strftime('%Y%m%d%H%M%S'))
+    try:
+        os.replace(path, target)
+    except OSError as e:
+        logging.error("Could not move corrupt file {} aside: {}".format(path, e))
+        return None
+    logging.error("Moved corrupt file {} to {}{}".format(path, target, ": {}".format(reason) if reason else ""))
+    return target
@@ -0,0 +1,43 @@
+import time
+import argparse
+from data_processing import process_weather_data
+
+# A typical report from a GW1000/WS2900 gateway
+SAMPLE = {
+    'PASSKEY': 'B1A2C3D4E5F6', 'stationtype': 'GW1000B_V1.7.3', 'dateutc': '2026-10-17 10:00:00',
+    'interval': '60', 'tempinf': '70.3', 'humidityin': '51', 'baromrelin': '30.012', 'baromabsin': '29.897',
+    'tempf': '60.1', 'humidity': '81', 'winddir': '183', 'windspeedmph': '5.6', 'windgustmph': '10.3',
+    'maxdailygust': '14.5', 'solarradiation': '100.22', 'uv': '2', 'rainratein': '0.012',
+    'eventrainin': '0.087', 'hourlyrainin': '0.012', 'dailyrainin': '0.118', 'weeklyrainin': '0.531',
+    'monthlyrainin': '1.272', 'yearlyrainin': '20.965', 'wh65batt': '0', 'freq': '868M', 'model': 'WS2900_V2.01.18',
+}
+
+def bench(fn, repeat):
+    """CPU seconds per call, best of three runs."""
+    best = None
+    for _ in range(3):
+        started = time.process_time()
+        for _ in range(repeat):
+            fn()
+        elapsed = (time.process_time() - started) / repeat
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the CPU cost of normalising one Ecowitt report.")
+    parser.add_argument('-n', type=int, default=20000, help='Calls per run')
+    args = parser.parse_args()
+
+    print("process_weather_data: {:.1f} us/request".format(bench(lambda: process_weather_data(SAMPLE), args.n) * 1e6))
+
+    try:
+        from observation import Observation
+    except ImportError:
+        return
+    observation = Observation.from_ecowitt(SAMPLE)
+    projections = (observation.to_raw, observation.to_custom, observation.to_xml, observation.to_db, observation.to_formatted)
+    print("  Observation.from_ecowitt: {:.1f} us".format(bench(lambda: Observation.from_ecowitt(SAMPLE), args.n) * 1e6))
+    print("  all five projections: {:.1f} us".format(bench(lambda: [projection() for projection in projections], args.n) * 1e6))
+
+if __name__ == "__main__":
+    main()
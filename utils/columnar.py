@@ -0,0 +1,161 @@
+import sys
+import mmap
+import struct
+import bisect
+import calendar
+from array import array
+
+from utils.raw_reader import RAW_FIELDS, read_day_file
+from utils.atomic import atomic_open
+
+MAGIC = b'PYWSCOL1'
+VERSION = 1
+
+# magic, byte order, version, field count, year, month, row count, first and last timestamp
+HEADER = struct.Struct('<8s2sHHHHxxQqq')
+FIELD_NAME_SIZE = 16
+# Row number of the first observation on day 1..31 of the month, plus the row count
+DAY_INDEX = struct.Struct('<32Q')
+
+BYTE_ORDER = b'LE' if sys.byteorder == 'little' else b'BE'
+
+def _data_offset(field_count):
+    offset = HEADER.size + FIELD_NAME_SIZE * field_count + DAY_INDEX.size
+    return (offset + 7) // 8 * 8
+
+def month_start(year, month):
+    """UTC epoch of the first second of a month."""
+    return calendar.timegm((year, month, 1, 0, 0, 0))
+
+def write_month(path, year, month, timestamps, columns, fields=RAW_FIELDS):
+    """
+    Write one month of observations as a columnar file: a small header with the field
+    names and a per-day row index, followed by the int64 timestamp column and one
+    float64 column per field. Timestamps must be sorted. The file is written under a
+    temporary name and renamed into place, so readers never map a partial file.
+    """
+    count = len(timestamps)
+    start = month_start(year, month)
+    day_rows = []
+    row = 0
+    for day in range(32):
+        row = bisect.bisect_left(timestamps, start + day * 86400, row)
+        day_rows.append(row)
+
+    header = HEADER.pack(MAGIC, BYTE_ORDER, VERSION, len(fields), year, month, count,
+                         timestamps[0] if count else 0, timestamps[-1] if count else 0)
+    names = b''.join(name.encode('ascii').ljust(FIELD_NAME_SIZE, b'\0') for name in fields)
+    preamble = (header + names + DAY_INDEX.pack(*day_rows)).ljust(_data_offset(len(fields)), b'\0')
+
+    with atomic_open(path, 'wb') as file:
+        file.write(preamble)
+        file.write(array('q', timestamps).tobytes())
+        for name in fields:
+            file.write(array('d', columns[name]).tobytes())
+    return count
+
+def convert_month(day_files, path, year, month):
+    """Read the raw day files of one month and write them as a columnar file, returns the row count."""
+    timestamps = array('q')
+    columns = {name: array('d') for name in RAW_FIELDS}
+    for day_file in sorted(day_files):
+        day = read_day_file(day_file)
+        timestamps.extend(day['timestamp'])
+        for name in RAW_FIELDS:
+            columns[name].extend(day[name])
+
+    # Day files are in order already; only sort (and drop duplicates) when they aren't
+    if any(timestamps[i] >= timestamps[i + 1] for i in range(len(timestamps) - 1)):
+        order = sorted(range(len(timestamps)), key=timestamps.__getitem__)
+        order = [i for n, i in enumerate(order) if n == 0 or timestamps[i] != timestamps[order[n - 1]]]
+        timestamps = array('q', [timestamps[i] for i in order])
+        columns = {name: array('d', [column[i] for i in order]) for name, column in columns.items()}
+
+    return write_month(path, year, month, timestamps, columns)
+
+class ColumnarMonth:
+    """
+    Read-only, memory-mapped view of one columnar month file.
+
+    Columns are exposed as memoryviews straight onto the mapping, so slicing a time
+    range copies nothing; only the pages that are actually read get loaded. Slices keep
+    the mapping alive, release them before calling close().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            self.mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mm)
+
+        self.timestamps = None
+        self.columns = {}
+
+        magic, byte_order, version, field_count, self.year, self.month, self.count, self.first, self.last = HEADER.unpack_from(self.mm)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("Not a columnar weather file: {}".format(path))
+        if byte_order != BYTE_ORDER:
+            self.close()
+            raise ValueError("{} was written on a machine with a different byte order".format(path))
+
+        offset = HEADER.size
+        self.fields = tuple(self.mm[offset + i * FIELD_NAME_SIZE:offset + (i + 1) * FIELD_NAME_SIZE].rstrip(b'\0').decode('ascii')
+                            for i in range(field_count))
+        self.day_rows = DAY_INDEX.unpack_from(self.mm, offset + FIELD_NAME_SIZE * field_count)
+
+        data = _data_offset(field_count)
+        size = self.count * 8
+        self.timestamps = self.view[data:data + size].cast('q')
+        self.columns = {name: self.view[data + (i + 1) * size:data + (i + 2) * size].cast('d')
+                        for i, name in enumerate(self.fields)}
+
+    def rows(self, start=None, end=None):
+        """Return the row range (lo, hi) with start <= timestamp < end, narrowed by the day index first."""
+        lo, hi = 0, self.count
+        month = month_start(self.year, self.month)
+        if start is not None:
+            day = min(max((start - month) // 86400, 0), 31)
+            lo = bisect.bisect_left(self.timestamps, start, self.day_rows[day], self.count)
+        if end is not None:
+            day = min(max((end - month) // 86400 + 1, 0), 31)
+            hi = bisect.bisect_left(self.timestamps, end, lo, max(self.day_rows[day], lo))
+        return lo, hi
+
+    def slice(self, start=None, end=None, fields=None):
+        """Zero-copy slice of a time range (UTC epoch seconds, end exclusive) as {name: memoryview}."""
+        lo, hi = self.rows(start, end)
+        result = {'timestamp': self.timestamps[lo:hi]}
+        for name in fields or self.fields:
+            result[name] = self.columns[name][lo:hi]
+        return result
+
+    def close(self):
+        for view in self.columns.values():
+            view.release()
+        if self.timestamps is not None:
+            self.timestamps.release()
+        self.view.release()
+        self.mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def main():
+    import argparse
+    from globals import DATA_STORE
+
+    parser = argparse.ArgumentParser(description="Convert raw day files to monthly columnar archives.")
+    parser.add_argument('--year', type=int, help='Only convert this year')
+    parser.add_argument('--month', type=int, help='Only convert this month')
+    parser.add_argument('--force', action='store_true', help='Rewrite months that are already up to date')
+    args = parser.parse_args()
+
+    for year, month, rows in DATA_STORE.convert_to_columnar(args.year, args.month, args.force):
+        print("{:04d}-{:02d}: {} rows -> {}".format(year, month, rows, DATA_STORE.columnar_path(year, month)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Array versions of the functions in utils/conversions.py, for recomputing derived fields
+over long stretches of history (e.g. columns from CustomWeatherStore.query or the
+columnar archive). Inputs are anything numpy.asarray accepts; missing values are NaN
+and stay NaN. Branches of the scalar functions are applied per element with masks, so
+results match the scalar versions up to floating point rounding (math.fsum in
+heat_index, round() vs numpy.round on exact ties).
+
+numpy is optional: importing this module works without it, calling a function doesn't.
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def _array(value):
+    if np is None:
+        raise ImportError("numpy is required for utils.conversions_np")
+    return np.asarray(value, dtype=np.float64)
+
+def scale(value, factor):
+    """Multiply every element by factor."""
+    return _array(value) * factor
+
+def f_to_c(fahrenheit):
+    """Convert temperature from Fahrenheit to Celsius, rounded to 2 decimals."""
+    return np.round((_array(fahrenheit) - 32) * 5 / 9, 2)
+
+def inHg_to_hPa(inHg):
+    """Convert pressure from inches of mercury (inHg) to hectopascals (hPa)."""
+    return _array(inHg) * 33.8639
+
+def mph_to_kph(mph):
+    """Convert speed from mph to km/h. Unlike the scalar version, missing values stay NaN instead of 0."""
+    return _array(mph) * 1.60934
+
+def inches_to_mm(inches):
+    """Convert rainfall from inches to millimeters."""
+    return _array(inches) * 25.4
+
+def temp_f(c):
+    """Convert temperature from Celsius to Fahrenheit."""
+    return (_array(c) * 9.0 / 5.0) + 32.0
+
+def wind_kmph(ms):
+    """Convert wind from metres per second to kilometres per hour."""
+    return _array(ms) * 3.6
+
+def get_dew_point_c(t_air_c, rel_humidity):
+    """Dew point in degrees Celsius. A relative humidity of 0 or less gives NaN (the scalar version raises)."""
+    A = 17.27
+    B = 237.7
+    t_air_c = _array(t_air_c)
+    rel_humidity = _array(rel_humidity)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        alpha = ((A * t_air_c) / (B + t_air_c)) + np.log(np.where(rel_humidity > 0, rel_humidity, np.nan) / 100.0)
+        return (B * alpha) / (A - alpha)
+
+def dew_point(temp, hum):
+    """Compute dew point, same formula as get_dew_point_c."""
+    return get_dew_point_c(temp, hum)
+
+def wind_chill(temp, wind):
+    """
+    Wind chill as the effective scalar wind_chill computes it (the second definition in
+    conversions.py, which takes wind in m/s): the air temperature is returned where
+    the wind is at most 4.8 km/h or the temperature is above 10 C.
+    """
+    temp = _array(temp)
+    wind_kph = _array(wind) * 3.6
+    with np.errstate(invalid='ignore'):
+        chill = np.minimum(13.12 + (temp * 0.6215) + (((0.3965 * temp) - 11.37) * (wind_kph ** 0.16)), temp)
+        return np.where((wind_kph <= 4.8) | (temp > 10.0), temp, chill)
+
+def heat_index(temperature, humidity):
+    """Heat index in Celsius, NOAA simplified formula or the Rothfusz regression where the average reaches 80 F."""
+    T = _array(temperature)
+    H = _array(humidity)
+
+    c1 = -8.78469475556
+    c2 = 1.61139411
+    c3 = 2.33854883889
+    c4 = -0.14611605
+    c5 = -0.012308094
+    c6 = -0.0164248277778
+    c7 = 0.002211732
+    c8 = 0.00072546
+    c9 = -0.000003582
+
+    Tf = (T * 9/5) + 32
+    HIf = 0.5 * (Tf + 61.0 + (Tf - 68.0) * 1.2 + H * 0.094)
+    Tavg = (HIf + Tf)/2
+
+    rothfusz = (c1 + c2 * T + c3 * H + c4 * T * H + c5 * T**2 + c6 * H**2
+                + c7 * T**2 * H + c8 * T * H**2 + c9 * T**2 * H**2)
+    with np.errstate(invalid='ignore'):
+        return np.where(Tavg >= 80, rothfusz, (HIf - 32) * 5/9)
+
+def feels_like(temperature, humidity, wind_speed):
+    """
+    "Feels like" temperature rounded to 1 decimal: wind chill where T <= 10 C and the
+    wind is above 4.8, heat index where T >= 26.7 C, the temperature otherwise.
+    """
+    T = _array(temperature)
+    wind_speed = _array(wind_speed)
+    with np.errstate(invalid='ignore'):
+        cold = (T <= 10) & (wind_speed > 4.8)
+        hot = ~cold & (T >= 26.7)
+        FL = np.where(cold, wind_chill(T, wind_speed), np.where(hot, heat_index(T, humidity), T))
+    return np.round(FL, 1)
+
+def apparent_temp(temp, rh, wind):
+    """Compute apparent temperature (real feel), BOM formula."""
+    temp = _array(temp)
+    vap_press = (_array(rh) / 100.0) * 6.105 * np.exp(17.27 * temp / (237.7 + temp))
+    return temp + (0.33 * vap_press) - (0.70 * _array(wind)) - 4.00
+
+def cloud_base(temp, hum):
+    """Calculate cumulus cloud base in metres."""
+    temp = _array(temp)
+    return (temp - dew_point(temp, hum)) * 125.0
@@ -0,0 +1,209 @@
+import json
+import bisect
+import logging
+import threading
+from array import array
+from datetime import datetime, timedelta
+
+from utils.atomic import atomic_write, move_aside
+
+_EPOCH = datetime(1970, 1, 1)
+
+def _epoch_us(moment):
+    """Exact microseconds since the epoch of an aware datetime (no float rounding)."""
+    return (moment.replace(tzinfo=None) - moment.utcoffset() - _EPOCH) // timedelta(microseconds=1)
+
+class MetricSeries:
+    """
+    One custom.json metric as parallel, time-sorted arrays of epoch milliseconds and values.
+    Evicted points are skipped with a start offset and only compacted away once they make
+    up half the arrays, so both appending and evicting cost O(points touched).
+    """
+
+    __slots__ = ('id', 'name', 'index', 'unit', 'times', 'values', 'fragments', 'start')
+
+    def __init__(self, id, name, index, unit):
+        self.id = id
+        self.name = name
+        self.index = index
+        self.unit = unit
+        self.times = array('q')
+        self.values = array('d')
+        self.fragments = []  # Encoded [ms, value] per point, None until first written
+        self.start = 0
+
+    def __len__(self):
+        return len(self.times) - self.start
+
+    def append(self, timestamp_ms, value):
+        if len(self) and timestamp_ms <= self.times[-1]:
+            position = bisect.bisect_left(self.times, timestamp_ms, self.start)
+            if self.times[position] == timestamp_ms:
+                # The same observation again (a retried publish), replace it
+                self.values[position] = value
+                self.fragments[position] = None
+                return
+            # Out of order (rare), keep the arrays sorted
+            self.times.insert(position, timestamp_ms)
+            self.values.insert(position, value)
+            self.fragments.insert(position, None)
+        else:
+            self.times.append(timestamp_ms)
+            self.values.append(value)
+            self.fragments.append(None)
+
+    def evict(self, threshold_ms):
+        """Drop points older than threshold_ms, returns the number dropped."""
+        start = bisect.bisect_left(self.times, threshold_ms, self.start)
+        evicted = start - self.start
+        self.start = start
+        if start > 256 and start * 2 > len(self.times):
+            del self.times[:start]
+            del self.values[:start]
+            del self.fragments[:start]
+            self.start = 0
+        return evicted
+
+    def bounds(self, start_ms=None, end_ms=None):
+        """Array positions of the points between start_ms and end_ms (inclusive)."""
+        first = self.start if start_ms is None else bisect.bisect_left(self.times, start_ms, self.start)
+        last = len(self.times) if end_ms is None else bisect.bisect_right(self.times, end_ms, first)
+        return first, last
+
+    def to_dict(self, start_ms=None, end_ms=None):
+        first, last = self.bounds(start_ms, end_ms)
+        return {
+            "id": self.id,
+            "name": self.name,
+            "data": [[self.times[i], self.values[i]] for i in range(first, last)],
+            "index": self.index,
+            "unit": self.unit,
+        }
+
+    def encode(self, serializer):
+        """Compact JSON of the metric; only points that weren't written before are encoded."""
+        fragments = self.fragments
+        for i in range(self.start, len(fragments)):
+            if fragments[i] is None:
+                fragments[i] = serializer.compact([self.times[i], self.values[i]])
+        head = serializer.compact({"id": self.id, "name": self.name})[:-1]
+        tail = serializer.compact({"index": self.index, "unit": self.unit})[1:]
+        return head + b',"data":[' + b','.join(fragments[self.start:]) + b'],' + tail
+
+class CustomFeed:
+    """
+    In-memory copy of custom.json: one MetricSeries per metric, limited to `span`.
+    Loaded from the file once; after that a new observation costs O(new + evicted
+    points) instead of re-reading and re-checking the whole history.
+    """
+
+    def __init__(self, path, metrics, span):
+        self.path = path
+        self.span = span
+        self.series = {id: MetricSeries(id, name, index, unit) for index, (id, name, unit) in enumerate(metrics)}
+        self.loaded = False
+        self.version = 0  # Bumped on every change, for caches built from the feed
+        self.saved_version = None
+        self.lock = threading.RLock()
+
+    def _add_value(self, series, timestamp_ms, value):
+        try:
+            series.append(timestamp_ms, float(value))  # Convert string to float for measurements
+        except ValueError:
+            logging.error("Invalid value for {}: {}; unable to convert to float.".format(series.id, value))
+        except Exception as e:
+            logging.error("Unexpected error when processing {}: {}; error: {}".format(series.id, value, str(e)))
+
+    def load(self):
+        """Read the existing file into memory, once."""
+        with self.lock:
+            if self.loaded:
+                return
+            self.loaded = True
+            try:
+                with open(self.path, 'r') as f:
+                    existing_data = json.load(f)
+            except FileNotFoundError:
+                existing_data = []
+            except ValueError as e:
+                logging.error("JSON decoding error while loading existing data: {}".format(e))
+                move_aside(self.path, e)
+                existing_data = []
+            except Exception as e:
+                logging.error("An error occurred while reading JSON: {}".format(e))
+                existing_data = []
+
+            for metric in existing_data:
+                series = self.series.get(metric.get("id")) if isinstance(metric, dict) else None
+                if series is None or "data" not in metric:
+                    continue
+                for timestamp_ms, value in sorted(metric["data"], key=lambda point: point[0]):
+                    self._add_value(series, int(timestamp_ms), value)
+            self.version += 1
+
+    def export_state(self):
+        """{metric_id: (times, values)} copies of the live points, for a state snapshot."""
+        with self.lock:
+            self.load()
+            return {series.id: (series.times[series.start:], series.values[series.start:]) for series in self.series.values()}
+
+    def restore_state(self, state):
+        """Take over the points from export_state instead of reading the file."""
+        with self.lock:
+            for series in self.series.values():
+                times, values = state.get(series.id, (array('q'), array('d')))
+                series.times, series.values = array('q', times), array('d', values)
+                series.fragments = [None] * len(series.times)
+                series.start = 0
+            self.loaded = True
+            self.version += 1
+
+    def _threshold_ms(self, now):
+        """First epoch millisecond that is not older than now - span."""
+        return -(-_epoch_us(now - self.span) // 1000)
+
+    def evict(self, now):
+        """Drop points older than now - span (now is an aware datetime). Returns the number evicted."""
+        with self.lock:
+            self.load()
+            threshold_ms = self._threshold_ms(now)
+            evicted = sum(series.evict(threshold_ms) for series in self.series.values())
+            if evicted:
+                self.version += 1
+            return evicted
+
+    def add(self, timestamp_ms, measurements, now):
+        """Evict expired points and add the measurements ({metric_id: value}) at timestamp_ms, if it's within the span."""
+        with self.lock:
+            self.evict(now)
+            if timestamp_ms < self._threshold_ms(now):
+                return False
+            for key, value in measurements.items():
+                series = self.series.get(key)
+                if series is not None:
+                    self._add_value(series, timestamp_ms, value)
+            self.version += 1
+            return True
+
+    def data(self, start_ms=None, end_ms=None, ids=None):
+        """The metrics in custom.json layout, optionally limited to a time range and metric ids."""
+        with self.lock:
+            self.load()
+            return [series.to_dict(start_ms, end_ms) for series in self.series.values() if ids is None or series.id in ids]
+
+    def encode(self, serializer):
+        """The whole feed in the serializer's layout; the compact layout reuses the encoded points."""
+        with self.lock:
+            self.load()
+            if serializer.indent is not None:
+                return serializer.dumps(self.data())
+            return b'[' + b','.join(series.encode(serializer) for series in self.series.values()) + b']'
+
+    def save(self, serializer):
+        """Write the file if the feed changed since the last write. Returns True if it was written."""
+        with self.lock:
+            if self.version == self.saved_version:
+                return False
+            atomic_write(self.path, self.encode(serializer))
+            self.saved_version = self.version
+            return True
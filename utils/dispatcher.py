@@ -0,0 +1,141 @@
+import time
+import queue
+import logging
+import threading
+
+_STOP = object()
+
+class Sink:
+    """A named consumer with its own bounded queue, worker thread and counters."""
+
+    def __init__(self, name, handler, maxsize):
+        self.name = name
+        self.handler = handler
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.thread = None
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.high_water = 0
+        self.last_latency = None
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "maxsize": self.queue.maxsize,
+            "high_water": self.high_water,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "last_latency": self.last_latency,
+            "max_latency": self.max_latency,
+            "avg_latency": self.total_latency / self.processed if self.processed else None,
+        }
+
+class ObservationDispatcher:
+    """
+    Fan incoming observations out to independent sinks.
+
+    Every sink gets its own bounded queue and worker thread, so a slow sink (FTP, the
+    SSH tunnel) only delays itself. When a queue is full the oldest pending observation
+    for that sink is dropped and counted, the request path never blocks.
+    """
+
+    def __init__(self, maxsize=500):
+        self.maxsize = maxsize
+        self.sinks = {}
+        self.lock = threading.Lock()
+        self.running = False
+
+    def register(self, name, handler, maxsize=None):
+        """Register a sink; handler(observation) is called on the sink's worker thread."""
+        if name in self.sinks:
+            raise ValueError("Sink already registered: " + name)
+        sink = Sink(name, handler, maxsize or self.maxsize)
+        self.sinks[name] = sink
+        if self.running:
+            self._start_sink(sink)
+        return sink
+
+    def start(self):
+        with self.lock:
+            if self.running:
+                return
+            self.running = True
+            for sink in self.sinks.values():
+                self._start_sink(sink)
+        logging.info("Dispatcher started with sinks: {}".format(", ".join(self.sinks)))
+
+    def _start_sink(self, sink):
+        sink.thread = threading.Thread(target=self._worker, args=(sink,), name="sink-" + sink.name, daemon=True)
+        sink.thread.start()
+
+    def dispatch(self, observation):
+        """Enqueue an observation for every sink without blocking."""
+        if not self.running:
+            logging.warning("Dispatcher is not running, observation discarded.")
+            return False
+
+        enqueued_at = time.monotonic()
+        for sink in self.sinks.values():
+            item = (enqueued_at, observation)
+            while True:
+                try:
+                    sink.queue.put_nowait(item)
+                    break
+                except queue.Full:
+                    # Backpressure: make room by dropping the oldest pending observation
+                    try:
+                        sink.queue.get_nowait()
+                        sink.dropped += 1
+                        logging.warning("Sink '{}' backlog full ({}), dropped oldest observation.".format(sink.name, sink.queue.maxsize))
+                    except queue.Empty:
+                        pass
+            sink.enqueued += 1
+            sink.high_water = max(sink.high_water, sink.queue.qsize())
+        return True
+
+    def _worker(self, sink):
+        while True:
+            item = sink.queue.get()
+            if item is _STOP:
+                break
+            enqueued_at, observation = item
+            try:
+                sink.handler(observation)
+                sink.processed += 1
+            except Exception as e:
+                sink.failed += 1
+                logging.error("Sink '{}' failed: {}".format(sink.name, e), exc_info=True)
+            latency = time.monotonic() - enqueued_at
+            sink.last_latency = latency
+            sink.max_latency = max(sink.max_latency, latency)
+            sink.total_latency += latency
+
+    def drain(self, timeout=30):
+        """Stop accepting observations and wait for every sink to finish its backlog."""
+        with self.lock:
+            if not self.running:
+                return
+            self.running = False
+
+        deadline = time.monotonic() + timeout
+        for sink in self.sinks.values():
+            try:
+                sink.queue.put(_STOP, timeout=max(0, deadline - time.monotonic()))
+            except queue.Full:
+                logging.error("Sink '{}' did not accept stop signal in time.".format(sink.name))
+
+        for sink in self.sinks.values():
+            if sink.thread:
+                sink.thread.join(max(0, deadline - time.monotonic()))
+                if sink.thread.is_alive():
+                    logging.error("Sink '{}' still busy after drain timeout, {} observations pending.".format(sink.name, sink.queue.qsize()))
+        logging.info("Dispatcher drained.")
+
+    def stats(self):
+        return {name: sink.stats() for name, sink in self.sinks.items()}
@@ -0,0 +1,137 @@
+import pickle
+import logging
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from utils.rolling_window import WindowRecord
+
+# Resolution name -> bucket size in hours (must divide 24)
+RESOLUTIONS = {
+    "1h": 1,
+    "6h": 6,
+    "1d": 24,
+}
+
+# Fields that keep the maximum of a bucket instead of the mean
+MAX_FIELDS = ("windgust",)
+
+class Downsampler:
+    """
+    Incremental, multi-resolution aggregator for rolling window records.
+
+    Every bucket keeps a running [sum, count, max, first value] per field, so adding an
+    observation costs O(resolutions * fields) and emitting a resolution never rescans
+    history. Numeric fields are averaged (rounded to 2 decimals), fields in MAX_FIELDS
+    keep their maximum and non-numeric fields keep their first non-None value. As with
+    statistics.mean, the mean of integers that divides exactly stays an integer.
+
+    A bucket is kept until it ends before now - span, so the oldest one can still hold
+    observations (at most one bucket length) that the rolling window has already evicted.
+    """
+
+    def __init__(self, span, resolutions=RESOLUTIONS):
+        self.span = span
+        self.resolutions = dict(resolutions)
+        self.buckets = {name: OrderedDict() for name in self.resolutions}
+        self.seeded = False
+        self.version = 0  # Bumped on every change, so unchanged aggregates needn't be checkpointed
+        self.lock = threading.Lock()
+
+    def seed(self, window):
+        """Build the accumulators from the records of a RollingWindow, once."""
+        with self.lock:
+            if self.seeded:
+                return
+            self.seeded = True
+            for record in window.snapshot():
+                self._add(record)
+            self.version += 1
+
+    def export_state(self):
+        """The accumulators as bytes, for a state snapshot (None when not seeded yet)."""
+        with self.lock:
+            return pickle.dumps(self.buckets, pickle.HIGHEST_PROTOCOL) if self.seeded else None
+
+    def restore_state(self, state):
+        """Take over the accumulators from export_state instead of seeding from the window."""
+        with self.lock:
+            self.buckets = pickle.loads(state)
+            self.seeded = True
+            self.version += 1
+
+    def add(self, record, now=None):
+        """Add a WindowRecord (or a {timestamp_str: values} dict) to every resolution."""
+        with self.lock:
+            self._add(record)
+            if now is not None:
+                self._evict(now)
+            self.version += 1
+
+    def _add(self, record):
+        if not isinstance(record, WindowRecord):
+            for item in self._records(record):
+                self._add(item)
+            return
+
+        dt = record.time
+        for name, hours in self.resolutions.items():
+            start = dt.replace(hour=(dt.hour // hours) * hours, minute=0, second=0, microsecond=0)
+            buckets = self.buckets[name]
+            bucket = buckets.get(start)
+            if bucket is None:
+                bucket = buckets[start] = {}
+                if len(buckets) > 1 and start < next(reversed(buckets)):
+                    self.buckets[name] = OrderedDict(sorted(buckets.items()))
+            for key, value in record.items():
+                acc = bucket.get(key)
+                if acc is None:
+                    # The sum starts as an int and only becomes a float with the first float value
+                    acc = bucket[key] = [0, 0, None, None]
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    acc[0] += value
+                    acc[1] += 1
+                    if acc[2] is None or value > acc[2]:
+                        acc[2] = value
+                elif acc[3] is None and value is not None:
+                    acc[3] = value
+
+    @staticmethod
+    def _records(record):
+        for timestamp_str, values in record.items():
+            try:
+                yield WindowRecord(timestamp_str, values.keys(), values.values())
+            except ValueError as e:
+                logging.warning(f"Skipping record with bad timestamp: {timestamp_str} ({e})")
+
+    def _evict(self, now):
+        cutoff = now - self.span
+        for name, buckets in self.buckets.items():
+            length = timedelta(hours=self.resolutions[name])
+            while buckets and next(iter(buckets)) + length <= cutoff:
+                buckets.popitem(last=False)
+                self.version += 1
+
+    def evict(self, now):
+        """Drop buckets that end at or before now - span."""
+        with self.lock:
+            self._evict(now)
+
+    def emit(self, resolution="6h"):
+        """Return the aggregated records for a resolution as [{bucket_key: values}, ...]."""
+        with self.lock:
+            compressed_data = []
+            for start, bucket in self.buckets[resolution].items():
+                avg_record = {}
+                for key, (total, count, maximum, first) in bucket.items():
+                    if count:
+                        if key.lower() in MAX_FIELDS:
+                            avg_record[key] = maximum
+                        elif isinstance(total, int) and total % count == 0:
+                            avg_record[key] = total // count
+                        else:
+                            avg_record[key] = round(total / count, 2)
+                    else:
+                        avg_record[key] = first
+                compressed_data.append({start.strftime("%Y-%m-%d %H:%M"): avg_record})
+            return compressed_data
@@ -0,0 +1,92 @@
+import gzip
+import math
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+class CachedFeed:
+    """A serialised feed with its ETag; the gzip encoding is made on first request and kept."""
+
+    __slots__ = ('version', 'body', 'mimetype', 'etag', '_gzipped')
+
+    def __init__(self, version, body, mimetype):
+        self.version = version
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(body).hexdigest()
+        self._gzipped = None
+
+    def gzipped(self):
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, compresslevel=6, mtime=0)
+        return self._gzipped
+
+class FeedCache:
+    """
+    Pre-serialised feeds keyed on (feed, range, fields). An entry is reused as long as the
+    version of its source (a rolling window's change counter, a file's mtime) is unchanged.
+    The least recently used entries are dropped beyond max_entries, since every distinct
+    query gets its own entry.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version, build):
+        """Return the CachedFeed for key, calling build() -> (body_bytes, mimetype) when it's missing or stale."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.version == version:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        body, mimetype = build()
+        entry = CachedFeed(version, body, mimetype)
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def stats(self):
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+def parse_time(value, timezone):
+    """
+    Parse a ?from=/?to= bound: epoch seconds (or milliseconds, as used in custom.json) or
+    an ISO 8601 date/time, taken as local time when it has no offset. Returns epoch seconds.
+    Raises ValueError for anything else, including nan/inf and times a datetime can't hold.
+    """
+    if value is None or value == '':
+        return None
+    try:
+        try:
+            epoch = float(value)
+        except ValueError:
+            moment = datetime.fromisoformat(value)
+            if moment.tzinfo is None:
+                moment = timezone.localize(moment)
+            epoch = moment.timestamp()
+        else:
+            if not math.isfinite(epoch):
+                raise ValueError("Not a finite time: {}".format(value))
+            epoch = epoch / 1000 if epoch > 1e11 else epoch
+        # The feeds convert it back to local time, make sure that works
+        datetime.fromtimestamp(epoch, timezone)
+    except (OverflowError, OSError) as e:
+        raise ValueError("Time out of range: {}".format(value)) from e
+    return epoch
+
+def parse_fields(value):
+    """Parse ?fields=a,b into a frozenset, or None when all fields are wanted."""
+    if not value:
+        return None
+    return frozenset(field.strip() for field in value.split(',') if field.strip()) or None
@@ -0,0 +1,186 @@
+import logging
+import threading
+from collections import deque
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+
+class Endpoint:
+    """A downstream receiver of the original station form, with its retry queue and counters."""
+
+    def __init__(self, name, url, method='POST', retry_size=100):
+        self.name = name
+        self.url = url
+        self.method = method
+        self.retry = deque(maxlen=retry_size)  # (sequence, form), oldest first
+        self.lock = threading.Lock()  # One request at a time, so forms arrive in order
+        self.sequence = 0  # Arrival number of the last form
+        self.delivered = 0  # Arrival number of the newest form delivered
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.dropped = 0
+        self.stale = 0
+        self.last_error = None
+
+    def stats(self):
+        return {
+            "url": urlsplit(self.url).netloc,
+            "method": self.method,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "dropped": self.dropped,
+            "stale": self.stale,
+            "pending_retries": len(self.retry),
+            "last_error": self.last_error,
+        }
+
+def parse_endpoints(hass_url, forward_urls, retry_size=100):
+    """
+    Endpoints for HASS_URL plus a comma separated FORWARD_URLS list. Entries are POSTed
+    as a form, unless prefixed with "GET ", in which case the form is sent as query
+    parameters (Weather Underground / PWS style uploaders).
+    """
+    endpoints = []
+    if hass_url:
+        endpoints.append(Endpoint('hass', hass_url, retry_size=retry_size))
+    for entry in (forward_urls or '').split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        method, _, url = entry.partition(' ')
+        if not url:
+            method, url = 'POST', entry
+        method = method.upper()
+        if method not in ('GET', 'POST'):
+            logging.error("Ignoring forward URL with unsupported method: {}".format(entry))
+            continue
+        name = urlsplit(url).netloc or url
+        if any(endpoint.name == name for endpoint in endpoints):
+            name = "{}-{}".format(name, len(endpoints))
+        endpoints.append(Endpoint(name, url, method, retry_size))
+    return endpoints
+
+class Forwarder:
+    """
+    Forwards the original station form to downstream endpoints over one keep-alive
+    session with connect/read timeouts. send() is meant to run on a dispatcher sink
+    thread per endpoint, so endpoints are served in parallel and never block ingestion.
+    Failed forwards go to the endpoint's bounded retry queue (oldest dropped when full),
+    which a background thread retries every retry_interval seconds, oldest first.
+
+    Receivers like Home Assistant take every form as the current state, so a form is never
+    sent after a newer one was delivered: once a newer form gets through, the older ones
+    still queued are dropped as stale instead of rolling the readings back.
+    """
+
+    def __init__(self, endpoints, timeout=5, retry_interval=60, verify=False):
+        self.endpoints = {endpoint.name: endpoint for endpoint in endpoints}
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.verify = verify
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max(1, len(endpoints)), pool_maxsize=4)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def _request(self, endpoint, form):
+        try:
+            if endpoint.method == 'GET':
+                response = self.session.get(endpoint.url, params=form, timeout=self.timeout, verify=self.verify)
+            else:
+                response = self.session.post(endpoint.url, data=form, timeout=self.timeout, verify=self.verify)
+        except requests.RequestException as e:
+            # Only the exception type, the message repeats the URL and GET endpoints carry credentials in it
+            endpoint.last_error = type(e).__name__
+            return False
+        if response.status_code >= 300:
+            endpoint.last_error = "HTTP {}".format(response.status_code)
+            return False
+        return True
+
+    def _queue_retry(self, endpoint, sequence, form):
+        with self.lock:
+            if len(endpoint.retry) == endpoint.retry.maxlen:
+                endpoint.dropped += 1
+                logging.warning("Retry queue for '{}' full, dropped oldest form.".format(endpoint.name))
+            endpoint.retry.append((sequence, form))
+
+    def _delivered(self, endpoint, sequence):
+        """Record a delivered form and drop the queued forms older than it."""
+        with self.lock:
+            endpoint.delivered = max(endpoint.delivered, sequence)
+            while endpoint.retry and endpoint.retry[0][0] < endpoint.delivered:
+                endpoint.retry.popleft()
+                endpoint.stale += 1
+
+    def send(self, name, form):
+        """Forward one form to an endpoint; on failure it is queued for a retry."""
+        endpoint = self.endpoints[name]
+        with endpoint.lock:
+            endpoint.sequence += 1
+            sequence = endpoint.sequence
+            if self._request(endpoint, form):
+                self._delivered(endpoint, sequence)
+                endpoint.sent += 1
+                logging.info("POST forwarded successfully to {}".format(endpoint.name))
+                return True
+        endpoint.failed += 1
+        logging.warning("Forwarding to {} failed: {}".format(endpoint.name, endpoint.last_error))
+        self._queue_retry(endpoint, sequence, form)
+        return False
+
+    def retry_pending(self):
+        """Retry queued forms per endpoint, oldest first, until one fails again."""
+        for endpoint in self.endpoints.values():
+            while not self.stopping.is_set():
+                with self.lock:
+                    if not endpoint.retry:
+                        break
+                    sequence, form = endpoint.retry[0]
+                with endpoint.lock:
+                    # A newer form may have been delivered meanwhile, which dropped this one
+                    if sequence <= endpoint.delivered:
+                        self._delivered(endpoint, sequence + 1)
+                        continue
+                    if not self._request(endpoint, form):
+                        break
+                    with self.lock:
+                        if endpoint.retry and endpoint.retry[0][0] == sequence:
+                            endpoint.retry.popleft()
+                    self._delivered(endpoint, sequence)
+                endpoint.sent += 1
+                endpoint.retried += 1
+
+    def _loop(self):
+        while not self.stopping.wait(self.retry_interval):
+            try:
+                self.retry_pending()
+            except Exception as e:
+                logging.error("Forward retry failed: {}".format(e), exc_info=True)
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.stopping.clear()
+            self.thread = threading.Thread(target=self._loop, name="forward-retry", daemon=True)
+            self.thread.start()
+
+    def close(self):
+        """Stop retrying and close the session. Forms still queued for a retry are logged and discarded."""
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join(self.timeout * 2 + 1)
+            self.thread = None
+        for endpoint in self.endpoints.values():
+            if endpoint.retry:
+                logging.warning("Discarding {} unsent forms for '{}'.".format(len(endpoint.retry), endpoint.name))
+        self.session.close()
+
+    def stats(self):
+        return {name: endpoint.stats() for name, endpoint in self.endpoints.items()}
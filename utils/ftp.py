@@ -1,27 +1,316 @@
 import os
+import gzip
+import json
+import time
 import ftplib
+import shutil
+import hashlib
 import logging
-from datetime import datetime
-from globals import FTP_HOST, FTP_USER, FTP_PASS, DATA_PATH
+import threading
+from utils.atomic import atomic_open
+from globals import FTP_HOST, FTP_USER, FTP_PASS, FTP_COMPRESS, DATA_PATH
 
-def upload_to_ftp(filename, remote_path):
-    """Upload a file to an FTP server."""
-    ftp = None
-    try:
-        ftp = ftplib.FTP(FTP_HOST, FTP_USER, FTP_PASS)
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Files that get compressed companions (<name>.gz / <name>.br) when FTP_COMPRESS is set
+COMPRESS_EXTENSIONS = ('.json', '.db')
+
+# Re-upload unchanged files after this many seconds anyway, in case the remote copy got lost
+MANIFEST_MAX_AGE = 24 * 3600
+
+def file_digest(path):
+    """Return the SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class UploadManifest:
+    """
+    Remembers size, mtime and content hash of every uploaded file, so unchanged files
+    can be skipped. The cheap size/mtime check runs first; the hash is only computed
+    when those differ, which catches files that were rewritten with identical content.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = None
+
+    def _load(self):
+        if self.entries is None:
+            try:
+                with open(self.path, 'r') as f:
+                    self.entries = json.load(f)
+            except Exception:
+                self.entries = {}
+        return self.entries
+
+    def is_unchanged(self, local_path, remote_path):
+        """Return (unchanged, stat, digest); digest is None when it wasn't needed."""
+        entry = self._load().get(remote_path)
+        stat = os.stat(local_path)
+        if entry is None or time.time() - entry.get("uploaded", 0) > MANIFEST_MAX_AGE:
+            return False, stat, None
+        if entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            return True, stat, None
+        if entry["size"] != stat.st_size:
+            return False, stat, None
+        digest = file_digest(local_path)
+        if digest == entry["sha256"]:
+            # Same content, remember the new mtime so the hash isn't needed next time
+            entry["mtime"] = stat.st_mtime
+            return True, stat, digest
+        return False, stat, digest
+
+    def update(self, local_path, remote_path, stat, digest=None):
+        self._load()[remote_path] = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": digest or file_digest(local_path),
+            "uploaded": time.time(),
+        }
+
+    def save(self):
+        if self.entries is None:
+            return
+        try:
+            # Saved after every upload; losing it only means uploading some files again, so no fsync
+            with atomic_open(self.path, 'w', fsync=False) as f:
+                json.dump(self.entries, f, indent=4)
+        except Exception as e:
+            logging.error("Failed to write upload manifest: {}".format(e))
+
+def write_companions(local_path, encodings):
+    """Write compressed copies of a file next to it, returns [(companion_path, suffix), ...]."""
+    companions = []
+    source_mtime = os.path.getmtime(local_path)
+
+    def is_current(companion):
+        return os.path.exists(companion) and os.path.getmtime(companion) > source_mtime
+
+    for encoding in encodings:
+        if encoding == 'gzip':
+            companion = local_path + '.gz'
+            if is_current(companion):
+                companions.append((companion, '.gz'))
+                continue
+            with open(local_path, 'rb') as source, atomic_open(companion, 'wb', fsync=False) as target:
+                # mtime=0 keeps the output stable, so identical input gives an identical (skippable) file
+                with gzip.GzipFile(filename='', mode='wb', fileobj=target, compresslevel=9, mtime=0) as compressed:
+                    shutil.copyfileobj(source, compressed)
+            companions.append((companion, '.gz'))
+        elif encoding == 'br':
+            if brotli is None:
+                logging.warning("Brotli companions requested but the brotli module is not installed.")
+                continue
+            companion = local_path + '.br'
+            if is_current(companion):
+                companions.append((companion, '.br'))
+                continue
+            with open(local_path, 'rb') as source, atomic_open(companion, 'wb', fsync=False) as target:
+                target.write(brotli.compress(source.read()))
+            companions.append((companion, '.br'))
+    return companions
+
+class FTPSession:
+    """
+    Long-lived FTP control connection shared by all uploads.
+
+    The connection is opened lazily, kept alive with NOOP while idle and transparently
+    re-established when the server dropped it. Batches are uploaded to temporary names
+    first and only renamed into place once every file of the batch arrived.
+    """
+
+    def __init__(self, host, user, password, keepalive=60, timeout=30, manifest=None):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.manifest = manifest
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self.ftp = None
+        self.lock = threading.Lock()
+        self.last_used = 0
+        self.keepalive_thread = None
+        self.connects = 0
+        self.skipped = 0
+        self.stats = {}
+
+    def _connect(self):
+        self.ftp = ftplib.FTP(self.host, self.user, self.password, timeout=self.timeout)
+        self.connects += 1
+        self.last_used = time.monotonic()
+        logging.info("FTP session opened to {}".format(self.host))
 
+        if self.keepalive_thread is None:
+            self.keepalive_thread = threading.Thread(target=self._keepalive_loop, name="ftp-keepalive", daemon=True)
+            self.keepalive_thread.start()
+
+    def _disconnect(self):
+        if self.ftp:
+            try:
+                self.ftp.quit()
+            except Exception:
+                self.ftp.close()
+            self.ftp = None
+
+    def _ensure_connected(self):
+        """Return a working connection, reconnecting if the current one went stale."""
+        if self.ftp is None:
+            self._connect()
+        elif time.monotonic() - self.last_used >= self.keepalive:
+            try:
+                self.ftp.voidcmd('NOOP')
+            except ftplib.all_errors as e:
+                logging.info("FTP session went stale ({}), reconnecting...".format(e))
+                self._disconnect()
+                self._connect()
+        return self.ftp
+
+    def _keepalive_loop(self):
+        while True:
+            time.sleep(self.keepalive)
+            with self.lock:
+                if self.ftp is None or time.monotonic() - self.last_used < self.keepalive:
+                    continue
+                try:
+                    self.ftp.voidcmd('NOOP')
+                    self.last_used = time.monotonic()
+                except ftplib.all_errors as e:
+                    logging.info("FTP keepalive failed ({}), session will reconnect on next upload.".format(e))
+                    self.ftp.close()
+                    self.ftp = None
+
+    def _record(self, remote_path, size, latency):
+        entry = self.stats.setdefault(remote_path, {"uploads": 0, "bytes": 0, "total_latency": 0.0, "last_latency": None, "last_bytes": None})
+        entry["uploads"] += 1
+        entry["bytes"] += size
+        entry["total_latency"] += latency
+        entry["last_latency"] = latency
+        entry["last_bytes"] = size
+
+    def _pending(self, files, force):
+        """Drop files the manifest knows are unchanged, returns [(local, remote, stat, digest), ...]."""
+        pending = []
+        for local_path, remote_path in files:
+            try:
+                if self.manifest is None:
+                    pending.append((local_path, remote_path, os.stat(local_path), None))
+                    continue
+                unchanged, stat, digest = self.manifest.is_unchanged(local_path, remote_path)
+            except FileNotFoundError:
+                logging.error("File not found: {}".format(local_path))
+                continue
+            if unchanged and not force:
+                self.skipped += 1
+                logging.info("Skipped {}, unchanged since last upload.".format(local_path.split('/')[-1]))
+                continue
+            pending.append((local_path, remote_path, stat, digest))
+        return pending
+
+    def _upload_batch(self, pending):
+        ftp = self._ensure_connected()
+
+        # Stage every file under a temporary name ...
+        staged = []
+        for local_path, remote_path, stat, digest in pending:
+            temp_path = remote_path + '.part'
+            try:
+                with open(local_path, 'rb') as file:
+                    size = os.fstat(file.fileno()).st_size
+                    started = time.monotonic()
+                    ftp.storbinary('STOR {}'.format(temp_path), file)
+            except FileNotFoundError:
+                logging.error("File not found: {}".format(local_path))
+                continue
+            latency = time.monotonic() - started
+            self._record(remote_path, size, latency)
+            staged.append((local_path, temp_path, remote_path, size, latency, stat, digest))
+
+        # ... then move them into place so readers never see a partial batch
+        for local_path, temp_path, remote_path, size, latency, stat, digest in staged:
+            try:
+                ftp.rename(temp_path, remote_path)
+            except ftplib.error_perm:
+                # Some servers refuse to rename over an existing file
+                try:
+                    ftp.delete(remote_path)
+                except ftplib.error_perm:
+                    pass
+                ftp.rename(temp_path, remote_path)
+            if self.manifest is not None:
+                self.manifest.update(local_path, remote_path, stat, digest)
+            logging.info("Uploaded {} successfully ({} bytes in {:.2f}s)...".format(local_path.split('/')[-1], size, latency))
+
+        self.last_used = time.monotonic()
+        return len(staged)
+
+    def upload_batch(self, files, force=False):
+        """Upload [(local_path, remote_path), ...] over one control connection, retrying once on a dropped session."""
+        files = [(local_path, remote_path.lstrip('/')) for local_path, remote_path in files]  # Zorgt ervoor dat er geen voorloop slashes zijn
+        with self.lock:
+            pending = self._pending(files, force)
+            if not pending:
+                return 0
+            try:
+                for attempt in (1, 2):
+                    try:
+                        return self._upload_batch(pending)
+                    except ftplib.error_perm as e:
+                        # Permissions or paths, reconnecting will not help
+                        logging.error("FTP operation failed with error: {}".format(e))
+                        return 0
+                    except ftplib.all_errors as e:
+                        self._drop()
+                        if attempt == 2:
+                            logging.error("FTP operation failed with error: {}".format(e))
+                            return 0
+                        logging.info("FTP upload failed ({}), retrying on a new session...".format(e))
+                    except Exception as e:
+                        logging.error("An unexpected error occurred: {}".format(e))
+                        self._drop()
+                        return 0
+            finally:
+                if self.manifest is not None:
+                    self.manifest.save()
+
+    def _drop(self):
+        if self.ftp:
+            self.ftp.close()
+            self.ftp = None
+
+    def close(self):
+        with self.lock:
+            self._disconnect()
+
+    def get_stats(self):
+        with self.lock:
+            return {"connects": self.connects, "connected": self.ftp is not None, "skipped": self.skipped, "files": {k: dict(v) for k, v in self.stats.items()}}
+
+FTP_SESSION = FTPSession(FTP_HOST, FTP_USER, FTP_PASS, manifest=UploadManifest(DATA_PATH + "/upload_manifest.json"))
+
+def upload_batch_to_ftp(files, force=False, compress=FTP_COMPRESS):
+    """
+    Upload a batch of (filename, remote_path) pairs to the FTP server over the shared session.
+    Unchanged files are skipped, and compressible files get <remote>.gz/.br companions
+    for every encoding in compress.
+    """
+    batch = []
+    for filename, remote_path in files:
         local_path = os.path.join(DATA_PATH, filename)
-        remote_path = remote_path.lstrip('/')  # Zorgt ervoor dat er geen voorloop slashes zijn
-
-        with open(local_path, 'rb') as file:
-            ftp.storbinary('STOR {}'.format(remote_path), file)  # Upload naar de FTP
-            logging.info("Uploaded {} successfully...".format(filename.split('/')[-1]))
-    except ftplib.all_errors as e:
-        logging.error("FTP operation failed with error: {}".format(e))
-    except FileNotFoundError:
-        logging.error("File not found: {}".format(local_path))
-    except Exception as e:
-        logging.error("An unexpected error occurred: {}".format(e))
-    finally:
-        if ftp:
-            ftp.quit()
\ No newline at end of file
+        batch.append((local_path, remote_path))
+        if compress and local_path.endswith(COMPRESS_EXTENSIONS) and os.path.exists(local_path):
+            try:
+                for companion, suffix in write_companions(local_path, compress):
+                    batch.append((companion, remote_path + suffix))
+            except Exception as e:
+                logging.error("Failed to compress {}: {}".format(local_path, e))
+    return FTP_SESSION.upload_batch(batch, force=force)
+
+def upload_to_ftp(filename, remote_path, force=False):
+    """Upload a file to an FTP server."""
+    return upload_batch_to_ftp([(filename, remote_path)], force=force)
\ No newline at end of file
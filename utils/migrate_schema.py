@@ -0,0 +1,50 @@
+import sqlite3
+import logging
+import argparse
+from utils.ssh_tunnel import get_ssh_tunnel
+from database import migrate_sqlite_schema, migrate_mysql_schema
+from importer import connect_mysql, migrate_archive_schema
+from globals import DATA_PATH
+
+def migrate_sqlite(path, chunk_size):
+    """Migrate a SQLite database file in place."""
+    connection = sqlite3.connect(path, isolation_level=None)
+    try:
+        connection.execute("PRAGMA journal_mode=WAL")
+        if not migrate_sqlite_schema(connection, chunk_size):
+            print("{} is already up to date.".format(path))
+    finally:
+        connection.close()
+
+def migrate_mysql(chunk_size, observations=True, archive=False):
+    """Migrate the MySQL weather_observations and/or weather_archive table over the SSH tunnel."""
+    ssh = get_ssh_tunnel()
+    conn = connect_mysql(ssh)
+    try:
+        if observations and not migrate_mysql_schema(conn, chunk_size):
+            print("MySQL weather_observations is already up to date.")
+        if archive and not migrate_archive_schema(conn, chunk_size):
+            print("MySQL weather_archive is already up to date.")
+    finally:
+        conn.close()
+        ssh.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate the weather tables to their time-indexed schemas.")
+    parser.add_argument('--sqlite', nargs='?', const=DATA_PATH + '/weather_data.db', help='Path to the SQLite database (default: data/weather_data.db)')
+    parser.add_argument('--mysql', action='store_true', help='Migrate the MySQL weather_observations table as well')
+    parser.add_argument('--archive', action='store_true', help='Migrate the MySQL weather_archive table to a timestamp key')
+    parser.add_argument('--chunk-size', type=int, default=10000, help='Rows copied per transaction')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if not args.sqlite and not args.mysql and not args.archive:
+        parser.error("nothing to do, pass --sqlite, --mysql and/or --archive")
+    if args.sqlite:
+        migrate_sqlite(args.sqlite, args.chunk_size)
+    if args.mysql or args.archive:
+        migrate_mysql(args.chunk_size, observations=args.mysql, archive=args.archive)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import os
+import json
+import logging
+import calendar
+import threading
+
+from utils.raw_reader import parse_timestamp
+from utils.atomic import atomic_open
+
+def day_epoch(day):
+    """UTC epoch of midnight for a 'YYYY-MM-DD' day."""
+    return calendar.timegm((int(day[0:4]), int(day[5:7]), int(day[8:10]), 0, 0, 0))
+
+def index_day_file(path, day, entry=None):
+    """
+    Build (or extend) the index entry of a raw day file: first/last timestamp, row count
+    and the byte offset of the first line of every hour. With an existing entry only the
+    bytes appended since it was built are read. Only complete lines are indexed.
+    """
+    if entry is None:
+        entry = {"indexed": 0, "rows": 0, "first": None, "last": None, "sorted": True, "hours": [None] * 24}
+    midnight = day_epoch(day)
+
+    with open(path, 'rb') as file:
+        file.seek(entry["indexed"])
+        data = file.read()
+
+    position = entry["indexed"]
+    hours = entry["hours"]
+    next_hour = next((h for h in range(24) if hours[h] is None), 24)
+    end = data.rfind(b'\n') + 1
+    for line in data[:end].split(b'\n')[:-1]:
+        offset = position
+        position += len(line) + 1
+        try:
+            timestamp = parse_timestamp(line[:19].decode('ascii'))
+        except (ValueError, UnicodeDecodeError):
+            continue
+
+        last = entry["last"]
+        if entry["first"] is None:
+            entry["first"] = timestamp
+        if last is not None and timestamp < last:
+            entry["sorted"] = False
+        entry["last"] = timestamp if last is None else max(last, timestamp)
+        entry["rows"] += 1
+
+        if not midnight <= timestamp < midnight + 86400:
+            entry["sorted"] = False
+            continue
+        hour = (timestamp - midnight) // 3600
+        while next_hour <= hour:
+            hours[next_hour] = offset
+            next_hour += 1
+
+    entry["indexed"] = position
+    return entry
+
+class RawIndex:
+    """
+    Persistent index of the raw day files, stored as JSON. Entries are keyed by day and
+    validated against the file size on every lookup: a file that grew is indexed
+    incrementally from where the previous pass stopped, one that shrank is rebuilt.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = None
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def _load(self):
+        if self.entries is None:
+            try:
+                with open(self.path, 'r') as f:
+                    self.entries = json.load(f)
+            except FileNotFoundError:
+                self.entries = {}
+            except Exception as e:
+                logging.warning("Raw index {} is unreadable ({}), rebuilding it.".format(self.path, e))
+                self.entries = {}
+        return self.entries
+
+    def entry(self, day, path):
+        """Return the up-to-date index entry of a day file, or None if it doesn't exist."""
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return None
+        with self.lock:
+            entries = self._load()
+            entry = entries.get(day)
+            if entry is not None and entry["indexed"] == size:
+                return entry
+            if entry is not None and entry["indexed"] > size:
+                entry = None
+            entry = entries[day] = index_day_file(path, day, entry)
+            self.dirty = True
+            return entry
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            try:
+                with atomic_open(self.path, 'w') as f:
+                    json.dump(self.entries, f)
+                self.dirty = False
+            except Exception as e:
+                logging.error("Failed to write raw index: {}".format(e))
@@ -0,0 +1,174 @@
+import math
+import calendar
+from array import array
+
+# Columns of a pywws-style raw day file after the timestamp; 12-column rows stop before illuminance
+RAW_FIELDS = (
+    'delay', 'hum_in', 'temp_in', 'hum_out', 'temp_out', 'abs_pressure',
+    'wind_ave', 'wind_gust', 'wind_dir', 'rain', 'status', 'illuminance', 'uv',
+)
+
+NAN = math.nan
+
+class _DateCache(dict):
+    """'YYYY-MM-DD ' -> UTC epoch of that midnight, validated on first use."""
+
+    def __missing__(self, key):
+        if len(key) != 11 or key[4] != '-' or key[7] != '-' or key[10] != ' ':
+            raise ValueError("Invalid date: " + key)
+        epoch = self[key] = calendar.timegm((int(key[0:4]), int(key[5:7]), int(key[8:10]), 0, 0, 0))
+        return epoch
+
+class _TimeCache(dict):
+    """'HH:MM:SS' plus the trailing separator -> seconds since midnight, validated on first use."""
+
+    def __missing__(self, key):
+        if len(key) != 9 or key[2] != ':' or key[5] != ':' or key[8] != ',':
+            raise ValueError("Invalid time: " + key)
+        seconds = self[key] = int(key[0:2]) * 3600 + int(key[3:5]) * 60 + int(key[6:8])
+        return seconds
+
+# Shared by every file a process reads; a day has at most 86400 distinct times
+_DATES = _DateCache()
+_TIMES = _TimeCache()
+
+def parse_timestamp(value):
+    """Parse 'YYYY-MM-DD HH:MM:SS' (UTC) to epoch seconds without strptime."""
+    return _DATES[value[:11]] + _TIMES[value[11:] + ',']
+
+def _float_column(values, bad_rows):
+    """
+    Convert a column of strings to array('d') in one C-level pass, '' becomes NaN.
+    Values that don't parse become NaN too and mark their row in bad_rows.
+    """
+    try:
+        return array('d', map(float, values))
+    except ValueError:
+        pass
+    try:
+        return array('d', map(float, ['nan' if not value else value for value in values]))
+    except ValueError:
+        pass
+    column = array('d')
+    append = column.append
+    for i, value in enumerate(values):
+        try:
+            append(float(value) if value else NAN)
+        except ValueError:
+            append(NAN)
+            bad_rows.add(i)
+    return column
+
+def _timestamps(idx, bad_rows):
+    try:
+        return array('q', map(parse_timestamp, idx))
+    except ValueError:
+        pass
+    timestamps = array('q')
+    for i, value in enumerate(idx):
+        try:
+            timestamps.append(parse_timestamp(value))
+        except ValueError:
+            timestamps.append(0)
+            bad_rows.add(i)
+    return timestamps
+
+def _split_uniform(lines, fields, bad_rows):
+    """
+    Fast path for files whose lines all have the same width: split the whole file in
+    one go and convert only the requested columns, sliced out of the flat value list.
+    Returns None when the lines differ in width or the timestamp isn't 19 characters.
+    """
+    widths = {line.count(',') for line in lines}
+    if len(widths) != 1 or not all(line.find(',') == 19 for line in lines):
+        return None
+    width = widths.pop()
+    if width not in (11, 13):
+        return None
+
+    try:
+        timestamps = array('q', [_DATES[line[:11]] + _TIMES[line[11:20]] for line in lines])
+    except ValueError:
+        timestamps = _timestamps([line[:19] for line in lines], bad_rows)
+
+    flat = ','.join([line[20:] for line in lines]).split(',')
+    columns = {}
+    for name in fields:
+        i = RAW_FIELDS.index(name)
+        if i < width:
+            columns[name] = _float_column(flat[i::width], bad_rows)
+        else:
+            columns[name] = array('d', [NAN]) * len(lines)
+    return [line[:19] for line in lines], timestamps, columns, 0, lines
+
+def _split_rows(lines, fields, bad_rows):
+    """Row by row fallback for files that mix 12- and 14-column lines."""
+    rows = [line.split(',') for line in lines]
+    rows = [row if len(row) == 14 else row + ['', ''] for row in rows if len(row) in (12, 14)]
+    skipped = len(lines) - len(rows)
+    transposed = list(zip(*rows)) if rows else [()] * 14
+    timestamps = _timestamps(transposed[0], bad_rows)
+    columns = {name: _float_column(transposed[RAW_FIELDS.index(name) + 1], bad_rows) for name in fields}
+    return transposed[0], timestamps, columns, skipped, [','.join(row) for row in rows]
+
+def parse_day_text(text, since=None, keep_idx=False, fields=RAW_FIELDS):
+    """
+    Parse the text of a raw day file into columns in one pass.
+
+    Returns a dict with 'timestamp' (array('q') of UTC epoch seconds), one array('d')
+    per requested field (NaN for missing values and for illuminance/uv on 12-column
+    rows), and with keep_idx the original timestamp strings as 'idx'. Only the fields
+    asked for are converted, so a scan over one metric skips most of the work.
+    Comment lines and rows that are not 12 or 14 columns wide are skipped; 'skipped'
+    and 'errors' count them and 'error_samples' holds up to five unparsable lines.
+    With since (epoch seconds), only rows after it are kept.
+    """
+    unknown = set(fields) - set(RAW_FIELDS)
+    if unknown:
+        raise ValueError("Unknown raw fields: {}".format(", ".join(sorted(unknown))))
+
+    lines = [line for line in text.splitlines() if line and line[0] != '#']
+    bad_rows = set()
+
+    split = _split_uniform(lines, fields, bad_rows) if lines else None
+    if split is None:
+        split = _split_rows(lines, fields, bad_rows)
+    idx, timestamps, columns, skipped, samples = split
+
+    result = {'timestamp': timestamps}
+    result.update(columns)
+    if keep_idx:
+        result['idx'] = idx
+
+    error_samples = [samples[i] for i in sorted(bad_rows)[:5]]
+
+    keep = None
+    if bad_rows:
+        keep = [i for i in range(len(timestamps)) if i not in bad_rows]
+    if since is not None and len(timestamps) and timestamps[0] <= since:
+        keep = [i for i in (keep if keep is not None else range(len(timestamps))) if timestamps[i] > since]
+    if keep is not None:
+        for name, column in result.items():
+            if isinstance(column, array):
+                result[name] = array(column.typecode, [column[i] for i in keep])
+            else:
+                result[name] = [column[i] for i in keep]
+
+    result['skipped'] = skipped
+    result['errors'] = len(bad_rows)
+    result['error_samples'] = error_samples
+    return result
+
+def read_day_file(path, since=None, keep_idx=False, fields=RAW_FIELDS):
+    """Read a raw day file into column arrays, see parse_day_text."""
+    with open(path, 'r') as file:
+        return parse_day_text(file.read(), since, keep_idx, fields)
+
+def has_nan(column):
+    """True if a float column holds a missing value; the C-level sum is NaN exactly then (or for inf - inf)."""
+    total = sum(column)
+    return total != total
+
+def value_or_none(value):
+    """NaN -> None, for writing columns to a database."""
+    return None if value != value else value
@@ -0,0 +1,199 @@
+import json
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from utils.serializer import Serializer
+from utils.atomic import atomic_write, move_aside
+
+KEY_FORMAT = "%m/%d/%Y %H:%M"
+
+def parse_key(timestamp_str):
+    """Parse a 'MM/DD/YYYY HH:MM' record key without going through strptime."""
+    try:
+        return datetime(int(timestamp_str[6:10]), int(timestamp_str[0:2]), int(timestamp_str[3:5]),
+                        int(timestamp_str[11:13]), int(timestamp_str[14:16]))
+    except (ValueError, IndexError):
+        return datetime.strptime(timestamp_str, KEY_FORMAT)
+
+# Every distinct field layout is stored once and shared by all records that use it
+_LAYOUTS = {}
+
+# Weather values repeat a lot (0.0 rain, "WSW", a few hundred temperatures), so records share
+# one object per distinct value. Keyed on the type too, so 1 and 1.0 stay distinct in the JSON.
+_VALUES = {}
+_MAX_VALUES = 100000
+
+def intern_fields(fields):
+    fields = tuple(fields)
+    return _LAYOUTS.setdefault(fields, fields)
+
+def _intern_value(value):
+    try:
+        return _VALUES[(value.__class__, value)]
+    except KeyError:
+        if len(_VALUES) < _MAX_VALUES:
+            _VALUES[(value.__class__, value)] = value
+        return value
+    except TypeError:
+        return value
+
+class WindowRecord:
+    """
+    One {timestamp_str: {field: value}} entry of a rolling window, stored as a shared
+    field-name tuple plus a tuple of values. A few times smaller than the nested dicts,
+    and the same record object can sit in several windows at once.
+    """
+
+    __slots__ = ('time', 'key', 'fields', 'values', 'encoded')
+
+    def __init__(self, key, fields, values, time=None):
+        self.key = key
+        self.encoded = None  # Compact JSON fragment, filled in by Serializer.record
+        self.fields = intern_fields(fields)
+        self.values = tuple(map(_intern_value, values))
+        self.time = time if time is not None else parse_key(key)
+
+    @classmethod
+    def from_dict(cls, record):
+        """Build records from a {timestamp_str: values} dict (normally exactly one entry)."""
+        return [cls(key, values.keys(), values.values()) for key, values in record.items()]
+
+    def __getstate__(self):
+        # Pickled without the encoded fragment, which is cheap to rebuild and would double the size
+        return self.key, self.time, self.fields, self.values
+
+    def __setstate__(self, state):
+        self.key, self.time, fields, values = state
+        self.fields = intern_fields(fields)
+        self.values = tuple(map(_intern_value, values))
+        self.encoded = None
+
+    def items(self):
+        return zip(self.fields, self.values)
+
+    def to_dict(self):
+        return {self.key: dict(zip(self.fields, self.values))}
+
+class RollingWindow:
+    """
+    Time-ordered, in-memory copy of one of the rolling JSON files (24h.json, 1w.json, ...).
+
+    The file is read once; after that records are appended at the tail and evicted from
+    the head by timestamp, so an update costs O(evicted + 1). Timestamps are naive local
+    times, the same clock used to format the record keys.
+    """
+
+    def __init__(self, path, span, serializer=None):
+        self.path = path
+        self.span = span
+        self.serializer = serializer or Serializer()
+        self.records = deque()  # WindowRecord, oldest first
+        self.loaded = False
+        self.dirty = False
+        self.version = 0  # Bumped on every change, for caches built from the window
+        self.lock = threading.RLock()
+
+    def load(self):
+        """Read the existing file into memory, once."""
+        with self.lock:
+            if self.loaded:
+                return
+            self.loaded = True
+            try:
+                with open(self.path, 'r') as f:
+                    existing_data = json.load(f).get("data", [])
+            except FileNotFoundError:
+                existing_data = []
+            except ValueError as e:
+                # Keep the unreadable file for inspection rather than overwriting it with the next save
+                move_aside(self.path, e)
+                existing_data = []
+
+            records = []
+            for record in existing_data:
+                for timestamp_str, values in record.items():
+                    try:
+                        records.append(WindowRecord(timestamp_str, values.keys(), values.values()))
+                    except ValueError:
+                        logging.warning("Skipping record with bad timestamp: {}".format(timestamp_str))
+            records.sort(key=lambda item: item.time)
+            self.records = deque(records)
+            self.version += 1
+
+    def export_state(self):
+        """The records, for a state snapshot."""
+        with self.lock:
+            self.load()
+            return list(self.records)
+
+    def restore_state(self, records):
+        """Take over records from a state snapshot instead of reading the file."""
+        with self.lock:
+            self.records = deque(records)
+            self.loaded = True
+            self.dirty = False
+            self.version += 1
+
+    def evict(self, now):
+        """Drop records that are not newer than now - span. Returns the number evicted."""
+        with self.lock:
+            self.load()
+            cutoff = now - self.span
+            evicted = 0
+            while self.records and self.records[0].time <= cutoff:
+                self.records.popleft()
+                evicted += 1
+            if evicted:
+                self.dirty = True
+                self.version += 1
+            return evicted
+
+    def append(self, record, now):
+        """
+        Evict expired records and add a WindowRecord (or a {timestamp_str: values} dict) at
+        the tail. A record with the same time as one already in the window replaces it, so
+        appending an observation again (a retried publish) doesn't duplicate it. Returns the
+        number of records added.
+        """
+        with self.lock:
+            self.evict(now)
+            added = 0
+            for item in ([record] if isinstance(record, WindowRecord) else WindowRecord.from_dict(record)):
+                # Newest record at or before item, searched from the tail where it almost always is
+                position = next((i for i in range(len(self.records) - 1, -1, -1) if self.records[i].time <= item.time), None)
+                if position is not None and self.records[position].time == item.time:
+                    self.records[position] = item
+                    continue
+                added += 1
+                if self.records and item.time < self.records[-1].time:
+                    # Out of order, keep the deque sorted (rare, e.g. after a clock change)
+                    self.records.append(item)
+                    self.records = deque(sorted(self.records, key=lambda entry: entry.time))
+                else:
+                    self.records.append(item)
+            self.dirty = True
+            self.version += 1
+            return added
+
+    def snapshot(self):
+        """The current records, oldest first."""
+        with self.lock:
+            self.load()
+            return list(self.records)
+
+    def data(self):
+        """The records as a list of {timestamp_str: values} dicts."""
+        return [record.to_dict() for record in self.snapshot()]
+
+    def save(self, force=False):
+        """
+        Write the window to disk if it changed since the last write. Records that were
+        written before are not encoded again, see Serializer.window.
+        """
+        with self.lock:
+            if not self.dirty and not force:
+                return False
+            atomic_write(self.path, self.serializer.window(self.records))
+            self.dirty = False
+            return True
@@ -0,0 +1,200 @@
+import json
+import time
+import random
+import logging
+import threading
+from utils.atomic import atomic_open
+
+# Upper bounds (seconds) of the run duration histogram buckets, the last bucket catches the rest
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+
+class Job:
+    """A periodic job with its own schedule, run counters and a duration histogram."""
+
+    def __init__(self, name, func, interval, jitter):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.next_run = None
+        self.last_run = None
+        self.thread = None
+        self.runs = 0
+        self.failed = 0
+        self.skipped = 0
+        self.last_duration = None
+        self.max_duration = 0.0
+        self.total_duration = 0.0
+        self.histogram = [0] * (len(DURATION_BUCKETS) + 1)
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def schedule(self, after):
+        """Plan the next run one interval after `after`, pushed back by a random jitter."""
+        self.next_run = after + self.interval + random.uniform(0, self.jitter)
+
+    def record(self, duration):
+        self.runs += 1
+        self.last_duration = duration
+        self.max_duration = max(self.max_duration, duration)
+        self.total_duration += duration
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if duration <= bound:
+                self.histogram[i] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def stats(self):
+        labels = ["<={}s".format(bound) for bound in DURATION_BUCKETS] + [">{}s".format(DURATION_BUCKETS[-1])]
+        return {
+            "interval": self.interval,
+            "running": self.running,
+            "runs": self.runs,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "last_run": self.last_run,
+            "next_run": self.next_run,
+            "last_duration": self.last_duration,
+            "max_duration": self.max_duration,
+            "avg_duration": self.total_duration / self.runs if self.runs else None,
+            "histogram": dict(zip(labels, self.histogram)),
+        }
+
+class Scheduler:
+    """
+    Runs periodic jobs on a background thread, independent of incoming requests.
+
+    Every run gets a random delay of up to `jitter` seconds so jobs with related intervals
+    don't line up. A job never overlaps itself: when it is still running at its next due
+    time that run is skipped and counted. The last run of every job is kept in state_path,
+    so after a restart jobs continue their cadence instead of all firing at once. The file
+    is saved after every run of a job with an interval of save_interval or more, otherwise
+    at most every save_interval seconds, and on stop().
+    """
+
+    def __init__(self, state_path, jitter=0, save_interval=300):
+        self.state_path = state_path
+        self.jitter = jitter
+        self.save_interval = save_interval
+        self.last_save = 0
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.state_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.thread = None
+
+    def add(self, name, func, interval, jitter=None):
+        """Register func() to run every interval seconds. Jitter is capped at a quarter of the interval."""
+        if name in self.jobs:
+            raise ValueError("Job already registered: " + name)
+        jitter = self.jitter if jitter is None else jitter
+        job = Job(name, func, interval, min(jitter, interval / 4))
+        self.jobs[name] = job
+        return job
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logging.warning("Could not read scheduler state {}: {}".format(self.state_path, e))
+            return {}
+
+    def _save_state(self):
+        # Not fsynced: a lost state only makes jobs run once more shortly after the next start
+        self.last_save = time.monotonic()
+        with self.lock:
+            state = {name: {"last_run": job.last_run} for name, job in self.jobs.items() if job.last_run is not None}
+        with self.state_lock:
+            try:
+                with atomic_open(self.state_path, 'w', fsync=False) as f:
+                    json.dump(state, f)
+            except Exception as e:
+                logging.error("Could not save scheduler state {}: {}".format(self.state_path, e))
+
+    def start(self):
+        with self.lock:
+            if self.thread is not None:
+                return
+            state = self._load_state()
+            now = time.time()
+            for name, job in self.jobs.items():
+                last_run = state.get(name, {}).get("last_run")
+                if last_run is not None and last_run <= now:
+                    job.last_run = last_run
+                    job.schedule(last_run)
+                else:
+                    # Never ran: run shortly after startup, spread out by the jitter
+                    job.next_run = now + random.uniform(0, job.jitter)
+                # Overdue jobs run soon, but not all in the same instant
+                if job.next_run < now:
+                    job.next_run = now + random.uniform(0, job.jitter)
+            self.stopping = False
+            self.thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+            self.thread.start()
+        logging.info("Scheduler started with jobs: {}".format(", ".join(self.jobs)))
+
+    def _loop(self):
+        while not self.stopping:
+            self.wakeup.clear()
+            now = time.time()
+            with self.lock:
+                for job in self.jobs.values():
+                    if job.next_run <= now:
+                        if job.running:
+                            job.skipped += 1
+                            logging.warning("Job '{}' still running, skipping this run.".format(job.name))
+                        else:
+                            job.thread = threading.Thread(target=self._run, args=(job,), name="job-" + job.name, daemon=True)
+                            job.thread.start()
+                        job.schedule(now)
+                next_run = min(job.next_run for job in self.jobs.values()) if self.jobs else now + 60
+            self.wakeup.wait(max(0, next_run - time.time()))
+
+    def _run(self, job):
+        started = time.time()
+        job.last_run = started
+        begin = time.monotonic()
+        try:
+            job.func()
+        except Exception as e:
+            job.failed += 1
+            logging.error("Job '{}' failed: {}".format(job.name, e), exc_info=True)
+        job.record(time.monotonic() - begin)
+        # Runs of long-interval jobs are saved right away, frequent ones at most every save_interval
+        if job.interval >= self.save_interval or time.monotonic() - self.last_save >= self.save_interval:
+            self._save_state()
+
+    def run_now(self, name):
+        """Make a job due immediately (it still won't overlap a running instance)."""
+        with self.lock:
+            self.jobs[name].next_run = time.time()
+        self.wakeup.set()
+
+    def stop(self, timeout=30):
+        """Stop scheduling new runs, wait for running jobs and save the state."""
+        with self.lock:
+            if self.thread is None:
+                return
+            self.stopping = True
+            thread, self.thread = self.thread, None
+        self.wakeup.set()
+        thread.join(timeout)
+
+        deadline = time.monotonic() + timeout
+        for job in self.jobs.values():
+            if job.running:
+                job.thread.join(max(0, deadline - time.monotonic()))
+                if job.running:
+                    logging.error("Job '{}' still running after stop timeout.".format(job.name))
+        self._save_state()
+        logging.info("Scheduler stopped.")
+
+    def stats(self):
+        return {name: job.stats() for name, job in self.jobs.items()}
@@ -0,0 +1,76 @@
+import json
+import logging
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+def _stdlib_compact(obj):
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def _ujson_compact(obj):
+    return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False).encode('utf-8')
+
+def _orjson_compact(obj):
+    return orjson.dumps(obj)
+
+ENCODERS = {
+    'orjson': (lambda: orjson is not None, _orjson_compact),
+    'ujson': (lambda: ujson is not None, _ujson_compact),
+    'json': (lambda: True, _stdlib_compact),
+}
+
+class Serializer:
+    """
+    Encodes the published JSON files. The compact layout (no indent, no spaces) uses the
+    fastest encoder available, orjson, then ujson, then the standard library. With an
+    indent the standard library is always used, giving the same files as before.
+
+    Rolling window records are encoded once: the compact fragment of every WindowRecord is
+    kept on the record, so writing a window only encodes the records added since the last
+    write and joins the rest.
+    """
+
+    def __init__(self, encoder='auto', indent=None):
+        self.indent = indent or None
+        if encoder == 'auto':
+            encoder = next(name for name, (available, _) in ENCODERS.items() if available())
+        elif encoder not in ENCODERS or not ENCODERS[encoder][0]():
+            logging.warning("JSON encoder '{}' not available, using the standard library.".format(encoder))
+            encoder = 'json'
+        self.encoder = encoder
+        self._compact = ENCODERS[encoder][1]
+
+    def dumps(self, obj):
+        """Encode obj in the configured layout, as UTF-8 bytes."""
+        if self.indent is None:
+            return self._compact(obj)
+        return json.dumps(obj, indent=self.indent, ensure_ascii=False).encode('utf-8')
+
+    def compact(self, obj):
+        """Encode obj compact, whatever the configured layout, for fragments that are joined later."""
+        return self._compact(obj)
+
+    def record(self, record):
+        """Compact {timestamp_str: values} fragment of a WindowRecord, encoded once per record."""
+        if record.encoded is None:
+            record.encoded = self._compact(record.to_dict())
+        return record.encoded
+
+    def window(self, records):
+        """Encode {"data": [records]} for a rolling window."""
+        if self.indent is None:
+            return b'{"data":[' + b','.join(map(self.record, records)) + b']}'
+        # Indented layout, the same bytes json.dump({"data": ...}, indent=N) writes
+        if not records:
+            return '{{\n{}"data": []\n}}'.format(' ' * self.indent).encode('utf-8')
+        outer, inner = ' ' * self.indent, ' ' * (self.indent * 2)
+        parts = [inner + json.dumps(record.to_dict(), indent=self.indent, ensure_ascii=False).replace('\n', '\n' + inner)
+                 for record in records]
+        return ('{\n' + outer + '"data": [\n' + ',\n'.join(parts) + '\n' + outer + ']\n}').encode('utf-8')
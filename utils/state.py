@@ -0,0 +1,164 @@
+import os
+import time
+import pickle
+import logging
+
+from utils.atomic import atomic_write
+
+# Bump when the layout of the snapshot changes; older snapshots are then ignored
+STATE_VERSION = 2
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+class StateManager:
+    """
+    Checkpoints the in-memory state (rolling windows, custom.json series, the 1y
+    aggregates and the latest observation) to one pickle file, and restores it at boot
+    instead of parsing every JSON file again. Records shared between windows are stored
+    once.
+
+    A checkpoint is only written when a window, custom.json, the aggregates or the latest
+    observation changed since the previous one, and without fsync: a snapshot lost in a
+    power cut only means the next boot reads the files instead.
+
+    Every part remembers the mtime its file had when it was captured. A part whose file
+    was written after the checkpoint, or a snapshot older than max_age, falls back to
+    reading the file; when that file is missing as well, rebuild(name) is called to
+    recreate it (e.g. from SQLite). The snapshot is only ever written by this process,
+    it is not meant to be loaded from untrusted sources.
+    """
+
+    def __init__(self, path, windows, custom, downsampler, downsampler_window="1y", max_age=86400, rebuild=None):
+        self.path = path
+        self.windows = windows
+        self.custom = custom
+        self.downsampler = downsampler
+        self.downsampler_window = downsampler_window
+        self.max_age = max_age
+        self.rebuild = rebuild
+        self.sources = {}  # Part name -> where it was restored from
+        self.last_checkpoint = None
+        self.last_size = None
+        self.last_versions = None  # _versions() at the last checkpoint (or a complete restore)
+        self.skipped = 0
+
+    def _versions(self, latest):
+        """Change counters of every part, equal as long as nothing needs checkpointing."""
+        return (tuple(window.version for window in self.windows.values()), self.custom.version,
+                self.downsampler.version, id(latest))
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                state = pickle.load(f)
+        except FileNotFoundError:
+            logging.info("No state snapshot at {}, loading from files.".format(self.path))
+            return None
+        except Exception as e:
+            logging.error("Could not read state snapshot {}: {}".format(self.path, e))
+            return None
+        if not isinstance(state, dict) or state.get("version") != STATE_VERSION:
+            logging.warning("State snapshot {} has an unknown version, ignoring it.".format(self.path))
+            return None
+        age = time.time() - state.get("created", 0)
+        if age > self.max_age:
+            logging.warning("State snapshot is {:.0f} s old (limit {} s), ignoring it.".format(age, self.max_age))
+            return None
+        return state
+
+    def _fallback(self, name, path, load):
+        """Read a part from its file, or rebuild it when there's no file."""
+        if os.path.exists(path) or self.rebuild is None:
+            load()
+            return "file"
+        try:
+            self.rebuild(name)
+            return "rebuilt"
+        except Exception as e:
+            logging.error("Could not rebuild {}: {}".format(name, e), exc_info=True)
+            load()
+            return "empty"
+
+    def restore(self):
+        """Bring every part into memory. Returns the latest observation from the snapshot, or None."""
+        started = time.monotonic()
+        state = self._load() or {}
+        saved_windows = state.get("windows", {})
+
+        for name, window in self.windows.items():
+            saved = saved_windows.get(name)
+            if saved is not None and saved["mtime"] == _mtime(window.path):
+                window.restore_state(saved["records"])
+                self.sources[name] = "snapshot"
+            else:
+                self.sources[name] = self._fallback(name, window.path, window.load)
+
+        saved = state.get("custom")
+        if saved is not None and saved["mtime"] == _mtime(self.custom.path):
+            self.custom.restore_state(saved["series"])
+            self.sources["custom"] = "snapshot"
+        else:
+            self.sources["custom"] = self._fallback("custom", self.custom.path, self.custom.load)
+
+        # The aggregates are only valid together with the 1y window they were built from
+        if state.get("downsampler") is not None and self.sources.get(self.downsampler_window) == "snapshot":
+            self.downsampler.restore_state(state["downsampler"])
+            self.sources["downsampler"] = "snapshot"
+        else:
+            self.downsampler.seed(self.windows[self.downsampler_window])
+            self.sources["downsampler"] = "seeded"
+
+        logging.info("State restored in {:.3f} s: {}".format(
+            time.monotonic() - started, ", ".join("{} from {}".format(name, source) for name, source in self.sources.items())))
+        latest = state.get("latest")
+        if all(source == "snapshot" for source in self.sources.values()):
+            # The snapshot on disk is exactly this state, no need to write it again until something changes
+            self.last_versions = self._versions(latest)
+        return latest
+
+    def checkpoint(self, latest=None):
+        """Write the current state to the snapshot file if it changed. Returns its size in bytes, or None when skipped."""
+        started = time.monotonic()
+        versions = self._versions(latest)
+        if versions == self.last_versions:
+            self.skipped += 1
+            return None
+        windows = {}
+        downsampler = None
+        # Counters of what is captured, taken under the same locks: exporting loads a part that
+        # wasn't read yet, and a change after the capture must make the next checkpoint write
+        window_versions = []
+        downsampler_version = self.downsampler.version
+        for name, window in self.windows.items():
+            with window.lock:
+                windows[name] = {"mtime": _mtime(window.path), "records": window.export_state()}
+                window_versions.append(window.version)
+                if name == self.downsampler_window:
+                    # Taken under the same lock, so the aggregates match the captured records
+                    downsampler_version = self.downsampler.version
+                    downsampler = self.downsampler.export_state()
+        with self.custom.lock:
+            custom = {"mtime": _mtime(self.custom.path), "series": self.custom.export_state()}
+            custom_version = self.custom.version
+        state = {
+            "version": STATE_VERSION,
+            "created": time.time(),
+            "windows": windows,
+            "custom": custom,
+            "downsampler": downsampler,
+            "latest": latest,
+        }
+        data = pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+        atomic_write(self.path, data, fsync=False)
+        self.last_versions = (tuple(window_versions), custom_version, downsampler_version, id(latest))
+        self.last_checkpoint = state["created"]
+        self.last_size = len(data)
+        logging.info("State checkpoint written ({} bytes in {:.3f} s).".format(len(data), time.monotonic() - started))
+        return len(data)
+
+    def stats(self):
+        return {"sources": self.sources, "last_checkpoint": self.last_checkpoint, "size": self.last_size, "skipped": self.skipped}